@@ -0,0 +1,94 @@
+"""merged.json の保存と読み込みを, dataclasses.asdict / from_json と生成した Codec で比べる
+
+架空の VTuberMergedData を作り, 次の3通りで保存と読み込みの時間を測る.
+保存したファイルが一致するかも確かめる.
+- asdict: `asdict` + `json.dumps(default=date_handler)`, `json.loads` + `from_json` (今までの方法)
+- codec: `VTUBER_MERGED_CODEC` で, パースは標準の json
+- codec+orjson: パースに orjson を使う (入っていれば)
+```bash
+python src/bench_codecs.py --n 20000 --repeat 3
+```
+"""
+
+import os
+import time
+import random
+import datetime
+import argparse
+from dataclasses import asdict
+
+from utils import codec
+from utils.file import iter_json_records, save_records
+from dataset_for_annotator.data_types.common import JST, MissingValue, date_handler
+from dataset_for_annotator.data_types.merged import (
+    VTUBER_MERGED_CODEC, TwitterData, YouTubeData, YouTubeVideoData, VTuberMergedData,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--n", type=int, default=20000, help="VTuberMergedData の件数")
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--out-dir", default="temp/bench_codecs")
+parser.add_argument("--jsonl", action="store_true", help="JSON Lines で保存する")
+args = parser.parse_args()
+
+def generate(n: int, seed: int = 0) -> list[VTuberMergedData]:
+    rand = random.Random(seed)
+    start = datetime.datetime(2018, 1, 1, tzinfo=JST)
+    datum = []
+    for i in range(n):
+        timestamp = start + datetime.timedelta(seconds=rand.randrange(10**8))
+        youtube = YouTubeData(
+            f"UC{i:022d}", f"テスト{i}", f"テスト{i} のチャンネル\n" * rand.randint(0, 5), timestamp,
+            rand.randrange(10**5), rand.randrange(10**7), rand.randrange(500), rand.randrange(500)
+        )
+        target_video = rand.choice([
+            MissingValue.Unacquired, MissingValue.NotExist,
+            YouTubeVideoData(f"v{i:010d}", f"【自己紹介】テスト{i}", "説明" * rand.randint(0, 50), timestamp),
+        ])
+        twitter = rand.choice([MissingValue.Unacquired, TwitterData(f"test{i}", f"テスト{i}")])
+        datum.append(VTuberMergedData(f"vtuber{i}", timestamp, youtube, target_video, twitter))
+    return datum
+
+def best_of(f) -> float:
+    elapsed = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        f()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+datum = generate(args.n)
+os.makedirs(args.out_dir, exist_ok=True)
+suffix = ".jsonl" if args.jsonl else ".json"
+
+methods = {
+    "asdict": (
+        lambda path: save_records(path, map(asdict, datum), date_handler),
+        lambda path: [VTuberMergedData.from_json(d) for d in iter_json_records(path)],
+        False,
+    ),
+    "codec": (
+        lambda path: save_records(path, map(VTUBER_MERGED_CODEC.encode, datum)),
+        lambda path: [VTUBER_MERGED_CODEC.decode(d) for d in iter_json_records(path)],
+        False,
+    ),
+}
+if codec.orjson is not None:
+    methods["codec+orjson"] = (*methods["codec"][:2], True)
+
+contents = {}
+for name, (save, load, orjson) in methods.items():
+    codec.use_orjson(orjson)
+    path = os.path.join(args.out_dir, f"{name}{suffix}")
+    save_seconds = best_of(lambda: save(path))
+    load_seconds = best_of(lambda: load(path))
+    loaded = load(path)
+    with open(path, "rb") as f:
+        contents[name] = f.read()
+    print(
+        f"{name:>12}: save {save_seconds*1000:8.1f} ms, load {load_seconds*1000:8.1f} ms "
+        f"({args.n / load_seconds:,.0f} records/s), same data: {loaded == datum}"
+    )
+codec.use_orjson(True)
+
+print(f"same bytes: {len(set(contents.values())) == 1}")
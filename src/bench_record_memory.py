@@ -0,0 +1,64 @@
+"""レコード型1件あたりのメモリを tracemalloc で測る
+
+VideoData, YouTubeVideoData, SearchResultItem, YouTubeData, VTuberMergedData について,
+`__dict__` を持つ元の形, slots (`Slotted*`), slots + frozen (`Frozen*`) の3通りでインスタンスを作り,
+1件あたりに確保したバイト数と作るのにかかった時間を比べる.
+フィールドの値は先に作っておき, レコード自体の分だけを測る.
+```bash
+python src/bench_record_memory.py --n 200000
+```
+"""
+
+import time
+import datetime
+import argparse
+import tracemalloc
+from typing import Any, Callable
+
+from utils.records import variant
+from vpost.vtuber_data import VideoData
+from youtube.youtube_data import SearchResultItem
+from dataset_for_annotator.data_types.common import JST, MissingValue
+from dataset_for_annotator.data_types.merged import YouTubeVideoData, YouTubeData, VTuberMergedData
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--n", type=int, default=200000, help="型ごとに作るインスタンスの数")
+args = parser.parse_args()
+
+timestamp = datetime.datetime(2022, 10, 1, tzinfo=JST)
+youtube = YouTubeData("UC0", "テスト", "説明", timestamp, 1, 2, 3, 3)
+
+ARGS: dict[type, Callable[[int], tuple]] = {
+    VideoData: lambda i: (f"v{i}", f"タイトル{i}", timestamp, i, None),
+    YouTubeVideoData: lambda i: (f"v{i}", f"タイトル{i}", f"説明{i}", timestamp),
+    SearchResultItem: lambda i: ("youtube#video", f"v{i}", timestamp, f"タイトル{i}", f"説明{i}", f"UC{i}", "テスト"),
+    YouTubeData: lambda i: (f"UC{i}", f"テスト{i}", f"説明{i}", timestamp, i, i, i, i),
+    VTuberMergedData: lambda i: (f"vtuber{i}", timestamp, youtube, MissingValue.Unacquired, MissingValue.Unacquired),
+}
+
+def measure(cls: type, arg_list: list[tuple]) -> tuple[float, float]:
+    """(1件あたりのバイト数, 1件あたりの秒数)"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    records: list[Any] = [cls(*a) for a in arg_list]
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    # リスト自体の分は除く
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    allocated -= records.__sizeof__()
+    return allocated / len(records), elapsed / len(records)
+
+for cls, make_args in ARGS.items():
+    arg_list = [make_args(i) for i in range(args.n)]
+    variants = {
+        "dict": cls,
+        "slots": variant(cls),
+        "frozen": variant(cls, frozen=True),
+    }
+    results = {name: measure(v, arg_list) for name, v in variants.items()}
+    print(cls.__name__)
+    for name, (size, seconds) in results.items():
+        print(f"    {name:>6}: {size:7.1f} bytes/record, {seconds*1e9:6.0f} ns/record")
@@ -0,0 +1,44 @@
+"""vpost のページから値を取り出す方法ごとの速度を比べる
+
+保存済みの一覧ページ / 個人ページの HTML を Chrome で開いて,
+行ごとに find_element する方法と execute_script 1回で取り出す方法を比べる.
+```bash
+python src/bench_vpost_extraction.py saved_list_page.html --repeat 5
+```
+"""
+
+import time
+import pathlib
+import argparse
+
+from selenium.webdriver.common.by import By
+
+from vpost.scraper import Extraction, get_web_driver, release_web_driver, extract_vtuber_datum, extract_vtuber_details
+
+parser = argparse.ArgumentParser()
+parser.add_argument("html_path", help="ブラウザの「名前を付けて保存」などで保存したページ")
+parser.add_argument("--repeat", type=int, default=5)
+args = parser.parse_args()
+
+web_driver = get_web_driver()
+web_driver.get(pathlib.Path(args.html_path).resolve().as_uri())
+is_list_page = bool(web_driver.find_elements(by=By.CLASS_NAME, value="vtuber_list"))
+
+def extract(extraction: Extraction):
+    if is_list_page:
+        return extract_vtuber_datum(web_driver, extraction)
+    return extract_vtuber_details(web_driver, "benchmark", extraction)
+
+results = {}
+for extraction in Extraction:
+    elapsed = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        results[extraction] = extract(extraction)
+        elapsed.append(time.perf_counter() - start)
+
+    rows_n = len(results[extraction]) if is_list_page else len(results[extraction].recent_videos)
+    print(f"{extraction.value:>8}: {rows_n} rows, best {min(elapsed)*1000:.1f} ms, mean {sum(elapsed)/len(elapsed)*1000:.1f} ms")
+
+print(f"same result: {results[Extraction.Element] == results[Extraction.Script]}")
+release_web_driver(web_driver)
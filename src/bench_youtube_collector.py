@@ -0,0 +1,62 @@
+"""YouTube の投稿動画リストの取得を, オフラインの YouTube API (`youtube.offline`) で並列数ごとに測る
+
+API key も通信も使わない. latency で1回の通信にかかる時間を真似る.
+```bash
+python src/bench_youtube_collector.py --channels 200 --latency 0.05 --workers 1 4 8
+```
+--cassette を渡すと, 乱数で作ったデータではなく `RecordingHttp` で記録したレスポンスを返す.
+"""
+
+import time
+import logging
+import tempfile
+import pathlib
+import argparse
+
+from utils.logger import get_logger
+from youtube.quota import QuotaLedger
+from youtube.scraper import create_key_pool
+from youtube.offline import SyntheticYouTube, Cassette, OfflineHttp
+from dataset_for_annotator.collector import YouTubeCollector, UploadListTarget
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--channels", type=int, default=200, help="架空のチャンネル数")
+parser.add_argument("--videos-per-channel", type=int, default=100, help="チャンネルあたりの平均動画数")
+parser.add_argument("--latency", type=float, default=0.05, help="1回の通信にかかる時間 [s]")
+parser.add_argument("--error-rate", type=float, default=0.0, help="500 を返す割合")
+parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+parser.add_argument("--cassette", help="RecordingHttp で記録した JSONL")
+args = parser.parse_args()
+
+logger = get_logger(__name__, logging.INFO)
+if args.cassette:
+    backend = Cassette(args.cassette)
+    channel_ids = sorted({key.split("playlistId=")[1].split("&")[0] for _, key in backend.responses if "playlistId=" in key})
+    channel_ids = ["UC" + id[2:] for id in channel_ids]
+else:
+    backend = SyntheticYouTube.generate(args.channels, args.videos_per_channel)
+    channel_ids = list(backend.channels.keys())
+
+for worker_n in args.workers:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = pathlib.Path(temp_dir)
+        ledger = QuotaLedger(temp_dir.joinpath("quota.json"), daily_quota=10**9)
+        key_pool = create_key_pool(
+            "offline", ledger,
+            http_factory=lambda: OfflineHttp(backend, latency=args.latency, error_rate=args.error_rate)
+        )
+        collector = YouTubeCollector(key_pool, temp_dir, get_logger("offline", logging.WARNING))
+
+        got_video_ns: list[int] = []
+        start = time.perf_counter()
+        collector.harvest_upload_video_lists(
+            [UploadListTarget(id) for id in channel_ids],
+            lambda _, got_video_n: got_video_ns.append(got_video_n or 0),
+            worker_n
+        )
+        elapsed = time.perf_counter() - start
+        units = ledger.used("offline")
+        logger.info(
+            f"workers {worker_n:>2}: {len(got_video_ns)} channels, {sum(got_video_ns)} videos, {units} requests "
+            f"in {elapsed:.2f} s ({len(got_video_ns) / elapsed:.1f} channels/s, {units / elapsed:.1f} requests/s)"
+        )
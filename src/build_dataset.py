@@ -1,27 +1,59 @@
 """`vpost_data` と `yt_data` を統合して
 `dataset/uploads` と `dataset/merged.json` を吐き出す。
 その後、適当なフィルタリングをして、`dataset/dataset.json` を吐き出す。
+`--dry-run` で YouTube API のクォータの見積もりだけ出力する.
+`--fetch-upload-videos` で投稿動画リストを YouTube API から取得する (付けなければ保存済みのリストだけを使う).
+`--sqlite` で merged.json の代わりに `dataset/merged.sqlite3` を使う (初回は merged.json から取り込む).
+`--export-merged-json` を付けると, 最後に `dataset/merged.sqlite3` から merged.json を書き出す.
+merged.json は変わったレコードだけを `dataset/merged.journal.jsonl` に追記し, `--compact-every` 件か `--compact-interval` 秒ごとにまとめる.
+`--uploads-archive` で投稿動画リストを `dataset/uploads/` の代わりに1つのアーカイブに保存する (`convert_uploads_archive.py` 参照).
+`--metrics metrics.prom` でリクエスト数, 応答時間, 進捗などを定期的に書き出す.
 """
-import os
+import argparse
 
 from dotenv import load_dotenv
 
+from utils.metrics import get_shared_metrics
 from dataset_for_annotator.dataset_builder import DatasetBuilder
+from youtube.quota import api_keys_from_env
+from youtube.etag_cache import EtagCache
 
 VPOST_DATA_PATH = "vpost_data/vtuber_data.json"
 VPOST_DETAIL_PATH = "vpost_data/detail_data.json"
 YOUTUBE_DATA_PATH = "yt_data/channels.json"
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--dry-run", action="store_true")
+parser.add_argument("--fetch-upload-videos", action="store_true", help="投稿動画リストを YouTube API から取得する")
+parser.add_argument("--youtube-workers", type=int, default=4, help="投稿動画リストを並列に取得する数")
+parser.add_argument("--sqlite", action="store_true", help="merged.json の代わりに merged.sqlite3 に保存する")
+parser.add_argument("--export-merged-json", action="store_true", help="--sqlite のとき, 最後に merged.json を書き出す")
+parser.add_argument("--compact-every", type=int, default=2000, help="merged.json のジャーナルがこの件数になったら merged.json にまとめる")
+parser.add_argument("--compact-interval", type=float, default=600.0, help="前にまとめてからこの秒数が経ったら merged.json にまとめる")
+parser.add_argument("--uploads-archive", action="store_true", help="投稿動画リストを uploads.index.jsonl と uploads.*.pack に保存する")
+parser.add_argument("--compress-uploads", action="store_true", help="--uploads-archive のとき, チャンネルごとに zlib で圧縮する")
+parser.add_argument("--metrics", help="リクエスト数や進捗を書き出す先. .json なら JSON, それ以外は Prometheus の textfile")
+args = parser.parse_args()
+
 load_dotenv()
 
-YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY')
+YOUTUBE_API_KEYS = api_keys_from_env()
 TWITTER_API_KEY = ""
 
-builder = DatasetBuilder("dataset", YOUTUBE_API_KEY, TWITTER_API_KEY, 2000, True)
+builder = DatasetBuilder(
+    "dataset", YOUTUBE_API_KEYS, TWITTER_API_KEY, 2000, True,
+    youtube_worker_n=args.youtube_workers, etag_cache=EtagCache(), use_merged_store=args.sqlite,
+    merged_compact_every=args.compact_every, merged_compact_interval=args.compact_interval,
+    use_uploads_archive=args.uploads_archive, compress_uploads=args.compress_uploads,
+    fetch_upload_videos=args.fetch_upload_videos
+)
 builder.load_merged_datum()
 # builder.load_upload_videos()
 # builder.load_vpostdata(VPOST_DATA_PATH, VPOST_DETAIL_PATH)
 # builder.load_ytdata(YOUTUBE_DATA_PATH)
 
-builder.build()
+with get_shared_metrics().exporting(args.metrics):
+    builder.build(dry_run=args.dry_run)
+if args.export_merged_json:
+    builder.export_merged_json()
 
@@ -0,0 +1,28 @@
+"""保存済みの JSON (レコードの配列) と JSON Lines を相互に変換する
+
+```bash
+python src/convert_json_format.py dataset/merged.json vpost_data/detail_data.json --to jsonl
+```
+`merged.json` は `merged.jsonl` のように, 拡張子だけ変えた隣のファイルに書き出す. 元のファイルは消さない.
+読み込みはレコードごとなので, 大きなファイルでも全体をメモリに載せない.
+読み込む側 (`load_*_datum` など) は拡張子と中身から形式を判定するので, どちらの形式でも読める.
+"""
+
+import pathlib
+import argparse
+
+from utils.file import JSONL_SUFFIX, convert_records
+
+parser = argparse.ArgumentParser()
+parser.add_argument("paths", nargs="+", type=pathlib.Path)
+parser.add_argument("--to", choices=["jsonl", "json"], default="jsonl")
+parser.add_argument("--compact", action="store_true", help="json に変換するとき, 整形せずに書き出す")
+args = parser.parse_args()
+
+for src_path in args.paths:
+    dst_path = src_path.with_suffix(JSONL_SUFFIX if args.to == "jsonl" else ".json")
+    if dst_path == src_path:
+        print(f"skip {src_path}: already {args.to}")
+        continue
+    n = convert_records(src_path, dst_path, shape_output=not args.compact)
+    print(f"{src_path} -> {dst_path}: {n} records")
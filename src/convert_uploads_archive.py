@@ -0,0 +1,35 @@
+"""投稿動画リストの `dataset/uploads/` (1チャンネル1ファイル) とアーカイブ (`dataset/uploads.index.jsonl`, `dataset/uploads.*.pack`) を相互に変換する
+
+```bash
+python src/convert_uploads_archive.py import --compress
+python src/convert_uploads_archive.py export
+python src/convert_uploads_archive.py compact
+```
+import はディレクトリの全チャンネルをアーカイブに書く (アーカイブにあるチャンネルは置き換える). 元のファイルは消さない.
+export はアーカイブの全チャンネルを今までと同じ形式の `{channel_id}.json` に書き出す.
+compact は取り直して使われなくなった分を詰める.
+"""
+
+import argparse
+
+from dataset_for_annotator.uploads_archive import UploadsArchive, import_uploads_dir, export_uploads_dir
+
+parser = argparse.ArgumentParser()
+parser.add_argument("command", choices=["import", "export", "compact"])
+parser.add_argument("--uploads-dir", default="dataset/uploads")
+parser.add_argument("--archive-dir", default="dataset", help="uploads.index.jsonl を置くディレクトリ")
+parser.add_argument("--compress", action="store_true", help="import するとき, チャンネルごとに zlib で圧縮する")
+args = parser.parse_args()
+
+archive = UploadsArchive(args.archive_dir, compress=args.compress)
+if args.command == "import":
+    n = import_uploads_dir(args.uploads_dir, archive)
+    print(f"{args.uploads_dir} -> {archive.index_path}: {n} channels")
+elif args.command == "export":
+    n = export_uploads_dir(archive, args.uploads_dir)
+    print(f"{archive.index_path} -> {args.uploads_dir}: {n} channels")
+else:
+    print(f"garbage: {archive.garbage_ratio():.1%}")
+    archive.compact()
+    print(f"compacted into {archive.data_path}")
+archive.close()
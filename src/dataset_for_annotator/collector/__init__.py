@@ -1,2 +1,2 @@
 from .twitter import TwitterCollector
-from .youtube import YouTubeCollector
\ No newline at end of file
+from .youtube import YouTubeCollector, UploadListTarget
\ No newline at end of file
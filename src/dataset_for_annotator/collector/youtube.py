@@ -1,14 +1,21 @@
-import os
 import logging
 import pathlib
+from typing import Callable
+from collections.abc import Iterable
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
 
-from apiclient import discovery
 from googleapiclient.errors import HttpError
 
 from utils.file import PathLike
+from utils.metrics import MetricsRegistry, get_shared_metrics
 from youtube.youtube_data import str_to_datetime
+from youtube.batch import BatchExecutor
+from youtube.etag_cache import EtagCache
+from youtube.quota import LIST_COST, ApiKeyPool, QuotaExceeded, is_quota_error
 
-from ..data_types.merged import MissingValue, VTuberMergedData, YouTubeVideoData, load_youtube_video_datum, save_youtube_video_datum
+from ..data_types.merged import MissingValue, VTuberMergedData, YouTubeVideoData
+from ..uploads_archive import Uploads, UploadsArchive, UploadsDir
 from ..data_filter import got_upload_lists, is_self_intro_video
 
 
@@ -40,14 +47,19 @@ def response_to_video_data(response: dict) -> YouTubeVideoData:
 def response_to_video_list(response: list) -> list[YouTubeVideoData]:
     return list(map(response_to_video_data, response))
 
-def extract_self_intro_video(target: VTuberMergedData, uploads_dir: pathlib.Path) -> MissingValue | YouTubeVideoData:
-    """target の投稿動画一覧から, 自己紹介動画を抽出"""
-    uploads_path = uploads_dir.joinpath(f"{target.vtuber_id}.json")
-    if not os.path.isfile(uploads_path):
+def extract_self_intro_video(target: VTuberMergedData, uploads: pathlib.Path | Uploads) -> MissingValue | YouTubeVideoData:
+    """target の投稿動画一覧から, 自己紹介動画を抽出
+
+    Args:
+        uploads (pathlib.Path | Uploads): `uploads` ディレクトリか, `UploadsArchive`
+    """
+    if isinstance(uploads, pathlib.Path):
+        uploads = UploadsDir(uploads)
+    videos = uploads.load(target.vtuber_id)
+    if videos is None:
         return MissingValue.Unacquired
 
-    uploads = load_youtube_video_datum(uploads_path)
-    self_intro_videos: filter[YouTubeVideoData] = filter(is_self_intro_video, uploads)
+    self_intro_videos: filter[YouTubeVideoData] = filter(is_self_intro_video, videos)
     for video in self_intro_videos:
         return video
 
@@ -57,47 +69,199 @@ def extract_self_intro_video(target: VTuberMergedData, uploads_dir: pathlib.Path
     else:
         return MissingValue.NotFound
 
+@dataclass
+class UploadListTarget:
+    channel_id: str
+    list_id: str | None = None
+    """投稿動画の再生リスト id. None なら channel id から推測する"""
+    video_count_n: int | None = None
+    """チャンネルの動画数. 差分取得の結果と合わなければ全部取り直す"""
+
 class YouTubeCollector:
-    def __init__(self, api_key: str, uploads_dir: PathLike, logger: logging.Logger) -> None:
-        self.youtube = discovery.build('youtube', 'v3', developerKey=api_key)
+    """クォータが足りなくなると `QuotaExceeded` を投げる. 途中まで取得したチャンネルの分は保存しない"""
+    def __init__(self,
+        key_pool: ApiKeyPool, uploads_dir: PathLike, logger: logging.Logger,
+        etag_cache: EtagCache | None = None, metrics: MetricsRegistry | None = None,
+        uploads_archive: UploadsArchive | None = None
+    ) -> None:
+        """
+        Args:
+            etag_cache (EtagCache | None): key_pool のクライアントと同じものを渡す. channels.list のバッチでも使う.
+            metrics (MetricsRegistry | None): リクエスト数, 応答時間, 書き込んだバイト数, 進捗の記録先. None なら共有のもの.
+            uploads_archive (UploadsArchive | None): 渡すと投稿動画リストを uploads_dir の代わりにこのアーカイブで読み書きする.
+        """
+        self.key_pool = key_pool
+        self.metrics = metrics or get_shared_metrics()
 
         self.logger = logger
         self.uploads_dir = pathlib.Path(uploads_dir)
+        self.uploads: Uploads = uploads_archive if uploads_archive is not None else UploadsDir(self.uploads_dir)
+        self.etag_cache = etag_cache
+        self.batch_executor = BatchExecutor(self.key_pool, self.logger, etag_cache=etag_cache, metrics=self.metrics)
 
-    def get_upload_video_list(self, youtube_id) -> int | None:
-        """指定されたチャンネルの投稿動画リストを取得"""
-        max_result = 50
-
-        list_id = user_id_to_upload_list_id(youtube_id)
+    def get_upload_list_ids(self, channel_ids: Iterable[str]) -> tuple[dict[str, str], list[str]]:
+        """channels.list を 50 件ずつまとめて叩いて, 投稿動画の再生リスト id を取得
 
-        self.logger.debug(f"get {youtube_id}'s upload list")
-        request = self.youtube.playlistItems().list(
-            part="snippet",
-            maxResults=max_result,
-            playlistId=list_id,
-            fields="nextPageToken,items/snippet(publishedAt,title,description,resourceId/videoId)"
+        Returns:
+            tuple[dict[str, str], list[str]]: channel id ごとの再生リスト id と, 存在しなかった channel id.
+            リクエストが失敗したチャンネルはどちらにも含めない.
+        """
+        result = self.batch_executor.execute(
+            lambda youtube, ids: youtube.channels().list(
+                part="contentDetails",
+                id=",".join(ids),
+                maxResults=50,
+                fields="etag,items(id,contentDetails/relatedPlaylists/uploads)"
+            ),
+            channel_ids
         )
+        for e in result.failed.values():
+            if isinstance(e, QuotaExceeded):
+                raise e
 
-        upload_videos = []
-        try:
-            while request:
-                response = request.execute()
-                upload_videos.extend(response_to_video_list(response["items"]))
-                request = self.youtube.playlistItems().list_next(request, response)
-        except HttpError as e:
-            self.logger.info(f"failed at {youtube_id} for {e.status_code}")
-            if e.status_code == 404:
+        upload_list_ids = {
+            id: item["contentDetails"]["relatedPlaylists"]["uploads"]
+            for id, item in result.found.items()
+        }
+        return upload_list_ids, result.missing
+
+    def get_upload_video_list(self,
+        youtube_id, list_id: str | None = None,
+        video_count_n: int | None = None, incremental: bool = True
+    ) -> int | None:
+        """指定されたチャンネルの投稿動画リストを取得
+
+        投稿動画リストは新しい順に返ってくるので, incremental なら保存済みの動画に当たったところで止めて,
+        新しい分だけ前に足す. 足した結果が video_count_n と合わなければ全部取り直す.
+
+        Args:
+            list_id (str | None): 投稿動画の再生リスト id. None なら channel id から推測する.
+            video_count_n (int | None): チャンネルの動画数. None なら差分だけで済ませる.
+            incremental (bool): False なら常に全部取り直す.
+
+        Raises:
+            HttpError: 404 とクォータ切れ以外で取得に失敗したとき. 保存済みのリストはそのまま残す.
+        """
+        if list_id is None:
+            list_id = user_id_to_upload_list_id(youtube_id)
+
+        stored_videos = (self.uploads.load(youtube_id) if incremental else None) or []
+
+        if stored_videos:
+            self.logger.debug(f"get {youtube_id}'s new uploads")
+            new_videos = self.__fetch_upload_videos(youtube_id, list_id, {v.video_id for v in stored_videos})
+            if new_videos is None:
+                return 0
+            upload_videos = new_videos + stored_videos
+            if video_count_n is not None and len(upload_videos) != video_count_n:
+                # 削除された動画や, vpost の最近の動画だけ保存してある場合など
+                self.logger.debug(f"{youtube_id} has {len(upload_videos)} videos, but expected {video_count_n}. resync")
+                stored_videos = []
+
+        if not stored_videos:
+            self.logger.debug(f"get {youtube_id}'s upload list")
+            upload_videos = self.__fetch_upload_videos(youtube_id, list_id, set())
+            if upload_videos is None:
                 return 0
-            elif e.status_code == 403:
-                raise Exception("API の使用上限")
-                return None
 
-        save_youtube_video_datum(upload_videos, self.uploads_dir.joinpath(f"{youtube_id}.json"))
+        written = self.uploads.save(youtube_id, upload_videos)
+        self.metrics.counter("bytes_written_total", kind="uploads").inc(written)
 
         return len(upload_videos)
 
+    def __fetch_upload_videos(self, youtube_id: str, list_id: str, known_ids: set[str]) -> list[YouTubeVideoData] | None:
+        """known_ids の動画が出てくるまで新しい順に取得する. チャンネルが存在しなければ None
+
+        404 とクォータ切れ以外の HttpError はそのまま投げる.
+        """
+        max_result = 50
+
+        upload_videos = []
+        page_token = None
+        while True:
+            # ページごとに残りのある key を選ぶので, list_next ではなく pageToken で続きを取る
+            youtube = self.key_pool.acquire(LIST_COST)
+            request = youtube.playlistItems().list(
+                part="snippet",
+                maxResults=max_result,
+                playlistId=list_id,
+                fields="nextPageToken,items/snippet(publishedAt,title,description,resourceId/videoId)",
+                **({"pageToken": page_token} if page_token else {})
+            )
+            self.metrics.counter("youtube_requests_total", method="playlistItems").inc()
+            try:
+                with self.metrics.histogram("youtube_request_seconds", method="playlistItems").time():
+                    response = request.execute()
+            except HttpError as e:
+                if is_quota_error(e):
+                    self.key_pool.exhaust(youtube)
+                    continue
+                self.logger.info(f"failed at {youtube_id} for {e.status_code}")
+                if e.status_code == 404:
+                    return None
+                # 途中までのリストで保存済みのものを上書きしないように, 呼び出し元まで投げる
+                raise
+
+            self.metrics.counter("youtube_pages_total", method="playlistItems").inc()
+            self.metrics.counter("youtube_items_total", method="playlistItems").inc(len(response["items"]))
+            for video in response_to_video_list(response["items"]):
+                if video.video_id in known_ids:
+                    return upload_videos
+                upload_videos.append(video)
+
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+        return upload_videos
+
+    def harvest_upload_video_lists(self,
+        targets: list[UploadListTarget], on_result: Callable[[str, int | None], None], worker_n: int = 4
+    ) -> None:
+        """複数のチャンネルの投稿動画リストを worker_n 並列で取得する
+
+        各チャンネルの `uploads/{id}.json` (かアーカイブ) は取得し終わったワーカーがすぐに書き込む.
+        on_result(channel id, 取得した動画数) は呼び出したスレッドで順に呼ぶので, 呼び出し側でロックはいらない.
+        クォータが足りなくなったら, 取得中の分を待ってから QuotaExceeded を投げる.
+        それ以外の例外で失敗したチャンネルはログに残して飛ばし, on_result は呼ばない (次の実行で取り直す).
+        """
+        progress = self.metrics.progress("youtube_upload_lists", len(targets), self.logger)
+        quota_error: QuotaExceeded | None = None
+        failed: list[str] = []
+        with ThreadPoolExecutor(max_workers=worker_n) as executor:
+            futures = {
+                executor.submit(self.get_upload_video_list, t.channel_id, t.list_id, t.video_count_n): t.channel_id
+                for t in targets
+            }
+            for future in as_completed(futures):
+                try:
+                    got_video_n = future.result()
+                except CancelledError:
+                    continue
+                except QuotaExceeded as e:
+                    if quota_error is None:
+                        quota_error = e
+                        for f in futures:
+                            f.cancel()
+                    continue
+                except Exception as e:
+                    self.logger.warning(f"failed to get upload video list of {futures[future]}: {e!r}")
+                    self.metrics.counter("youtube_upload_list_errors_total").inc()
+                    failed.append(futures[future])
+                    progress.advance()
+                    continue
+                progress.advance()
+                on_result(futures[future], got_video_n)
+
+        if failed:
+            self.logger.warning(f"failed to get {len(failed)} upload video lists: {failed}")
+        if self.etag_cache is not None:
+            self.logger.info(f"etag cache: {self.etag_cache.stats()}")
+        if quota_error is not None:
+            raise quota_error
+
     def set_self_intro_video(self, target: VTuberMergedData) -> None:
         """target の投稿動画一覧から, 自己紹介動画を抽出"""
-        target.target_video = extract_self_intro_video(target, self.uploads_dir)
+        target.target_video = extract_self_intro_video(target, self.uploads)
         if not isinstance(target.target_video, MissingValue):
             self.logger.debug(f"found self-intro video {target.target_video.title}:{target.target_video.video_id}")
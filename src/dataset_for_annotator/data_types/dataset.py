@@ -1,9 +1,10 @@
 import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+from typing import Iterable, Iterator
 
-from utils.file import PathLike, load_json, save_json
-from .common import date_handler
-from .merged import YouTubeVideoData, VTuberMergedData
+from utils.file import PathLike, iter_json_records, save_records
+from utils.codec import Codec
+from .merged import YOUTUBE_VIDEO_CODEC, YouTubeVideoData, VTuberMergedData
 
 @dataclass
 class TwitterDatasetItem:
@@ -62,11 +63,16 @@ class VTuberDatasetItem:
         )
 
 
+VTUBER_DATASET_CODEC = Codec(VTuberDatasetItem, codecs = {YouTubeVideoData: YOUTUBE_VIDEO_CODEC})
+
+def iter_vtuber_dataset_items(json_path: PathLike) -> Iterator[VTuberDatasetItem]:
+    """JSON でも JSON Lines でも, 1件ずつ読み込む"""
+    return map(VTUBER_DATASET_CODEC.decode, iter_json_records(json_path))
+
 def load_vtuber_dataset_items(json_path: PathLike) -> list[VTuberDatasetItem]:
-    vtuber_dataset_items = load_json(json_path)
-    return list(map(VTuberDatasetItem.from_json, vtuber_dataset_items))
+    return list(iter_vtuber_dataset_items(json_path))
 
-def save_vtuber_dataset_items(items: list[VTuberDatasetItem], json_path: PathLike, shape_output: bool = True) -> None:
-    save_obj = [asdict(d) for d in items]
-    save_json(json_path, save_obj, date_handler, shape_output)
+def save_vtuber_dataset_items(items: Iterable[VTuberDatasetItem], json_path: PathLike, shape_output: bool = True) -> None:
+    """拡張子が .jsonl なら JSON Lines で保存する"""
+    save_records(json_path, map(VTUBER_DATASET_CODEC.encode, items), shape_output=shape_output)
 
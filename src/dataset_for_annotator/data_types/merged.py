@@ -1,9 +1,12 @@
 import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+from typing import Iterable, Iterator
 
-from utils.file import PathLike, load_json, save_json
+from utils.file import PathLike, iter_json_records, save_records
+from utils.codec import Codec
+from utils.records import variant
 from vpost.vtuber_data import VideoData
-from .common import JST, MissingValue, json_to_missing_value_or_any, date_handler
+from .common import JST, MissingValue, json_to_missing_value_or_any
 
 @dataclass
 class TwitterData:
@@ -48,13 +51,21 @@ class YouTubeVideoData:
             )
         return cls(**json_dict)
 
+SlottedYouTubeVideoData = variant(YouTubeVideoData)
+FrozenYouTubeVideoData = variant(YouTubeVideoData, frozen=True)
+
+YOUTUBE_VIDEO_CODEC = Codec(YouTubeVideoData)
+
+def iter_youtube_video_datum(json_path: PathLike) -> Iterator[YouTubeVideoData]:
+    """JSON でも JSON Lines でも, 1件ずつ読み込む"""
+    return map(YOUTUBE_VIDEO_CODEC.decode, iter_json_records(json_path))
+
 def load_youtube_video_datum(json_path: PathLike) -> list[YouTubeVideoData]:
-    youtube_video_datum = load_json(json_path)
-    return list(map(YouTubeVideoData.from_json, youtube_video_datum))
+    return list(iter_youtube_video_datum(json_path))
 
-def save_youtube_video_datum(video_datum: list[YouTubeVideoData], json_path: PathLike) -> None:
-    save_obj = [asdict(v) for v in video_datum]
-    save_json(json_path, save_obj, date_handler)
+def save_youtube_video_datum(video_datum: Iterable[YouTubeVideoData], json_path: PathLike) -> None:
+    """拡張子が .jsonl なら JSON Lines で保存する"""
+    save_records(json_path, map(YOUTUBE_VIDEO_CODEC.encode, video_datum))
 
 def videodata_to_youtube_videodata(video_data: VideoData) -> YouTubeVideoData:
     video_data.timestamp = video_data.timestamp.replace(tzinfo=JST)
@@ -88,6 +99,9 @@ class YouTubeData:
 
         return cls(**json_dict)
 
+SlottedYouTubeData = variant(YouTubeData)
+FrozenYouTubeData = variant(YouTubeData, frozen=True)
+
 @dataclass
 class VTuberMergedData:
     vtuber_id: str
@@ -113,13 +127,26 @@ class VTuberMergedData:
 
         return cls(**json_dict)
 
+SlottedVTuberMergedData = variant(VTuberMergedData)
+FrozenVTuberMergedData = variant(VTuberMergedData, frozen=True)
+"""入れ子の youtube, target_video, twitter は書き換えられる"""
+
+VTUBER_MERGED_CODEC = Codec(VTuberMergedData, codecs = {
+    YouTubeVideoData: YOUTUBE_VIDEO_CODEC,
+    # TwitterData.from_json と同じく, twitter_id が空なら未取得にする
+    TwitterData: Codec(TwitterData, post_decode = lambda d: d if d.twitter_id else MissingValue.Unacquired),
+})
+
+def iter_vtuber_merged_datum(json_path: PathLike) -> Iterator[VTuberMergedData]:
+    """JSON でも JSON Lines でも, 1件ずつ読み込む"""
+    return map(VTUBER_MERGED_CODEC.decode, iter_json_records(json_path))
+
 def load_vtuber_merged_datum(json_path: PathLike) -> list[VTuberMergedData]:
-    vtuber_merged_datum = load_json(json_path)
-    return list(map(VTuberMergedData.from_json, vtuber_merged_datum))
+    return list(iter_vtuber_merged_datum(json_path))
 
-def save_vtuber_merged_datum(datum: list[VTuberMergedData], json_path: PathLike) -> None:
-    save_obj = [asdict(d) for d in datum]
-    save_json(json_path, save_obj, date_handler)
+def save_vtuber_merged_datum(datum: Iterable[VTuberMergedData], json_path: PathLike) -> None:
+    """拡張子が .jsonl なら JSON Lines で保存する"""
+    save_records(json_path, map(VTUBER_MERGED_CODEC.encode, datum))
 
 BuilderMergedData = dict[str, VTuberMergedData]
 """key: youtube_id, value: merged data"""
@@ -7,16 +7,24 @@ import pathlib
 import os
 import datetime
 import random
+from collections.abc import Iterable
 
 from utils.file import PathLike
 from utils.logger import get_logger
-from vpost.vtuber_data import VTuberData, VTuberDetails, load_detail_datum, load_vtuber_datum
-from youtube.youtube_data import YouTubeChannelData, load_channel_datum
+from utils.metrics import MetricsRegistry, get_shared_metrics
+from vpost.vtuber_data import iter_detail_datum, iter_vtuber_datum
+from youtube.youtube_data import iter_channel_datum
+from youtube.scraper import HttpFactory, create_key_pool
+from youtube.etag_cache import EtagCache
+from youtube.quota import QuotaLedger, QuotaExceeded, estimate_upload_list_cost
 
 from .data_types.common import JST, MissingValue
-from .data_types.merged import BuilderMergedData, TwitterData, VTuberMergedData, YouTubeData, load_youtube_video_datum, save_vtuber_merged_datum, videodata_to_youtube_videodata, load_vtuber_merged_datum, save_youtube_video_datum
+from .data_types.merged import BuilderMergedData, TwitterData, VTuberMergedData, YouTubeData, videodata_to_youtube_videodata
 from .data_types.dataset import VTuberDatasetItem, save_vtuber_dataset_items
-from .collector import TwitterCollector, YouTubeCollector
+from .collector import TwitterCollector, YouTubeCollector, UploadListTarget
+from .merged_store import SQL_FILTERS, MergedDataStore
+from .merged_checkpoint import MergedCheckpoint
+from .uploads_archive import Uploads, UploadsArchive, UploadsDir
 from .data_filter import (
     FilterFunc, found_self_intro_video, has_twitter, has_twitter_detail, tried_to_get_twitter_id, youtube_basic_filter_conds, youtube_content_filter_conds,
     got_upload_lists, tried_to_get_self_intro_video,
@@ -30,48 +38,125 @@ def filter_vtuber_dict(filter_conds: tuple[FilterFunc], target: BuilderMergedDat
 class DatasetBuilder:
     MERGED_JSON_NAME = "merged.json"
     DATASET_JSON_NAME = "dataset.json"
+    MERGED_DB_NAME = "merged.sqlite3"
+    MERGED_JOURNAL_NAME = "merged.journal.jsonl"
     UPLOADS_DIR = "uploads"
 
     def __init__(self,
-        save_dir: PathLike, youtube_api_key: str, twitter_api_key: str,
+        save_dir: PathLike, youtube_api_keys: list[str] | str, twitter_api_key: str,
         dataset_max: int, shape_output: bool,
+        quota_ledger: QuotaLedger | None = None, youtube_worker_n: int = 4,
+        etag_cache: EtagCache | None = None, youtube_http_factory: HttpFactory | None = None,
+        metrics: MetricsRegistry | None = None, use_merged_store: bool = False,
+        merged_compact_every: int | None = 2000, merged_compact_interval: float | None = 600.0,
+        use_uploads_archive: bool = False, compress_uploads: bool = False,
+        fetch_upload_videos: bool = False,
         logger: logging.Logger = get_logger(__name__, logging.DEBUG)
     ) -> None:
+        """
+        Args:
+            youtube_api_keys (list[str] | str): 複数渡すとクォータの残りが多いものから使う
+            quota_ledger (QuotaLedger | None): YouTube API のクォータの記録. None ならデフォルトの場所のもの.
+            youtube_worker_n (int): 投稿動画リストを並列に取得する数
+            etag_cache (EtagCache | None): YouTube API のレスポンスを ETag 付きで保存して, 変わっていなければ使い回す
+            youtube_http_factory (HttpFactory | None): YouTube API をオフラインで動かすときの http. `youtube.offline` 参照.
+            metrics (MetricsRegistry | None): リクエスト数, 書き込んだバイト数, 進捗の記録先. None なら共有のもの.
+            use_merged_store (bool): merged.json の代わりに `merged.sqlite3` に保存する. 変わった分だけ upsert し, フィルターは索引を使う.
+                merged.json は `export_merged_json` で書き出せる.
+            merged_compact_every (int | None): merged.json を使うとき, 変わったレコードは `merged.journal.jsonl` に追記し,
+                この件数を書いたら merged.json にまとめる. None なら件数では見ない.
+            merged_compact_interval (float | None): 前にまとめてからこの秒数が経ったら merged.json にまとめる. None なら時間では見ない.
+            use_uploads_archive (bool): 投稿動画リストを `uploads/` の代わりに1つのアーカイブ (`uploads.index.jsonl`, `uploads.*.pack`) に保存する.
+            compress_uploads (bool): アーカイブに書く投稿動画リストを zlib で圧縮する
+            fetch_upload_videos (bool): build で投稿動画リストを YouTube API から取得する. False なら保存済みのリストだけを使う.
+        """
         self.logger = logger
+        self.metrics = metrics or get_shared_metrics()
 
         save_dir = pathlib.Path(save_dir)
         os.makedirs(save_dir, exist_ok=True)
         self.uploads_dir = save_dir.joinpath(self.UPLOADS_DIR)
         os.makedirs(self.uploads_dir, exist_ok=True)
+        self.uploads_archive = UploadsArchive(save_dir, compress_uploads) if use_uploads_archive else None
+        self.uploads: Uploads = self.uploads_archive or UploadsDir(self.uploads_dir)
         self.merged_json_path = save_dir.joinpath(self.MERGED_JSON_NAME)
         self.dataset_json_path = save_dir.joinpath(self.DATASET_JSON_NAME)
+        self.merged_journal_path = save_dir.joinpath(self.MERGED_JOURNAL_NAME)
+        self.merged_store = MergedDataStore(save_dir.joinpath(self.MERGED_DB_NAME)) if use_merged_store else None
+        self.merged_checkpoint = MergedCheckpoint(
+            self.merged_json_path, self.merged_journal_path,
+            merged_compact_every, merged_compact_interval, metrics=self.metrics, logger=self.logger
+        )
+        """merged_store を使うときは, 初回に merged.json とジャーナルを取り込むのにだけ使う"""
 
         self.vtuber_merged_datum: BuilderMergedData = {}
         """key: vtuber_id, value: VTuberMergedData"""
         self.filtered_datum: BuilderMergedData = self.vtuber_merged_datum
         """self.vtuber_merged_datum の部分集合"""
 
-        self.youtube_collector = YouTubeCollector(youtube_api_key, self.uploads_dir, self.logger)
+        self.youtube_key_pool = create_key_pool(youtube_api_keys, quota_ledger, etag_cache, youtube_http_factory, self.metrics)
+        self.youtube_collector = YouTubeCollector(
+            self.youtube_key_pool, self.uploads_dir, self.logger, etag_cache, self.metrics, self.uploads_archive
+        )
+        self.youtube_worker_n = youtube_worker_n
+        self.fetch_upload_videos = fetch_upload_videos
         self.twitter_collector = TwitterCollector(twitter_api_key, self.logger)
         self.DATASET_MAX = dataset_max
         self.shape_output = shape_output
 
     def load_merged_datum(self) -> None:
-        if not os.path.exists(self.merged_json_path):
+        if self.merged_store is not None:
+            self.__load_merged_store()
+            return
+
+        if not os.path.exists(self.merged_json_path) and not os.path.exists(self.merged_journal_path):
             self.logger.info(f"{self.merged_json_path} is not found")
             return
         self.logger.info(f"START TO LOAD MERGED DATA from {self.merged_json_path}")
-        vtuber_merged_datum = load_vtuber_merged_datum(self.merged_json_path)
-        for data in vtuber_merged_datum:
+        self.vtuber_merged_datum.update(self.merged_checkpoint.load())
+        self.logger.info(f"DONE! merged data has loaded")
+
+    def __load_merged_store(self) -> None:
+        if len(self.merged_store) == 0 and (os.path.exists(self.merged_json_path) or os.path.exists(self.merged_journal_path)):
+            self.logger.info(f"import {self.merged_json_path} into {self.merged_store.db_path}")
+            self.merged_store.upsert(self.merged_checkpoint.load().values())
+
+        self.logger.info(f"START TO LOAD MERGED DATA from {self.merged_store.db_path}")
+        for data in self.merged_store.select():
             self.vtuber_merged_datum[data.vtuber_id] = data
         self.logger.info(f"DONE! merged data has loaded")
 
-    def build(self) -> None:
+    def export_merged_json(self) -> None:
+        """`merged.sqlite3` を使っているときに, 今までの形式の merged.json を書き出す"""
+        if self.merged_store is None:
+            return
+        self.merged_store.export_json(self.merged_json_path)
+        self.logger.info(f"exported merged datum to {self.merged_json_path}")
+
+    def __filter(self, filter_conds: tuple[FilterFunc], target: BuilderMergedData) -> BuilderMergedData:
+        if self.merged_store is None:
+            return filter_vtuber_dict(filter_conds, target)
+
+        # SQL で書ける条件は保存済みの値で索引から絞るので, 呼ぶ前に保存しておくこと
+        ids = self.merged_store.select_ids(filter_conds)
+        residual = tuple(cond for cond in filter_conds if cond not in SQL_FILTERS)
+        return filter_vtuber_dict(residual, {id: target[id] for id in ids if id in target})
+
+    def build(self, dry_run: bool = False) -> None:
+        """
+        Args:
+            dry_run (bool): YouTube API のクォータの見積もりだけ出力して, 何も取得しない
+        """
+        if dry_run:
+            self.estimate_quota()
+            return
+
         self.filtered_datum = self.vtuber_merged_datum
-        self.filtered_datum = filter_vtuber_dict(youtube_basic_filter_conds, self.filtered_datum)
-        # self.__get_upload_videos()
+        self.filtered_datum = self.__filter(youtube_basic_filter_conds, self.filtered_datum)
+        if self.fetch_upload_videos:
+            self.__get_upload_videos()
         self.__get_self_intro_videos()
-        self.filtered_datum = filter_vtuber_dict(youtube_content_filter_conds, self.filtered_datum)
+        self.filtered_datum = self.__filter(youtube_content_filter_conds, self.filtered_datum)
 
         # for data in self.filtered_datum.values():
         #    self.logger.debug(f"{data.youtube.name}: {data.youtube.channel_description}")
@@ -81,8 +166,10 @@ class DatasetBuilder:
 
         # self.__collect_twitter_data()
 
-        self.filtered_datum = filter_vtuber_dict(all_filter_conditions, self.filtered_datum)
+        self.filtered_datum = self.__filter(all_filter_conditions, self.filtered_datum)
         self.__output_dataset()
+        # 各段階で書き換えた分は保存済みなので, まとめるだけ
+        self.__save_merged_datum([], compact=True)
 
     def load_vpostdata(self,
         vpost_data_json_path: PathLike, vpost_detail_json_path: PathLike,
@@ -90,11 +177,10 @@ class DatasetBuilder:
     ) -> None:
 
         self.logger.info(f"START TO LOAD VPOST DATA: does_update is {does_update}")
+        changed: dict[str, VTuberMergedData] = {}
 
         self.logger.info(f"load VTuberData from {vpost_data_json_path}")
-        vpost_vtuber_datum: list[VTuberData] = load_vtuber_datum(vpost_data_json_path)
-
-        for data in vpost_vtuber_datum:
+        for data in iter_vtuber_datum(vpost_data_json_path):
             if not does_update and data.youtube_id in self.vtuber_merged_datum:
                 # データの更新なし
                 self.logger.debug(f"{data.youtube_id} is already exist. skip.")
@@ -112,11 +198,10 @@ class DatasetBuilder:
                 MissingValue.Unacquired,
                 MissingValue.Unacquired
             )
+            changed[data.youtube_id] = self.vtuber_merged_datum[data.youtube_id]
 
         self.logger.info(f"load VTuberDetails from {vpost_detail_json_path}")
-        vpost_vtuber_detail: list[VTuberDetails] = load_detail_datum(vpost_detail_json_path)
-
-        for detail in vpost_vtuber_detail:
+        for detail in iter_detail_datum(vpost_detail_json_path):
             # if not does_update and data.youtube_id in self.vtuber_merged_datum:
             #    # データの更新なし
             #    # TODO: 上ですでに読み込みをしてるので, このままだと新規データだけ読み込むのができない
@@ -131,23 +216,20 @@ class DatasetBuilder:
             merged_data.twitter = TwitterData(detail.twitter_id.replace("@", "")) if detail.twitter_id else MissingValue.Unacquired
 
             merged_data.youtube.channel_description = detail.description
+            changed[detail.youtube_id] = merged_data
             if detail.recent_videos:
-                save_youtube_video_datum(
-                    map(videodata_to_youtube_videodata, detail.recent_videos),
-                    self.uploads_dir.joinpath(f"{detail.youtube_id}.json")
-                )
+                self.uploads.save(detail.youtube_id, map(videodata_to_youtube_videodata, detail.recent_videos))
 
         self.logger.info(f"DONE! vpost data has loaded")
-        self.__save_merged_datum()
+        self.__save_merged_datum(changed.values())
 
 
     def load_ytdata(self, youtube_json_path: PathLike, does_update: bool = False) -> None:
         self.logger.info(f"START TO LOAD YOUTUBE DATA: does_update is {does_update}")
 
         self.logger.info(f"load YouTubeChannelData from {youtube_json_path}")
-        channel_datum: list[YouTubeChannelData] = load_channel_datum(youtube_json_path)
-
-        for data in channel_datum:
+        changed: list[VTuberMergedData] = []
+        for data in iter_channel_datum(youtube_json_path):
             if not does_update and data.channel_id in self.vtuber_merged_datum:
                 self.logger.debug(f"{data.channel_id} is already exist. skip.")
                 continue
@@ -162,23 +244,23 @@ class DatasetBuilder:
                 MissingValue.Unacquired,
                 MissingValue.Unacquired
             )
+            changed.append(self.vtuber_merged_datum[data.channel_id])
 
         self.logger.info(f"DONE! youtube data has loaded")
-        self.__save_merged_datum()
+        self.__save_merged_datum(changed)
 
     def load_upload_videos(self) -> None:
         self.logger.info(f"load upload videos")
-        for vtuber_id in self.vtuber_merged_datum.keys():
-            uploads_path = self.uploads_dir.joinpath(f"{vtuber_id}.json")
-            if not os.path.isfile(uploads_path):
-                continue
-
-            uploads = load_youtube_video_datum(uploads_path)
-            if uploads:
-                self.vtuber_merged_datum[vtuber_id].youtube.got_video_n = len(uploads)
+        changed: list[VTuberMergedData] = []
+        for vtuber_id, data in self.vtuber_merged_datum.items():
+            # アーカイブなら索引の動画数だけを見る
+            video_n = self.uploads.video_count(vtuber_id)
+            if video_n and data.youtube.got_video_n != video_n:
+                data.youtube.got_video_n = video_n
+                changed.append(data)
 
         self.logger.info(f"DONE!")
-        self.__save_merged_datum()
+        self.__save_merged_datum(changed)
 
     def __complement_youtube_basic_info(self) -> None:
         # youtube の基本情報を揃える
@@ -188,19 +270,58 @@ class DatasetBuilder:
         # 今のところこの処理を特別する必要はない
         raise Exception("not implement")
 
-    def __get_upload_videos(self) -> None:
-        target_ids = list(map(
+    def __upload_videos_targets(self, datum: BuilderMergedData | None = None) -> list[str]:
+        """datum (None なら self.filtered_datum) のうち, 投稿動画リストを取得するチャンネル"""
+        return list(map(
             lambda x: x.youtube.channel_id,
             filter(
                 lambda x: not (tried_to_get_self_intro_video(x) or got_upload_lists(x)),
-                self.filtered_datum.values()
+                (self.filtered_datum if datum is None else datum).values()
             )
         ))
+
+    def estimate_quota(self) -> int:
+        """build で使う YouTube API のユニット数を見積もって, 残りと比べる
+
+        API を使うのは投稿動画リストの取得 (fetch_upload_videos のときだけ) で, 自己紹介動画の抽出は保存済みのリストしか見ない.
+        """
+        if not self.fetch_upload_videos:
+            self.logger.info("build will not call YouTube API: upload video lists are not fetched")
+            return 0
+
+        target_ids = self.__upload_videos_targets(self.__filter(youtube_basic_filter_conds, self.vtuber_merged_datum))
+        cost = estimate_upload_list_cost([
+            self.vtuber_merged_datum[id].youtube.video_count_n or 0 for id in target_ids
+        ])
+        remaining = self.youtube_key_pool.remaining()
+        self.logger.info(f"{len(target_ids)} upload video lists will cost about {cost} units, {remaining} units remain today")
+        if cost > remaining:
+            self.logger.warning(f"quota is not enough. it will stop at about {remaining / max(cost, 1):.0%}")
+        return cost
+
+    def __get_upload_videos(self) -> None:
+        target_ids = self.__upload_videos_targets()
         self.logger.info(f"will try to get {len(target_ids)} upload video lists")
 
+        try:
+            self.__get_upload_video_lists(target_ids)
+        except QuotaExceeded as e:
+            self.logger.warning(f"stop getting upload video lists: {e}")
 
-        for i, vtuber_id in enumerate(target_ids):
-            got_video_n = self.youtube_collector.get_upload_video_list(vtuber_id)
+        self.logger.info(f"DONE!")
+
+    def __get_upload_video_lists(self, target_ids: list[str]) -> None:
+        upload_list_ids, missing_ids = self.youtube_collector.get_upload_list_ids(target_ids)
+        for vtuber_id in missing_ids:
+            # チャンネルが削除されている
+            self.vtuber_merged_datum[vtuber_id].youtube.got_video_n = 0
+        self.__save_merged_datum(self.vtuber_merged_datum[id] for id in missing_ids)
+        missing_id_set = set(missing_ids)
+        target_ids = [id for id in target_ids if id not in missing_id_set]
+
+        changed_ids: list[str] = []
+        def on_result(vtuber_id: str, got_video_n: int | None) -> None:
+            # ワーカーのスレッドではなく, ここ (呼び出し元のスレッド) で順に呼ばれる
             self.vtuber_merged_datum[vtuber_id].youtube.got_video_n = got_video_n
             if got_video_n and self.vtuber_merged_datum[vtuber_id].youtube.video_count_n < got_video_n:
                 self.vtuber_merged_datum[vtuber_id].youtube.video_count_n = got_video_n
@@ -210,24 +331,30 @@ class DatasetBuilder:
                 # 2度目の取得でも upload videos の数が変わらないなら, 最大値から減っていても, 今はそれだけしか取得できないのだろう
                 self.vtuber_merged_datum[vtuber_id].youtube.video_count_n = got_video_n
 
-            if (i+1) % 20 == 0:
-                self.__save_merged_datum()
-
-        self.logger.info(f"DONE!")
-        self.__save_merged_datum()
+            # 進捗は collector の metrics が出す
+            changed_ids.append(vtuber_id)
+            if len(changed_ids) % 20 == 0:
+                self.__save_merged_datum(self.vtuber_merged_datum[id] for id in changed_ids[-20:])
+
+        targets = [
+            UploadListTarget(id, upload_list_ids.get(id), self.vtuber_merged_datum[id].youtube.video_count_n)
+            for id in target_ids
+        ]
+        try:
+            self.youtube_collector.harvest_upload_video_lists(targets, on_result, self.youtube_worker_n)
+        finally:
+            # 20件ごとの保存から漏れた残り
+            self.__save_merged_datum(self.vtuber_merged_datum[id] for id in changed_ids[len(changed_ids) // 20 * 20:])
 
     def __get_self_intro_videos(self) -> None:
         self.logger.info("extract self intro video")
-        list(map(
-            self.youtube_collector.set_self_intro_video,
-            filter(
-                lambda x: True,
-                self.filtered_datum.values()
-            )
-        ))
+        progress = self.metrics.progress("self_intro_videos", len(self.filtered_datum), self.logger)
+        for data in self.filtered_datum.values():
+            self.youtube_collector.set_self_intro_video(data)
+            progress.advance()
         self.logger.info("DONE!")
 
-        self.__save_merged_datum()
+        self.__save_merged_datum(self.filtered_datum.values())
 
     def __collect_twitter_data(self) -> None:
         """Twitter データの収集, データセットに含めないことにするのでいったん後回し"""
@@ -249,17 +376,27 @@ class DatasetBuilder:
 
             # TODO: 保存周期定数で書け
             if (i+1) % 20 == 0:
-                self.__save_merged_datum()
+                self.__save_merged_datum(datum_has_twitter[i+1-20:i+1])
 
         self.logger.info(f"DONE!")
-        self.__save_merged_datum()
+        self.__save_merged_datum(datum_not_tried_to_get_id + datum_has_twitter[len(datum_has_twitter) // 20 * 20:])
 
     def __filter_all_data(self) -> None:
         pass
 
-    def __save_merged_datum(self) -> None:
-        save_vtuber_merged_datum(self.vtuber_merged_datum.values(), self.merged_json_path)
-        self.logger.info(f"saved merged datum to {self.merged_json_path}")
+    def __save_merged_datum(self, changed: Iterable[VTuberMergedData] | None = None, compact: bool = False) -> None:
+        """changed (None なら全件) を保存する
+
+        merged_store にはそのまま upsert する. merged.json を使うときは, 前回の保存から変わったものだけをジャーナルに追記し,
+        間隔を過ぎていれば (compact なら必ず) merged.json にまとめる.
+        """
+        if self.merged_store is not None:
+            n = self.merged_store.upsert(self.vtuber_merged_datum.values() if changed is None else changed)
+            self.logger.info(f"saved {n} merged datum to {self.merged_store.db_path}")
+            return
+
+        n = self.merged_checkpoint.save(self.vtuber_merged_datum, changed, compact)
+        self.logger.info(f"saved {n} changed merged datum to {self.merged_journal_path}")
 
     def __output_dataset(self) -> None:
         self.logger.info(f"output dataset")
@@ -269,4 +406,5 @@ class DatasetBuilder:
         self.logger.info(f"will save {len(save_items)} data items")
         save_items = map(VTuberDatasetItem.from_vtuber_merged_data, save_items)
         save_vtuber_dataset_items(save_items, self.dataset_json_path, self.shape_output)
+        self.metrics.counter("bytes_written_total", kind="dataset").inc(os.path.getsize(self.dataset_json_path))
         self.logger.info(f"DONE!")
@@ -0,0 +1,128 @@
+"""merged.json を変わった分だけ保存する
+
+段階ごとに merged.json を全件書き直すと, チャンネル数が増えるほど保存が重くなり, 書き込み中に止まるとファイルが壊れる.
+ここでは前回の保存から変わったレコードだけを `merged.journal.jsonl` に追記し (write-ahead log),
+件数か時間で決めた間隔ごとに merged.json へまとめる (compact).
+- merged.json は一時ファイルに書いて fsync してから置き換えるので, 途中で止まっても前の merged.json とジャーナルが残る
+- 読み込むときは merged.json にジャーナルを重ねる. 同じ vtuber_id は後のものが勝つ
+- 変わったかどうかは, 前回保存したときの JSON と比べて決める. その場で書き換えられたレコードも拾える
+- 比べるにはレコードを JSON にし直すので, 書き換えた側が changed にそのレコードを渡す. changed を渡さないと全件を比べる
+"""
+
+import os
+import json
+import time
+import logging
+from typing import Callable, Iterable
+
+from utils.file import PathLike
+from utils.journal import Journal
+from utils.logger import get_logger
+from utils.metrics import MetricsRegistry, get_shared_metrics
+from .data_types.merged import VTUBER_MERGED_CODEC, BuilderMergedData, VTuberMergedData, iter_vtuber_merged_datum, save_vtuber_merged_datum
+
+def fingerprint(data: VTuberMergedData) -> int:
+    return hash(json.dumps(VTUBER_MERGED_CODEC.encode(data), ensure_ascii=False))
+
+class DirtyTracker:
+    """最後に保存したときの内容と比べて, 変わったレコードを見つける"""
+    def __init__(self) -> None:
+        self.__fingerprints: dict[str, int] = {}
+        """key: vtuber_id, value: 保存したときの JSON のハッシュ"""
+
+    def mark_clean(self, datum: Iterable[VTuberMergedData]) -> None:
+        for data in datum:
+            self.__fingerprints[data.vtuber_id] = fingerprint(data)
+
+    def dirty(self, datum: Iterable[VTuberMergedData]) -> list[VTuberMergedData]:
+        """datum のうち, 保存していないか保存した後に変わったもの. 同じレコードは1回だけ返す"""
+        result = {}
+        for data in datum:
+            if data.vtuber_id not in result and self.__fingerprints.get(data.vtuber_id) != fingerprint(data):
+                result[data.vtuber_id] = data
+        return list(result.values())
+
+class MergedCheckpoint:
+    """merged.json と, その後に変わったレコードのジャーナル"""
+    def __init__(self,
+        json_path: PathLike, journal_path: PathLike,
+        compact_every: int | None = 2000, compact_interval: float | None = 600.0,
+        clock: Callable[[], float] = time.monotonic, metrics: MetricsRegistry | None = None,
+        logger: logging.Logger | None = None
+    ) -> None:
+        """
+        Args:
+            compact_every (int | None): ジャーナルに書いたレコードがこの件数を超えたら merged.json にまとめる. None なら件数では見ない.
+            compact_interval (float | None): 前にまとめてからこの秒数が経ったら merged.json にまとめる. None なら時間では見ない.
+            logger (logging.Logger | None): None ならこのモジュールのもの. import しただけでログファイルを作らないように, ここで作る.
+        """
+        self.json_path = json_path
+        self.journal = Journal(journal_path)
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.clock = clock
+        self.metrics = metrics or get_shared_metrics()
+        self.logger = logger or get_logger(__name__, logging.DEBUG)
+
+        self.tracker = DirtyTracker()
+        self.__journaled_n = 0
+        """最後にまとめてからジャーナルに書いたレコード数"""
+        self.__compacted_at = clock()
+
+    def load(self) -> BuilderMergedData:
+        """merged.json にジャーナルを重ねた全件. 読み込んだ内容を保存済みとして覚える"""
+        datum: BuilderMergedData = {}
+        if os.path.exists(self.json_path):
+            for data in iter_vtuber_merged_datum(self.json_path):
+                datum[data.vtuber_id] = data
+
+        self.__journaled_n = 0
+        for entry in self.journal.replay():
+            data = VTUBER_MERGED_CODEC.decode(entry)
+            datum[data.vtuber_id] = data
+            self.__journaled_n += 1
+        if self.__journaled_n:
+            self.logger.info(f"replayed {self.__journaled_n} merged datum from {self.journal.journal_path}")
+
+        self.tracker.mark_clean(datum.values())
+        return datum
+
+    def save(self, datum: BuilderMergedData, changed: Iterable[VTuberMergedData] | None = None, compact: bool = False) -> int:
+        """changed (None なら全件) のうち変わったものをジャーナルに書く. まとめる間隔を過ぎていれば merged.json にまとめる
+
+        Args:
+            datum (BuilderMergedData): まとめるときに書き出す全件
+            changed (Iterable[VTuberMergedData] | None): 書き換えたレコード. None だと datum を全部 JSON にし直して比べるので, 件数に比例して重い
+            compact (bool): 間隔によらずまとめる
+        Returns:
+            int: ジャーナルに書いたレコード数
+        """
+        dirty = self.tracker.dirty(datum.values() if changed is None else changed)
+        if dirty:
+            size = os.path.getsize(self.journal.journal_path) if os.path.exists(self.journal.journal_path) else 0
+            self.journal.append(map(VTUBER_MERGED_CODEC.encode, dirty))
+            self.journal.flush()
+            self.metrics.counter("bytes_written_total", kind="merged").inc(os.path.getsize(self.journal.journal_path) - size)
+            self.tracker.mark_clean(dirty)
+            self.__journaled_n += len(dirty)
+
+        if compact or self.__should_compact():
+            self.compact(datum)
+        return len(dirty)
+
+    def __should_compact(self) -> bool:
+        if self.__journaled_n == 0:
+            return False
+        if self.compact_every is not None and self.__journaled_n >= self.compact_every:
+            return True
+        return self.compact_interval is not None and self.clock() - self.__compacted_at >= self.compact_interval
+
+    def compact(self, datum: BuilderMergedData) -> None:
+        """datum を merged.json に書き出して, ジャーナルを空にする"""
+        self.journal.compact(lambda path: save_vtuber_merged_datum(datum.values(), path), self.json_path)
+        self.metrics.counter("bytes_written_total", kind="merged").inc(os.path.getsize(self.json_path))
+        self.logger.info(f"compacted {self.__journaled_n} journaled merged datum into {self.json_path}")
+        # 保存の記録は付け直さない (全件を JSON にし直すことになる). changed で渡されずに書き換えられていたレコードは,
+        # 次に渡されたときにもう一度ジャーナルに書くだけで, 失われはしない
+        self.__journaled_n = 0
+        self.__compacted_at = self.clock()
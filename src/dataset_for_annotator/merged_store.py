@@ -0,0 +1,171 @@
+"""VTuberMergedData を SQLite に保存するリポジトリ
+
+`merged.json` は段階ごとに全件を書き直すので, チャンネル数が増えると保存が重くなる.
+ここでは1行1チャンネルで保存し, vtuber_id で upsert する. 複数件の更新は1つのトランザクションにまとめる.
+`data_filter.py` の条件で使う値は列にも持って索引を張り, フィルターは SQL で絞ってから残りを Python で判定する.
+`export_json` で今までの `merged.json` の形式にも書き出せる.
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from utils.file import PathLike
+from utils.codec import loads
+from .data_types.common import MissingValue, date_handler
+from .data_types.merged import VTUBER_MERGED_CODEC, VTuberMergedData, iter_vtuber_merged_datum, save_vtuber_merged_datum
+from .data_filter import (
+    FilterFunc, has_twitter, has_twitter_detail, tried_to_get_twitter_id,
+    found_self_intro_video, tried_to_get_self_intro_video, got_upload_lists,
+    enough_uploads, enough_few_views, enough_subscriber_count,
+)
+
+FOUND = "found"
+"""target_video_state, twitter_state で, 値が取得できていることを表す"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS merged (
+    vtuber_id TEXT PRIMARY KEY,
+    create_at TEXT,
+    name TEXT,
+    subscriber_count INTEGER,
+    view_count INTEGER,
+    video_count_n INTEGER,
+    got_video_n INTEGER,
+    target_video_state TEXT NOT NULL,
+    twitter_state TEXT NOT NULL,
+    has_twitter_detail INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS merged_video_count_n ON merged (video_count_n);
+CREATE INDEX IF NOT EXISTS merged_view_count ON merged (view_count);
+CREATE INDEX IF NOT EXISTS merged_subscriber_count ON merged (subscriber_count);
+CREATE INDEX IF NOT EXISTS merged_got_video_n ON merged (got_video_n);
+CREATE INDEX IF NOT EXISTS merged_target_video_state ON merged (target_video_state);
+CREATE INDEX IF NOT EXISTS merged_twitter_state ON merged (twitter_state);
+"""
+
+COLUMNS = (
+    "vtuber_id", "create_at", "name", "subscriber_count", "view_count", "video_count_n", "got_video_n",
+    "target_video_state", "twitter_state", "has_twitter_detail", "data",
+)
+
+SQL_FILTERS: dict[FilterFunc, str] = {
+    has_twitter: f"twitter_state = '{FOUND}'",
+    has_twitter_detail: "has_twitter_detail = 1",
+    tried_to_get_twitter_id: f"twitter_state IN ('{FOUND}', '{MissingValue.NotExist.value}')",
+    found_self_intro_video: f"target_video_state = '{FOUND}'",
+    tried_to_get_self_intro_video: f"target_video_state IN ('{FOUND}', '{MissingValue.NotExist.value}')",
+    got_upload_lists: "video_count_n IS NOT NULL AND got_video_n IS NOT NULL AND video_count_n <= got_video_n",
+    enough_uploads: "(video_count_n IS NULL OR video_count_n > 3)",
+    enough_few_views: "(view_count IS NULL OR view_count > 10)",
+    enough_subscriber_count: "(subscriber_count IS NULL OR subscriber_count > 5)",
+}
+"""SQL で書ける条件. ここにない条件 (ng_words_filter など) は読み込んだ後に Python で判定する"""
+
+def value_state(value: object) -> str:
+    return value.value if isinstance(value, MissingValue) else FOUND
+
+def to_row(data: VTuberMergedData) -> tuple:
+    return (
+        data.vtuber_id, date_handler(data.create_at), data.youtube.name,
+        data.youtube.subscriber_count, data.youtube.view_count, data.youtube.video_count_n, data.youtube.got_video_n,
+        value_state(data.target_video), value_state(data.twitter), int(has_twitter_detail(data)),
+        json.dumps(VTUBER_MERGED_CODEC.encode(data), ensure_ascii=False),
+    )
+
+def from_row(data: str) -> VTuberMergedData:
+    return VTUBER_MERGED_CODEC.decode(loads(data))
+
+class MergedDataStore:
+    """VTuberMergedData の SQLite リポジトリ. 接続はスレッドごとに作る"""
+    def __init__(self, db_path: PathLike) -> None:
+        self.db_path = db_path
+        self.__local = threading.local()
+        self.connection.executescript(SCHEMA)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.__local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.__local.connection = connection
+        return connection
+
+    def close(self) -> None:
+        connection = getattr(self.__local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.__local.connection = None
+
+    @contextmanager
+    def transaction(self):
+        """with の中の書き込みをまとめてコミットする. 例外で抜けたらロールバック. 入れ子にしてもよい"""
+        connection = self.connection
+        if connection.in_transaction:
+            yield connection
+            return
+        connection.execute("BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM merged").fetchone()[0]
+
+    def __contains__(self, vtuber_id: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM merged WHERE vtuber_id = ?", (vtuber_id,)).fetchone() is not None
+
+    def get(self, vtuber_id: str) -> VTuberMergedData | None:
+        row = self.connection.execute("SELECT data FROM merged WHERE vtuber_id = ?", (vtuber_id,)).fetchone()
+        return from_row(row[0]) if row is not None else None
+
+    def upsert(self, datum: Iterable[VTuberMergedData]) -> int:
+        """vtuber_id が同じ行は置き換える. 全件を1つのトランザクションで書く"""
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in COLUMNS if c != "vtuber_id")
+        with self.transaction() as connection:
+            cursor = connection.executemany(
+                f"INSERT INTO merged ({', '.join(COLUMNS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT (vtuber_id) DO UPDATE SET {updates}",
+                map(to_row, datum)
+            )
+            return cursor.rowcount
+
+    def delete(self, vtuber_ids: Iterable[str]) -> None:
+        with self.transaction() as connection:
+            connection.executemany("DELETE FROM merged WHERE vtuber_id = ?", ((id,) for id in vtuber_ids))
+
+    def select_ids(self, filter_conds: Iterable[FilterFunc] = ()) -> list[str]:
+        """filter_conds のうち SQL で書けるものだけで絞った vtuber_id. 残りの条件は見ない"""
+        where = self.__where(filter_conds)
+        return [row[0] for row in self.connection.execute(f"SELECT vtuber_id FROM merged{where} ORDER BY rowid")]
+
+    def select(self, filter_conds: Iterable[FilterFunc] = ()) -> Iterator[VTuberMergedData]:
+        """filter_conds を全て満たすデータ. SQL で絞ってから, 書けない条件を Python で判定する"""
+        filter_conds = tuple(filter_conds)
+        residual = [cond for cond in filter_conds if cond not in SQL_FILTERS]
+        where = self.__where(filter_conds)
+        for (data,) in self.connection.execute(f"SELECT data FROM merged{where} ORDER BY rowid"):
+            merged_data = from_row(data)
+            if all(cond(merged_data) for cond in residual):
+                yield merged_data
+
+    def __where(self, filter_conds: Iterable[FilterFunc]) -> str:
+        clauses = [SQL_FILTERS[cond] for cond in filter_conds if cond in SQL_FILTERS]
+        return f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    def import_json(self, json_path: PathLike) -> int:
+        """`merged.json` の全件を upsert する"""
+        return self.upsert(iter_vtuber_merged_datum(json_path))
+
+    def export_json(self, json_path: PathLike) -> None:
+        """`merged.json` と同じ形式で書き出す"""
+        save_vtuber_merged_datum(self.select(), json_path)
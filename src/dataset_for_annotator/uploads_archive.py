@@ -0,0 +1,251 @@
+"""チャンネルごとの投稿動画リストを1つのファイルにまとめたアーカイブ
+
+`uploads/{channel_id}.json` は数万の小さいファイルになり, ネットワークファイルシステムではディレクトリの走査と
+ファイルを開くのに時間がかかる. ここでは全チャンネル分を1つのデータファイルに追記し, channel id ごとの位置を索引に持つ.
+データファイルは mmap で開き, 必要なチャンネルの分だけ読む.
+- データファイル (`uploads.{世代}.pack`): 1チャンネル分の動画リストを1つの JSON の配列にして並べる. compress なら1件ずつ zlib で圧縮する
+- 索引 (`uploads.index.jsonl`): 1行目はデータファイルの世代, それ以降は1行1チャンネルの位置と動画数. 同じ channel id は後の行が勝つ
+- 書き込みはデータを追記して fsync してから索引に追記する. 途中で止まっても, 索引にない分のデータが残るだけ
+- 取り直して使われなくなった分は `compact` で詰める. 次の世代のデータファイルと索引を作ってから索引を置き換える
+
+`UploadsDir` は今までのディレクトリの形式で同じ操作をする. `import_uploads_dir` / `export_uploads_dir` で相互に変換できる.
+"""
+
+import os
+import json
+import mmap
+import zlib
+import pathlib
+import threading
+from dataclasses import dataclass
+from typing import Iterable
+
+from utils.file import PathLike, fsync_path
+from utils.codec import loads
+from utils.journal import Journal
+from .data_types.merged import YOUTUBE_VIDEO_CODEC, YouTubeVideoData, load_youtube_video_datum, save_youtube_video_datum
+
+INDEX_NAME = "uploads.index.jsonl"
+
+def data_name(generation: int) -> str:
+    return f"uploads.{generation}.pack"
+
+@dataclass(slots=True)
+class ArchiveEntry:
+    offset: int
+    length: int
+    video_n: int
+    compressed: bool
+
+    def to_json(self, channel_id: str) -> dict:
+        return {
+            "channel_id": channel_id, "offset": self.offset, "length": self.length,
+            "video_n": self.video_n, "compressed": self.compressed,
+        }
+
+class UploadsDir:
+    """今までの `uploads/{channel_id}.json` の形式"""
+    def __init__(self, uploads_dir: PathLike) -> None:
+        self.uploads_dir = pathlib.Path(uploads_dir)
+        os.makedirs(self.uploads_dir, exist_ok=True)
+
+    def path(self, channel_id: str) -> pathlib.Path:
+        return self.uploads_dir.joinpath(f"{channel_id}.json")
+
+    def __contains__(self, channel_id: str) -> bool:
+        return os.path.isfile(self.path(channel_id))
+
+    def channel_ids(self) -> list[str]:
+        return sorted(path.stem for path in self.uploads_dir.glob("*.json"))
+
+    def load(self, channel_id: str) -> list[YouTubeVideoData] | None:
+        """保存していなければ None"""
+        if channel_id not in self:
+            return None
+        return load_youtube_video_datum(self.path(channel_id))
+
+    def video_count(self, channel_id: str) -> int | None:
+        videos = self.load(channel_id)
+        return None if videos is None else len(videos)
+
+    def save(self, channel_id: str, videos: Iterable[YouTubeVideoData]) -> int:
+        """書き込んだバイト数を返す"""
+        save_youtube_video_datum(videos, self.path(channel_id))
+        return os.path.getsize(self.path(channel_id))
+
+    def close(self) -> None:
+        pass
+
+class UploadsArchive:
+    """1つのデータファイルと索引にまとめた投稿動画リスト. スレッドから同時に読み書きしてよい"""
+    def __init__(self, archive_dir: PathLike, compress: bool = False, compress_level: int = 6) -> None:
+        """
+        Args:
+            compress (bool): これから書くリストを zlib で圧縮する. 書いてあるものはそれぞれの形式のまま読める.
+        """
+        self.archive_dir = pathlib.Path(archive_dir)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        self.index_path = self.archive_dir.joinpath(INDEX_NAME)
+        self.compress = compress
+        self.compress_level = compress_level
+
+        self.__lock = threading.RLock()
+        self.__index: dict[str, ArchiveEntry] = {}
+        self.__garbage = 0
+        """取り直して使われなくなったバイト数"""
+        self.__generation = 0
+        self.__journal = Journal(self.index_path)
+        self.__writer = None
+        self.__mmap: mmap.mmap | None = None
+        self.__load_index()
+
+    @property
+    def data_path(self) -> pathlib.Path:
+        return self.archive_dir.joinpath(data_name(self.__generation))
+
+    def __load_index(self) -> None:
+        entries = self.__journal.replay()
+        header = next(entries, None)
+        if header is None:
+            open(self.data_path, "ab").close()
+            self.__journal.append([{"generation": 0}])
+            self.__journal.flush()
+            return
+
+        self.__generation = header["generation"]
+        for e in entries:
+            entry = ArchiveEntry(e["offset"], e["length"], e["video_n"], e["compressed"])
+            previous = self.__index.get(e["channel_id"])
+            if previous is not None:
+                self.__garbage += previous.length
+            self.__index[e["channel_id"]] = entry
+
+    def __contains__(self, channel_id: str) -> bool:
+        return channel_id in self.__index
+
+    def __len__(self) -> int:
+        return len(self.__index)
+
+    def channel_ids(self) -> list[str]:
+        with self.__lock:
+            return sorted(self.__index.keys())
+
+    def video_count(self, channel_id: str) -> int | None:
+        """索引だけを見るので, データは読まない"""
+        entry = self.__index.get(channel_id)
+        return None if entry is None else entry.video_n
+
+    def garbage_ratio(self) -> float:
+        """データファイルのうち, 使われていない分の割合"""
+        with self.__lock:
+            used = sum(entry.length for entry in self.__index.values())
+            total = used + self.__garbage
+            return self.__garbage / total if total else 0.0
+
+    def __read_raw(self, entry: ArchiveEntry) -> bytes:
+        """圧縮したまま読む. 書き足した分が mmap の外なら開き直す"""
+        with self.__lock:
+            end = entry.offset + entry.length
+            if self.__mmap is None or len(self.__mmap) < end:
+                if self.__mmap is not None:
+                    self.__mmap.close()
+                with open(self.data_path, "rb") as f:
+                    self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self.__mmap[entry.offset:end]
+
+    def load(self, channel_id: str) -> list[YouTubeVideoData] | None:
+        """保存していなければ None"""
+        entry = self.__index.get(channel_id)
+        if entry is None:
+            return None
+        raw = self.__read_raw(entry)
+        if entry.compressed:
+            raw = zlib.decompress(raw)
+        return [YOUTUBE_VIDEO_CODEC.decode(d) for d in loads(raw)]
+
+    def save(self, channel_id: str, videos: Iterable[YouTubeVideoData]) -> int:
+        """channel_id のリストを置き換える. 書き込んだバイト数を返す"""
+        records = [YOUTUBE_VIDEO_CODEC.encode(v) for v in videos]
+        raw = json.dumps(records, ensure_ascii=False).encode("utf-8")
+        if self.compress:
+            raw = zlib.compress(raw, self.compress_level)
+        return self.__append(channel_id, raw, len(records), self.compress)
+
+    def __append(self, channel_id: str, raw: bytes, video_n: int, compressed: bool) -> int:
+        with self.__lock:
+            if self.__writer is None:
+                self.__writer = open(self.data_path, "ab")
+            offset = self.__writer.seek(0, os.SEEK_END)
+            self.__writer.write(raw)
+            self.__writer.flush()
+            os.fsync(self.__writer.fileno())
+
+            entry = ArchiveEntry(offset, len(raw), video_n, compressed)
+            self.__journal.append([entry.to_json(channel_id)])
+            self.__journal.flush()
+            previous = self.__index.get(channel_id)
+            if previous is not None:
+                self.__garbage += previous.length
+            self.__index[channel_id] = entry
+        return len(raw)
+
+    def compact(self) -> None:
+        """使われていない分を詰めて, 次の世代のデータファイルに書き直す"""
+        with self.__lock:
+            old_data_path = self.data_path
+            generation = self.__generation + 1
+            new_data_path = self.archive_dir.joinpath(data_name(generation))
+
+            new_index: dict[str, ArchiveEntry] = {}
+            with open(new_data_path, "wb") as f:
+                for channel_id in sorted(self.__index.keys()):
+                    entry = self.__index[channel_id]
+                    raw = self.__read_raw(entry)
+                    new_index[channel_id] = ArchiveEntry(f.tell(), len(raw), entry.video_n, entry.compressed)
+                    f.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+
+            temp_index_path = f"{self.index_path}.tmp"
+            with open(temp_index_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"generation": generation}) + "\n")
+                for channel_id, entry in new_index.items():
+                    f.write(json.dumps(entry.to_json(channel_id), ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.close()
+            os.replace(temp_index_path, self.index_path)
+            fsync_path(self.archive_dir)
+            os.remove(old_data_path)
+            self.__generation = generation
+            self.__index = new_index
+            self.__garbage = 0
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__journal.close()
+            if self.__writer is not None:
+                self.__writer.close()
+                self.__writer = None
+            if self.__mmap is not None:
+                self.__mmap.close()
+                self.__mmap = None
+
+Uploads = UploadsDir | UploadsArchive
+
+def import_uploads_dir(uploads_dir: PathLike, archive: UploadsArchive) -> int:
+    """ディレクトリの全チャンネルをアーカイブに書く. チャンネル数を返す"""
+    source = UploadsDir(uploads_dir)
+    channel_ids = source.channel_ids()
+    for channel_id in channel_ids:
+        archive.save(channel_id, source.load(channel_id))
+    return len(channel_ids)
+
+def export_uploads_dir(archive: UploadsArchive, uploads_dir: PathLike) -> int:
+    """アーカイブの全チャンネルを `{channel_id}.json` に書き出す. チャンネル数を返す"""
+    target = UploadsDir(uploads_dir)
+    channel_ids = archive.channel_ids()
+    for channel_id in channel_ids:
+        target.save(channel_id, archive.load(channel_id))
+    return len(channel_ids)
@@ -6,7 +6,6 @@ file name スネークケースにリネームする
 """
 
 import os
-import time
 import glob
 import logging
 from yt_dlp import YoutubeDL, DownloadError
@@ -15,21 +14,33 @@ from dataset_for_annotator.data_types import dataset
 from dataset_for_annotator.data_types.dataset import VTuberDatasetItem, load_vtuber_dataset_items
 from utils.file import PathLike
 from utils.logger import get_logger
+from utils.rate_limiter import HostRateLimiter, get_shared_rate_limiter
+from utils.metrics import MetricsRegistry, get_shared_metrics
 
 def video_id_to_url(video_id: str) -> str:
     return f"https://www.youtube.com/watch?v={video_id}"
 
+def find_video_paths(dir: str, video_id: str) -> list[str]:
+    return glob.glob(f"{dir}/*{video_id}*.mp4")
+
 def is_exist_video(dir: str, video_id: str) -> bool:
-    hitted = glob.glob(f"{dir}/*{video_id}*.mp4")
-    return len(hitted) > 0
+    return len(find_video_paths(dir, video_id)) > 0
 
 class VideoDownloader:
     def __init__(self,
         dataset_json_path: PathLike, save_dir: PathLike,
+        rate_limiter: HostRateLimiter | None = None,
+        metrics: MetricsRegistry | None = None,
         logger: logging.Logger = get_logger(__name__, logging.DEBUG)
     ):
+        """
+        Args:
+            metrics (MetricsRegistry | None): ダウンロードした数, バイト数, 進捗の記録先. None なら共有のもの.
+        """
         self.dataset_json_path = dataset_json_path
         self.save_dir = save_dir
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.metrics = metrics or get_shared_metrics()
         self.logger = logger
 
         self.ydl = YoutubeDL({
@@ -44,8 +55,10 @@ class VideoDownloader:
         self.logger.info("start to download dataset videos")
         self.__load_dataset()
 
+        progress = self.metrics.progress("videos", len(self.dataset_items), self.logger)
         for item in self.dataset_items:
             self.download_yt_video(item.youtube.target_video.video_id)
+            progress.advance()
 
         self.logger.info("DONE!")
 
@@ -55,17 +68,23 @@ class VideoDownloader:
 
     def download_yt_video(self, video_id: str):
         if is_exist_video(self.save_dir, video_id):
-            self.logger.info(f"{video_id} already exists")
+            self.logger.debug(f"{video_id} already exists")
+            self.metrics.counter("videos_total", status="skipped").inc()
             return None
-        self.logger.info(f"downloading {video_id}")
+        self.logger.debug(f"downloading {video_id}")
         url = video_id_to_url(video_id)
 
         try:
-            self.ydl.download(url)
+            # ダウンロード時間は動画の長さで決まるので, 応答時間ではレートを調整しない
+            with self.rate_limiter.request(url, use_latency=False):
+                self.ydl.download(url)
         except DownloadError as e:
             self.logger.warning(f"ERROR at {video_id}")
             self.logger.warning(f"{e}")
+            self.metrics.counter("videos_total", status="failed").inc()
             return None
-        self.logger.info(f"downloaded {video_id}")
-
-        time.sleep(3)
\ No newline at end of file
+        self.metrics.counter("videos_total", status="downloaded").inc()
+        self.metrics.counter("bytes_written_total", kind="video").inc(
+            sum(os.path.getsize(path) for path in find_video_paths(self.save_dir, video_id))
+        )
+        self.logger.debug(f"downloaded {video_id}")
\ No newline at end of file
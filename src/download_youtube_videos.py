@@ -1,8 +1,16 @@
 """yt_dlp で Vtuber の自己紹介動画をダウンロードする。
+`--metrics metrics.prom` でダウンロードした数, バイト数, 進捗などを定期的に書き出す.
 """
 
+import argparse
+
+from utils.metrics import get_shared_metrics
 from dataset_for_ml_model.VideoDownloader import VideoDownloader
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--metrics", help="リクエスト数や進捗を書き出す先. .json なら JSON, それ以外は Prometheus の textfile")
+args = parser.parse_args()
 
 downloader = VideoDownloader("dataset/dataset.json", "dataset/videos")
-downloader.download_dataset_videos()
+with get_shared_metrics().exporting(args.metrics):
+    downloader.download_dataset_videos()
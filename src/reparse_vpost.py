@@ -0,0 +1,31 @@
+"""vpost_data/html_cache に保存した HTML から vpost のデータを作り直す
+パーサーを直したときなどに, ネットワークに繋がずに `vtuber_data.json` と `detail_data.json` を作る.
+```bash
+python src/reparse_vpost.py --save-dir vpost_data/reparsed
+```
+"""
+
+import os
+import argparse
+
+from utils.logger import get_logger
+from vpost.html_cache import HtmlCache
+from vpost.reparse import reparse_vtuber_datum, reparse_detail_datum
+from vpost.vtuber_data import save_vtuber_datum, save_detail_datum
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--cache-dir", default="vpost_data/html_cache")
+parser.add_argument("--save-dir", default="vpost_data/reparsed", help="vpost_data を直接上書きしないように, デフォルトでは別の場所に書く")
+args = parser.parse_args()
+logger = get_logger(__name__)
+
+cache = HtmlCache(args.cache_dir, ttl=None)
+os.makedirs(args.save_dir, exist_ok=True)
+
+vtuber_datum = reparse_vtuber_datum(cache, logger)
+save_vtuber_datum(vtuber_datum, os.path.join(args.save_dir, "vtuber_data.json"))
+logger.info(f"{len(vtuber_datum)} vtubers from list pages")
+
+detail_datum = reparse_detail_datum(cache, logger)
+save_detail_datum(detail_datum, os.path.join(args.save_dir, "detail_data.json"))
+logger.info(f"{len(detail_datum)} vtubers from detail pages")
@@ -2,9 +2,40 @@
 - [VTuber Post の個人ページ](https://vtuber-post.com/database/detail.php?id=vtuber_id)
 
 `scrape_vpost_list.py` で取得した id から各ページに飛んでスクレイピングする.
+`--backend http` を付けると Chrome を立ち上げずに HTML だけ取得してパースする.
+`--workers N` で N 個の WebDriver を並列に動かす.
+ホストごとの同時リクエスト数は `--max-concurrency` (省略すると `--workers` と同じ, 2 未満にはしない).
+取得した HTML は `vpost_data/html_cache` に保存する (`--no-html-cache` で無効). 作り直しは `reparse_vpost.py`.
+`--html-cache-max-mb N` を付けると, 終わったあとにキャッシュの本文が N MB 以下になるように古いものから消す.
+`--metrics metrics.prom` でリクエスト数, 応答時間, 進捗などを定期的に書き出す.
 """
 
-from vpost.scraper import VTuberDetailScraper
+import argparse
 
-scraper = VTuberDetailScraper("vpost_data")
-scraper.scrape_youtube_datum()
+from utils.rate_limiter import HostRateLimiter
+from utils.metrics import get_shared_metrics
+from vpost.html_cache import HtmlCache
+from vpost.driver import WebDriverFactory, set_driver_factory
+from vpost.scraper import Backend, VTuberDetailScraper
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--backend", choices=[b.value for b in Backend], default=Backend.Selenium.value)
+parser.add_argument("--workers", type=int, default=1)
+parser.add_argument("--headed", action="store_true", help="Chrome の画面を表示する")
+parser.add_argument("--max-rate", type=float, default=2.0, help="ホストごとのリクエスト数の上限 [req/s]")
+parser.add_argument("--max-concurrency", type=int, help="ホストごとの同時リクエスト数の上限. 省略すると --workers と同じ")
+parser.add_argument("--no-html-cache", action="store_true", help="取得した HTML を保存しない")
+parser.add_argument("--html-cache-max-mb", type=float, help="終わったあとに HTML キャッシュをこの大きさ [MB] まで減らす")
+parser.add_argument("--metrics", help="リクエスト数や進捗を書き出す先. .json なら JSON, それ以外は Prometheus の textfile")
+args = parser.parse_args()
+rate_limiter = HostRateLimiter(max_rate=args.max_rate, max_concurrency=args.max_concurrency or max(args.workers, 2))
+html_cache = None if args.no_html_cache else HtmlCache("vpost_data/html_cache")
+if args.headed:
+    set_driver_factory(WebDriverFactory(headless=False))
+
+scraper = VTuberDetailScraper("vpost_data", backend=args.backend, worker_n=args.workers, rate_limiter=rate_limiter, html_cache=html_cache)
+with get_shared_metrics().exporting(args.metrics):
+    scraper.scrape_youtube_datum()
+
+if html_cache is not None and args.html_cache_max_mb is not None:
+    html_cache.prune(max_bytes=int(args.html_cache_max_mb * 1024 * 1024))
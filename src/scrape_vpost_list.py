@@ -1,9 +1,51 @@
 """VTuber Post の個人データベースをスクレイピング
 - [VTuber Post の個人データベース](https://vtuber-post.com/database/index.php)
+
+`--backend http` を付けると Chrome を立ち上げずに検索フォームを直接 POST する.
+`--workers N` でページの範囲を N 個に分けて並列に取得する. 途中経過は `vpost_data/partitions` に保存される.
+ホストごとの同時リクエスト数は `--max-concurrency` (省略すると `--workers` と同じ, 2 未満にはしない).
+`--refresh` で新しい順に取得し, 取得済みの VTuber が続いたら止める (日々の差分更新用).
+取得した HTML は `vpost_data/html_cache` に保存する (`--no-html-cache` で無効). 作り直しは `reparse_vpost.py`.
+`--html-cache-max-mb N` を付けると, 終わったあとにキャッシュの本文が N MB 以下になるように古いものから消す.
+`--metrics metrics.prom` でリクエスト数, 応答時間, 進捗などを定期的に書き出す.
 """
 
-from vpost.scraper import VTuberListScraper
+import argparse
+
+from utils.rate_limiter import HostRateLimiter
+from utils.metrics import get_shared_metrics
+from vpost.html_cache import HtmlCache
+from vpost.driver import WebDriverFactory, set_driver_factory
+from vpost.scraper import Backend, VTuberListScraper, PartitionedListScraper
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--backend", choices=[b.value for b in Backend], default=Backend.Selenium.value)
+parser.add_argument("--workers", type=int, default=1)
+parser.add_argument("--refresh", action="store_true")
+parser.add_argument("--headed", action="store_true", help="Chrome の画面を表示する")
+parser.add_argument("--max-rate", type=float, default=2.0, help="ホストごとのリクエスト数の上限 [req/s]")
+parser.add_argument("--max-concurrency", type=int, help="ホストごとの同時リクエスト数の上限. 省略すると --workers と同じ")
+parser.add_argument("--no-html-cache", action="store_true", help="取得した HTML を保存しない")
+parser.add_argument("--html-cache-max-mb", type=float, help="終わったあとに HTML キャッシュをこの大きさ [MB] まで減らす")
+parser.add_argument("--metrics", help="リクエスト数や進捗を書き出す先. .json なら JSON, それ以外は Prometheus の textfile")
+args = parser.parse_args()
+rate_limiter = HostRateLimiter(max_rate=args.max_rate, max_concurrency=args.max_concurrency or max(args.workers, 2))
+html_cache = None if args.no_html_cache else HtmlCache("vpost_data/html_cache")
+if args.headed:
+    set_driver_factory(WebDriverFactory(headless=False))
+
+with get_shared_metrics().exporting(args.metrics):
+    if args.refresh:
+        scraper = VTuberListScraper("vpost_data", backend=args.backend, rate_limiter=rate_limiter, html_cache=html_cache, refresh=True)
+        scraper.ready_scraper()
+        scraper.scrape_vtuber_list()
+    elif args.workers > 1:
+        scraper = PartitionedListScraper("vpost_data", args.workers, backend=args.backend, rate_limiter=rate_limiter, html_cache=html_cache)
+        scraper.scrape_vtuber_list()
+    else:
+        scraper = VTuberListScraper("vpost_data", backend=args.backend, rate_limiter=rate_limiter, html_cache=html_cache)
+        scraper.ready_scraper()
+        scraper.scrape_vtuber_list()
 
-scraper = VTuberListScraper("vpost_data")
-scraper.ready_scraper()
-scraper.scrape_vtuber_list()
+if html_cache is not None and args.html_cache_max_mb is not None:
+    html_cache.prune(max_bytes=int(args.html_cache_max_mb * 1024 * 1024))
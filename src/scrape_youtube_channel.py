@@ -1,17 +1,27 @@
 """YouTube の channel id からチャンネルの詳細情報を取得
 
 `scrape_youtube_search.py` で取得した id から各チャンネルの情報を取得する.
+`--metrics metrics.prom` でリクエスト数, 応答時間, 進捗などを定期的に書き出す.
 """
 
-import os
+import argparse
 
 from dotenv import load_dotenv
 
+from utils.metrics import get_shared_metrics
+
 from youtube.scraper import YouTubeChannelScraper
+from youtube.quota import api_keys_from_env
+from youtube.etag_cache import EtagCache
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--metrics", help="リクエスト数や進捗を書き出す先. .json なら JSON, それ以外は Prometheus の textfile")
+args = parser.parse_args()
 
 load_dotenv()
 
-API_KEY = os.getenv('API_KEY')
+API_KEYS = api_keys_from_env()
 
-scraper = YouTubeChannelScraper("yt_data", API_KEY, "vpost_data/detail_data.json")
-scraper.scrape()
+scraper = YouTubeChannelScraper("yt_data", API_KEYS, "vpost_data/detail_data.json", etag_cache=EtagCache())
+with get_shared_metrics().exporting(args.metrics):
+    scraper.scrape()
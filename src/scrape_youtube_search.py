@@ -1,28 +1,87 @@
 """YouTube の動画検索から VTuber のアカウント情報を集める
+
+API key は `.env` の `YOUTUBE_API_KEYS` (カンマ区切りで複数可) か `API_KEY` から読む.
+`--dry-run` で使うクォータの見積もりだけ出力する.
+各検索は新しいチャンネルの見つかりやすいものから交互にページ送りし, 見つからなくなった検索は打ち切る.
+`--since 2018-01-01` を付けると, query ごとに投稿日時の期間に分けて, その日以降の動画を取りきる.
+途中で止まった期間の検索は, 次に同じ `--since` で実行したときに同じ期間のまま再開する.
+`--metrics metrics.prom` でリクエスト数, 応答時間, 進捗などを定期的に書き出す.
 """
 
 import os
+import datetime
+import argparse
 
 from dotenv import load_dotenv
 
+from utils.metrics import get_shared_metrics
+from vpost.vtuber_data import iter_detail_datum
 from youtube.scraper import YouTubeSearchScraper
+from youtube.search_planner import SearchPlanner
+from youtube.time_window_search import TimeWindowSearch
+from youtube.quota import api_keys_from_env
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--dry-run", action="store_true", help="使うクォータの見積もりだけ出力する")
+parser.add_argument("--max-page", type=int, default=20)
+parser.add_argument("--min-new-channels", type=int, default=3, help="1ページの新しいチャンネル数がこれ未満なら収穫が少ないとみなす")
+parser.add_argument("--patience", type=int, default=2, help="収穫が少ないページがこの回数続いたら打ち切る")
+parser.add_argument("--since", type=datetime.date.fromisoformat, help="期間に分けて検索する最初の日 (YYYY-MM-DD)")
+parser.add_argument("--workers", type=int, default=4, help="期間に分けて検索するときに並列に動かす数")
+parser.add_argument("--metrics", help="リクエスト数や進捗を書き出す先. .json なら JSON, それ以外は Prometheus の textfile")
+args = parser.parse_args()
+if args.dry_run and args.since is not None:
+    # 期間をいくつに分けるかは取得した件数で決まるので, 使うクォータを前もって見積もれない
+    parser.error("--dry-run cannot be combined with --since")
 
 load_dotenv()
 
-API_KEY = os.getenv('API_KEY')
+API_KEYS = api_keys_from_env()
 
 ng_words = [
     "short", "shorts",
 ]
-yt_scraper = YouTubeSearchScraper("yt_data", API_KEY, ng_words)
+yt_scraper = YouTubeSearchScraper("yt_data", API_KEYS, ng_words)
+
+searches = [
+    # VTuber自己紹介動画
+    ("VTuber自己紹介", "rating"),
+    ("VTuber自己紹介", "date"),
+    ("VTuber自己紹介", "relevance"),
+
+    # 新人VTuber
+    ("新人VTuber", "rating"),
+    ("新人VTuber", "date"),
+    ("新人VTuber", "relevance"),
+]
 
-# VTuber自己紹介動画
-yt_scraper.search("VTuber自己紹介", order="rating")
-yt_scraper.search("VTuber自己紹介", order="date")
-yt_scraper.search("VTuber自己紹介", order="relevance")
+with get_shared_metrics().exporting(args.metrics):
+    if args.dry_run:
+        cost = yt_scraper.estimate_cost(searches, args.max_page)
+        print(f"{len(searches)} searches will cost at most {cost} units, {yt_scraper.key_pool.remaining()} units remain today")
+    elif args.since is not None:
+        since = datetime.datetime.combine(args.since, datetime.time(), datetime.timezone.utc)
+        now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        searcher = TimeWindowSearch(yt_scraper, yt_scraper.logger, worker_n=args.workers)
+        for query in dict.fromkeys(query for query, _ in searches):
+            # 途中まで検索していれば, そのときの期間で続きを取る
+            window = yt_scraper.window_bounds(query, "date", since, now)
+            # 期間内は新しい順に取る. 最初は1年ごとに分けておく
+            if not searcher.search(query, "date", window, initial_split=max(1, (window[1] - window[0]).days // 365)):
+                break
+            yt_scraper.end_window_search(query, "date")
+    else:
+        # vpost で取得済みのチャンネルは見つけても新しいとみなさない
+        VPOST_DETAIL_PATH = "vpost_data/detail_data.json"
+        vpost_ids = {d.youtube_id for d in iter_detail_datum(VPOST_DETAIL_PATH)} if os.path.exists(VPOST_DETAIL_PATH) else set()
 
+        planner = SearchPlanner(
+            yt_scraper, yt_scraper.logger,
+            min_new_channels=args.min_new_channels, patience=args.patience, max_page=args.max_page,
+            known_channel_ids=vpost_ids
+        )
+        planner.run(searches)
 
-# 新人VTuber
-yt_scraper.search("新人VTuber", order="rating")
-yt_scraper.search("新人VTuber", order="date")
-yt_scraper.search("新人VTuber", order="relevance")
+    if not args.dry_run:
+        # 最後に取得し終えた分をまとめておく
+        yt_scraper.compact()
@@ -0,0 +1,219 @@
+"""dataclass ごとに専用の encode / decode 関数を生成する
+
+`dataclasses.asdict` は入れ子の dataclass やリストを再帰的に deepcopy し, `from_json` は dict を書き換えながら
+日時を1つずつパースする. ここではフィールドの型から, そのクラス専用の関数をソースコードとして組み立てて exec する.
+- 入れ子の dataclass, そのリスト, `X | None`, `X | MissingValue` のような Enum との union, datetime に対応する
+- encode は `asdict` してから `json.dump(..., default=date_handler)` したのと同じ JSON になる値を返す
+- decode は JSON から読んだ dict を書き換えない
+- orjson が入っていれば, JSON のパース (`loads`) に使う. 書き出しは今のファイルとバイト単位で一致させるため標準の json のまま
+"""
+
+import enum
+import json
+import types
+import datetime
+import dataclasses
+from typing import Any, Callable, Generic, TypeVar, Union, get_args, get_origin, get_type_hints
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+T = TypeVar("T")
+
+_use_orjson = orjson is not None
+
+def use_orjson(enabled: bool) -> bool:
+    """パースに orjson を使うかを切り替える. orjson が入っていなければ常に False. 切り替えた後の値を返す"""
+    global _use_orjson
+    _use_orjson = enabled and orjson is not None
+    return _use_orjson
+
+def loads(text: str | bytes) -> Any:
+    """orjson があれば orjson でパースする"""
+    if _use_orjson:
+        return orjson.loads(text)
+    return json.loads(text)
+
+@dataclasses.dataclass(frozen=True)
+class DatetimeFormat:
+    """datetime のフィールドを文字列にする方法と戻す方法"""
+    encode: Callable[[datetime.datetime], str]
+    decode: Callable[[str], datetime.datetime]
+
+ISO_DATETIME = DatetimeFormat(datetime.datetime.isoformat, datetime.datetime.fromisoformat)
+
+def strftime_format(fmt: str) -> DatetimeFormat:
+    """`%Y/%m/%d %H:%M` のような固定長の書式. よく使う書式は strptime を通さずに切り出す"""
+    if fmt == "%Y/%m/%d %H:%M":
+        def decode(s: str) -> datetime.datetime:
+            if len(s) == 16 and s[4] == "/" and s[7] == "/" and s[10] == " " and s[13] == ":":
+                return datetime.datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16]))
+            return datetime.datetime.strptime(s, fmt)
+
+        def encode(d: datetime.datetime) -> str:
+            if d.year < 1000:
+                # 4桁未満の年の %Y はプラットフォームによって違う
+                return d.strftime(fmt)
+            return f"{d.year:04d}/{d.month:02d}/{d.day:02d} {d.hour:02d}:{d.minute:02d}"
+        return DatetimeFormat(encode, decode)
+
+    return DatetimeFormat(lambda d: d.strftime(fmt), lambda s: datetime.datetime.strptime(s, fmt))
+
+def is_dataclass_type(tp: Any) -> bool:
+    return isinstance(tp, type) and dataclasses.is_dataclass(tp)
+
+def is_enum_type(tp: Any) -> bool:
+    return isinstance(tp, type) and issubclass(tp, enum.Enum)
+
+def union_args(tp: Any) -> tuple | None:
+    if get_origin(tp) in (Union, types.UnionType):
+        return get_args(tp)
+    return None
+
+class Codec(Generic[T]):
+    """cls 専用の encode / decode
+
+    Args:
+        datetime_format (DatetimeFormat): datetime のフィールドの書式. 入れ子の dataclass にも使う.
+        codecs (dict[type, Codec] | None): 入れ子の dataclass に使う Codec. ないものは同じ datetime_format で作る.
+        post_decode (Callable[[T], Any] | None): decode した後に通す. `from_json` が値を検査しているクラス用.
+        defaults (dict[str, Any] | None): 古いファイルにはないことがあるキーと, そのときの値.
+    """
+    def __init__(self,
+        cls: type[T], datetime_format: DatetimeFormat = ISO_DATETIME,
+        codecs: "dict[type, Codec] | None" = None,
+        post_decode: Callable[[T], Any] | None = None,
+        defaults: dict[str, Any] | None = None
+    ) -> None:
+        self.cls = cls
+        self.datetime_format = datetime_format
+        self.codecs = codecs if codecs is not None else {}
+        self.codecs.setdefault(cls, self)
+        self.post_decode = post_decode
+        self.defaults = defaults or {}
+
+        self.__namespace: dict[str, Any] = {"cls": cls}
+        self.source = self.__generate()
+        exec(self.source, self.__namespace)
+        self.encode: Callable[[T], dict] = self.__namespace["encode"]
+        self.decode: Callable[[dict], T] = self.__namespace["decode"]
+        if post_decode is not None:
+            decode = self.decode
+            self.decode = lambda d: post_decode(decode(d))
+
+    def __name(self, value: Any, prefix: str) -> str:
+        """生成するコードから参照する値を名前空間に置く"""
+        for name, v in self.__namespace.items():
+            if v is value and name.startswith(prefix):
+                return name
+        name = f"{prefix}{len(self.__namespace)}"
+        self.__namespace[name] = value
+        return name
+
+    def __nested(self, tp: type) -> "Codec":
+        if tp not in self.codecs:
+            # 自分自身を含む型でも無限に作らないように, 作る前に codecs を共有する
+            self.codecs[tp] = Codec(tp, self.datetime_format, self.codecs)
+        return self.codecs[tp]
+
+    def __encode_expr(self, tp: Any, v: str) -> str:
+        args = union_args(tp)
+        if args is not None:
+            expr = v
+            non_none = [a for a in args if a is not type(None)]
+            enums = [a for a in non_none if is_enum_type(a)]
+            others = [a for a in non_none if not is_enum_type(a)]
+            if len(others) == 1:
+                expr = self.__encode_expr(others[0], v)
+            elif others:
+                expr = f"{self.__name(self.__encode_any, 'encode_any_')}({v})"
+            for e in enums:
+                expr = f"({v}.value if {v}.__class__ is {self.__name(e, 'enum_')} else {expr})"
+            if type(None) in args and expr != v:
+                expr = f"(None if {v} is None else {expr})"
+            return expr
+
+        if tp is datetime.datetime:
+            return f"{self.__name(self.datetime_format.encode, 'dt_encode_')}({v})"
+        if is_dataclass_type(tp):
+            return f"{self.__name(self.__nested(tp), 'codec_')}.encode({v})"
+        if is_enum_type(tp):
+            return f"{v}.value"
+        if get_origin(tp) is list:
+            (item_tp,) = get_args(tp) or (Any,)
+            item_expr = self.__encode_expr(item_tp, "x")
+            return v if item_expr == "x" else f"[{item_expr} for x in {v}]"
+        return v
+
+    def __encode_any(self, v: Any) -> Any:
+        """型から決められない値. asdict と同じように dataclass なら辿る"""
+        if is_dataclass_type(type(v)):
+            return self.__nested(type(v)).encode(v)
+        if isinstance(v, datetime.datetime):
+            return self.datetime_format.encode(v)
+        if isinstance(v, enum.Enum):
+            return v.value
+        return v
+
+    def __decode_expr(self, tp: Any, v: str) -> str:
+        args = union_args(tp)
+        if args is not None:
+            non_none = [a for a in args if a is not type(None)]
+            enums = [a for a in non_none if is_enum_type(a)]
+            others = [a for a in non_none if not is_enum_type(a)]
+            expr = self.__decode_expr(others[0], v) if len(others) == 1 else v
+            for e in enums:
+                members = self.__name(e._value2member_map_, "members_")
+                expr = f"({members}[{v}] if {v}.__class__ is str and {v} in {members} else {expr})"
+            if type(None) in args and expr != v:
+                expr = f"(None if {v} is None else {expr})"
+            return expr
+
+        if tp is datetime.datetime:
+            return f"{self.__name(self.datetime_format.decode, 'dt_decode_')}({v})"
+        if is_dataclass_type(tp):
+            return f"{self.__name(self.__nested(tp), 'codec_')}.decode({v})"
+        if is_enum_type(tp):
+            return f"{self.__name(tp, 'enum_')}({v})"
+        if get_origin(tp) is list:
+            (item_tp,) = get_args(tp) or (Any,)
+            item_expr = self.__decode_expr(item_tp, "x")
+            return f"list({v})" if item_expr == "x" else f"[{item_expr} for x in {v}]"
+        return v
+
+    def __generate(self) -> str:
+        hints = get_type_hints(self.cls)
+        fields = dataclasses.fields(self.cls)
+
+        encode_items = []
+        decode_lines = []
+        decode_args = []
+        for i, f in enumerate(fields):
+            tp = hints[f.name]
+            encode_items.append(f"{f.name!r}: {self.__encode_expr(tp, f'obj.{f.name}')}")
+
+            if f.name in self.defaults:
+                get = f"d.get({f.name!r}, {self.__name(self.defaults[f.name], 'default_')})"
+            elif f.default is not dataclasses.MISSING:
+                get = f"d.get({f.name!r}, {self.__name(f.default, 'default_')})"
+            elif f.default_factory is not dataclasses.MISSING:
+                get = f"(d[{f.name!r}] if {f.name!r} in d else {self.__name(f.default_factory, 'factory_')}())"
+            else:
+                get = f"d[{f.name!r}]"
+            expr = self.__decode_expr(tp, f"v{i}")
+            if expr == f"v{i}":
+                decode_args.append(get)
+            else:
+                decode_lines.append(f"    v{i} = {get}")
+                decode_args.append(expr)
+
+        return "\n".join([
+            "def encode(obj):",
+            "    return {" + ", ".join(encode_items) + "}",
+            "",
+            "def decode(d):",
+            *decode_lines,
+            "    return cls(" + ", ".join(decode_args) + ")",
+        ])
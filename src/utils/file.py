@@ -1,11 +1,60 @@
 from ast import Call
 from turtle import shape
-from typing import Any, Callable
+from typing import Any, Callable, Iterable, Iterator
+import re
 import json
 import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from .codec import loads
 
 PathLike = str | bytes | os.PathLike
 
+def fsync_path(path: PathLike) -> None:
+    """path (ファイルでもディレクトリでもよい) をディスクに書き出す. rename した後はディレクトリも書き出すこと"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # ディレクトリを開けないプラットフォーム (Windows) もある
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+@contextmanager
+def lock_file(lock_path: PathLike):
+    """lock_path を使って, 別のプロセスと排他的に処理する. lock_path 自体は消さずに使い回す"""
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            # Windows は先頭の1バイトをロックする. 取れるまで待つ
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
 def load_json(json_path: PathLike) -> Any:
     with open(json_path, 'r', encoding='utf-8') as f:
         return json.load(f)
@@ -20,4 +69,126 @@ def save_json(json_path: PathLike, save_obj: Any, date_handler: Callable[[Any],
         else:
             json.dump(
                 save_obj, f, ensure_ascii=False, default=date_handler
-            )
\ No newline at end of file
+            )
+# JSON Lines
+## 1行1レコードの JSON. 全体を読み込まなくても先頭から順に使える
+JSONL_SUFFIX = ".jsonl"
+READ_CHUNK_SIZE = 1 << 16
+
+def is_jsonl(json_path: PathLike) -> bool:
+    """拡張子が .jsonl か, 最初の行がそれだけで1つの JSON オブジェクトになっていれば JSON Lines とみなす
+
+    今までの JSON ファイルはレコードの配列で, 整形してあれば最初の行は `[` だけになる.
+    """
+    if os.fsdecode(json_path).endswith(JSONL_SUFFIX):
+        return True
+    if not os.path.exists(json_path):
+        return False
+    with open(json_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith("{"):
+                return False
+            try:
+                return isinstance(json.loads(line), dict)
+            except json.JSONDecodeError:
+                return False
+    return False
+
+def iter_jsonl(json_path: PathLike) -> Iterator[Any]:
+    with open(json_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+def iter_json_array(json_path: PathLike, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Any]:
+    """JSON の配列を要素ごとに返す. ファイル全体ではなく, 読み込み中の要素の分だけメモリを使う
+
+    chunk_size 以下の小さいファイル (チャンネルごとの投稿動画リストなど) はまとめてパースする.
+    """
+    if os.path.getsize(json_path) <= chunk_size:
+        with open(json_path, 'rb') as f:
+            array = loads(f.read())
+        if not isinstance(array, list):
+            raise ValueError(f"{json_path} is not a JSON array")
+        yield from array
+        return
+
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"[\s,]*")
+    with open(json_path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{json_path} is not a JSON array")
+        pos = 1
+        eof = False
+
+        def fill() -> bool:
+            """読んだ分を捨てて続きを読む. もう読むものがなければ False"""
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return bool(chunk)
+
+        while True:
+            # 要素の間の空白とカンマを飛ばす
+            pos = whitespace.match(buffer, pos).end()
+            if pos == len(buffer):
+                if not fill():
+                    raise ValueError(f"{json_path} ends before the array is closed")
+                continue
+            if buffer[pos] == "]":
+                return
+
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if fill():
+                    continue
+                raise
+            if end == len(buffer) and not eof and fill():
+                # 数値などはバッファの終わりで途切れているかもしれない
+                continue
+            pos = end
+            yield obj
+
+def iter_json_records(json_path: PathLike) -> Iterator[Any]:
+    """JSON の配列か JSON Lines かを判定して, レコードを1つずつ返す"""
+    if is_jsonl(json_path):
+        return iter_jsonl(json_path)
+    return iter_json_array(json_path)
+
+def save_records(json_path: PathLike, records: Iterable[Any], date_handler: Callable[[Any], Any] | None = None, shape_output: bool = True) -> None:
+    """拡張子が .jsonl なら JSON Lines, それ以外は save_json と同じ形式で, records を1つずつ書き出す"""
+    with open(json_path, 'w', encoding='utf-8') as f:
+        if os.fsdecode(json_path).endswith(JSONL_SUFFIX):
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=date_handler))
+                f.write("\n")
+            return
+
+        # json.dump(list, indent=4) と同じ出力になるように, 要素ごとに字下げして書く
+        empty = True
+        for record in records:
+            if shape_output:
+                text = json.dumps(record, ensure_ascii=False, indent=4, separators=(',', ': '), default=date_handler)
+                f.write(("[\n    " if empty else ",\n    ") + text.replace("\n", "\n    "))
+            else:
+                f.write(("[" if empty else ", ") + json.dumps(record, ensure_ascii=False, default=date_handler))
+            empty = False
+        f.write("[]" if empty else ("\n]" if shape_output else "]"))
+
+def convert_records(src_path: PathLike, dst_path: PathLike, shape_output: bool = True) -> int:
+    """src_path のレコードを dst_path の拡張子の形式で書き出す. レコード数を返す"""
+    n = 0
+    def counted(records: Iterable[Any]) -> Iterator[Any]:
+        nonlocal n
+        for record in records:
+            n += 1
+            yield record
+    save_records(dst_path, counted(iter_json_records(src_path)), shape_output=shape_output)
+    return n
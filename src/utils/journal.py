@@ -0,0 +1,124 @@
+"""追記専用のチェックポイント (ジャーナル)
+
+取得したレコードを1行1つの JSON で追記していき, 最後に既存の JSON 形式のファイルにまとめる (compact).
+途中で止まっても, 保存済みの JSON にジャーナルを上書きで重ねれば取得済みの状態に戻せる.
+"""
+
+import os
+import json
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator
+
+from .file import PathLike, fsync_path
+
+def truncate_partial_line(path: PathLike, block_size: int = 1 << 16) -> int:
+    """最後の改行より後 (書き込み途中で止まった行) を切り詰める. 切り詰めたバイト数を返す"""
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            i = f.read(end - start).rfind(b"\n")
+            if i >= 0:
+                end = start + i + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+        return size - end
+
+class Journal:
+    def __init__(self, journal_path: PathLike, date_handler: Callable[[Any], Any] | None = None) -> None:
+        self.journal_path = journal_path
+        self.date_handler = date_handler
+
+        self.__file = None
+        self.__lock = threading.RLock()
+
+    def replay(self) -> Iterator[dict]:
+        """書き込まれたエントリを古い順に返す. 書き込み途中で止まった最終行は捨てる"""
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+
+        for i, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                if i == len(lines) - 1:
+                    break
+                raise
+
+    def append(self, entries: Iterable[dict]) -> None:
+        """追記する. ディスクに書かれるのは flush したとき
+
+        最初に開くときに, 書き込み途中で止まった最終行を切り詰める. 残したまま追記すると次の行とつながって, replay で読めなくなる.
+        """
+        with self.__lock:
+            if self.__file is None:
+                os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+                if os.path.exists(self.journal_path):
+                    truncate_partial_line(self.journal_path)
+                self.__file = open(self.journal_path, "a", encoding="utf-8")
+            for entry in entries:
+                self.__file.write(json.dumps(entry, ensure_ascii=False, default=self.date_handler))
+                self.__file.write("\n")
+
+    def flush(self) -> None:
+        with self.__lock:
+            if self.__file is None:
+                return
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+    def compact(self, save: Callable[[PathLike], None], save_path: PathLike) -> None:
+        """save で save_path にまとめて書き出し, ジャーナルを空にする
+
+        書き出しは一時ファイルに行い, ディスクに書き出してから置き換えるので, 途中で止まっても元のファイルとジャーナルは残る.
+        """
+        self.close()
+        temp_path = f"{save_path}.tmp"
+        save(temp_path)
+        fsync_path(temp_path)
+        os.replace(temp_path, save_path)
+        fsync_path(os.path.dirname(os.path.abspath(save_path)))
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    @contextmanager
+    def flush_on_sigint(self):
+        """Ctrl-C で止めたときに, バッファに残っているエントリを書き出してから止める"""
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+
+        previous_handler = signal.getsignal(signal.SIGINT)
+
+        def handler(signum, frame):
+            self.flush()
+            if callable(previous_handler):
+                previous_handler(signum, frame)
+            else:
+                raise KeyboardInterrupt
+
+        signal.signal(signal.SIGINT, handler)
+        try:
+            yield
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
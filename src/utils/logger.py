@@ -2,6 +2,9 @@ import logging
 
 def get_logger(modname: str, loglevel=logging.DEBUG) -> logging.Logger:
     logger  = logging.getLogger(modname)
+    if logger.handlers:
+        # 2回目以降はハンドラーを足さない. 足すと同じ行が何回も出力される
+        return logger
     handler = logging.StreamHandler()
     handler.setLevel(loglevel)
     logger.setLevel(loglevel)
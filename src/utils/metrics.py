@@ -0,0 +1,289 @@
+"""スクレイパー, コレクター, DatasetBuilder, VideoDownloader で共有するメトリクス
+
+カウンタ (リクエスト数, ページ数, クォータのユニット数, 書き込んだバイト数など),
+レイテンシのヒストグラム, 進捗 (件数 / 秒, 残り時間) を1か所に集めて,
+JSON か Prometheus の textfile (node_exporter の textfile collector 用) に書き出す.
+```python
+metrics = get_shared_metrics()
+metrics.counter("youtube_pages_total", method="search").inc()
+with metrics.histogram("http_request_seconds", host=host).time():
+    ...
+with metrics.exporting("metrics.prom"):
+    run()
+```
+"""
+
+import os
+import json
+import time
+import math
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+from .file import PathLike
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+"""レイテンシ [s] のヒストグラムの上端"""
+
+Labels = tuple[tuple[str, str], ...]
+
+def format_labels(labels: Labels, extra: dict[str, str] | None = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f"{k}=\"{v}\"" for (k, _), v in zip(pairs, escaped)) + "}"
+
+def format_duration(seconds: float | None) -> str:
+    if seconds is None or math.isinf(seconds):
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+class Counter:
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, n: float = 1) -> None:
+        with self.__lock:
+            self.value += n
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.clock = clock
+        self.__lock = threading.Lock()
+        self.counts = [0] * len(self.buckets)
+        """各バケットに入った数 (累積ではない). 上端を超えた分は +Inf として count から求める"""
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        with self.__lock:
+            self.count += 1
+            self.sum += value
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        """with の中身にかかった時間を記録する. 例外で抜けても記録する"""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(self.clock() - start)
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """(上端, その値以下の数). 最後は +Inf"""
+        with self.__lock:
+            result = []
+            total = 0
+            for upper, n in zip(self.buckets, self.counts):
+                total += n
+                result.append((upper, total))
+            result.append((math.inf, self.count))
+            return result
+
+class Progress:
+    """total 件のうち何件終わったか. 件数 / 秒と残り時間 (ETA) を出す"""
+    def __init__(self,
+        name: str, total: int | None, clock: Callable[[], float] = time.monotonic,
+        logger: logging.Logger | None = None, log_interval: float = 10.0
+    ) -> None:
+        """
+        Args:
+            logger (logging.Logger | None): 渡すと log_interval 秒に1回まで進捗を info で出す
+        """
+        self.name = name
+        self.total = total
+        self.clock = clock
+        self.logger = logger
+        self.log_interval = log_interval
+
+        self.__lock = threading.Lock()
+        self.done = 0
+        self.started_at = clock()
+        self.__logged_at = self.started_at
+
+    def advance(self, n: int = 1) -> None:
+        with self.__lock:
+            self.done += n
+            now = self.clock()
+            should_log = self.logger is not None and (now - self.__logged_at >= self.log_interval or self.done == self.total)
+            if should_log:
+                self.__logged_at = now
+        if should_log:
+            self.logger.info(str(self))
+
+    def elapsed(self) -> float:
+        return self.clock() - self.started_at
+
+    def rate(self) -> float:
+        """1秒あたりの件数"""
+        elapsed = self.elapsed()
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> float | None:
+        """残りの秒数. total がないか, まだ1件も終わっていなければ None"""
+        if self.total is None:
+            return None
+        rate = self.rate()
+        if rate == 0:
+            return None if self.done < self.total else 0.0
+        return max(0, self.total - self.done) / rate
+
+    def __str__(self) -> str:
+        total = "?" if self.total is None else self.total
+        return f"{self.name}: {self.done}/{total} ({self.rate():.2f}/s, ETA {format_duration(self.eta())})"
+
+class MetricsRegistry:
+    """名前とラベルごとのカウンタ, ヒストグラム, 進捗. スレッドセーフ"""
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.__lock = threading.Lock()
+        self.__counters: dict[str, dict[Labels, Counter]] = {}
+        self.__histograms: dict[str, dict[Labels, Histogram]] = {}
+        self.__progresses: dict[str, Progress] = {}
+        self.__help: dict[str, str] = {}
+
+    def describe(self, name: str, help: str) -> None:
+        """Prometheus の `# HELP` に出す説明"""
+        with self.__lock:
+            self.__help[name] = help
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self.__lock:
+            return self.__counters.setdefault(name, {}).setdefault(key, Counter())
+
+    def histogram(self, name: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: str) -> Histogram:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self.__lock:
+            return self.__histograms.setdefault(name, {}).setdefault(key, Histogram(buckets))
+
+    def progress(self, name: str, total: int | None, logger: logging.Logger | None = None, log_interval: float = 10.0) -> Progress:
+        """name の進捗を新しく始める. 同じ name の前の進捗は置き換える"""
+        progress = Progress(name, total, self.clock, logger, log_interval)
+        with self.__lock:
+            self.__progresses[name] = progress
+        return progress
+
+    def to_json(self) -> dict:
+        with self.__lock:
+            counters = {name: dict(series) for name, series in self.__counters.items()}
+            histograms = {name: dict(series) for name, series in self.__histograms.items()}
+            progresses = list(self.__progresses.values())
+        return {
+            "counters": {
+                name: [{"labels": dict(labels), "value": c.value} for labels, c in series.items()]
+                for name, series in counters.items()
+            },
+            "histograms": {
+                name: [
+                    {
+                        "labels": dict(labels), "count": h.count, "sum": h.sum,
+                        "buckets": [[upper if not math.isinf(upper) else "+Inf", n] for upper, n in h.cumulative()],
+                    }
+                    for labels, h in series.items()
+                ]
+                for name, series in histograms.items()
+            },
+            "progress": {
+                p.name: {
+                    "done": p.done, "total": p.total, "elapsed_seconds": p.elapsed(),
+                    "items_per_second": p.rate(), "eta_seconds": p.eta(),
+                }
+                for p in progresses
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        snapshot = self.to_json()
+        lines = []
+
+        def header(name: str, kind: str) -> None:
+            if name in self.__help:
+                lines.append(f"# HELP {name} {self.__help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name, series in sorted(snapshot["counters"].items()):
+            header(name, "counter")
+            for s in series:
+                lines.append(f"{name}{format_labels(tuple(s['labels'].items()))} {s['value']:g}")
+
+        for name, series in sorted(snapshot["histograms"].items()):
+            header(name, "histogram")
+            for s in series:
+                labels = tuple(s["labels"].items())
+                for upper, n in s["buckets"]:
+                    lines.append(f"{name}_bucket{format_labels(labels, {'le': upper if upper == '+Inf' else f'{upper:g}'})} {n}")
+                lines.append(f"{name}_sum{format_labels(labels)} {s['sum']:g}")
+                lines.append(f"{name}_count{format_labels(labels)} {s['count']}")
+
+        # 進捗は task ラベル付きの gauge にまとめる
+        gauges = {
+            "progress_done": "done", "progress_total": "total",
+            "progress_items_per_second": "items_per_second", "progress_eta_seconds": "eta_seconds",
+        }
+        for gauge, key in gauges.items():
+            values = [(name, p[key]) for name, p in sorted(snapshot["progress"].items()) if p[key] is not None]
+            if not values:
+                continue
+            header(gauge, "gauge")
+            for name, value in values:
+                lines.append(f"{gauge}{format_labels((('task', name),))} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: PathLike) -> None:
+        """拡張子が .json なら JSON, それ以外は Prometheus の textfile で書き出す. 読み手が途中の状態を見ないように置き換える"""
+        path = str(path)
+        if path.endswith(".json"):
+            text = json.dumps(self.to_json(), ensure_ascii=False, indent=4)
+        else:
+            text = self.to_prometheus()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+    @contextmanager
+    def exporting(self, path: PathLike | None, interval: float = 15.0):
+        """with の間 interval 秒ごとに path へ書き出し, 抜けるときにもう一度書き出す. path が None なら何もしない"""
+        if path is None:
+            yield
+            return
+
+        stopped = threading.Event()
+        def loop() -> None:
+            while not stopped.wait(interval):
+                self.export(path)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+            self.export(path)
+
+
+_shared_metrics: MetricsRegistry | None = None
+_shared_lock = threading.Lock()
+
+def get_shared_metrics() -> MetricsRegistry:
+    """スクレイパーやコレクターで共有するデフォルトのレジストリ"""
+    global _shared_metrics
+    with _shared_lock:
+        if _shared_metrics is None:
+            _shared_metrics = MetricsRegistry()
+        return _shared_metrics
@@ -0,0 +1,152 @@
+"""ホストごとのリクエスト間隔を調整するトークンバケット
+
+固定の `time.sleep` の代わりに使う. 応答が速ければ上限 (max_rate) まで徐々にレートを上げ,
+応答が遅い / エラーが返ってきたらレートを下げる (AIMD).
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable
+from urllib.parse import urlparse
+
+from .metrics import MetricsRegistry, get_shared_metrics
+
+def url_to_host(url: str) -> str:
+    return urlparse(url).netloc or url
+
+class HostBucket:
+    """1ホスト分の状態"""
+    def __init__(self, rate: float, burst: float, max_concurrency: int, now: float) -> None:
+        self.rate = rate
+        """1秒あたりのリクエスト数"""
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+        self.request_n = 0
+        self.error_n = 0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+class HostRateLimiter:
+    """ホストをキーにしたトークンバケット. スレッドセーフ"""
+
+    def __init__(self,
+        initial_rate: float = 0.5, min_rate: float = 0.05, max_rate: float = 2.0,
+        burst: float = 1.0, max_concurrency: int = 2,
+        target_latency: float = 2.0, increase_step: float = 0.05, decrease_factor: float = 0.5,
+        clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep,
+        metrics: MetricsRegistry | None = None
+    ) -> None:
+        """
+        Args:
+            initial_rate (float): 最初のレート [req/s].
+            min_rate (float): エラーが続いてもこれ以下には下げない.
+            max_rate (float): レートの上限. 応答が速くてもこれ以上は上げない.
+            burst (float): 溜められるトークンの数.
+            max_concurrency (int): ホストごとの同時リクエスト数の上限.
+            target_latency (float): 応答時間がこれを超えたらレートを下げる [s].
+            increase_step (float): 速く応答が返ってきたときに足すレート.
+            decrease_factor (float): エラーのときにレートに掛ける値. 遅いときはその平方根を掛ける.
+            metrics (MetricsRegistry | None): ホストごとのリクエスト数と応答時間を記録する. None なら共有のもの.
+        """
+        self.initial_rate = min(initial_rate, max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+
+        self.clock = clock
+        self.sleep = sleep
+        self.metrics = metrics or get_shared_metrics()
+
+        self.__lock = threading.Lock()
+        self.__buckets: dict[str, HostBucket] = {}
+
+    def __bucket(self, host: str) -> HostBucket:
+        with self.__lock:
+            if host not in self.__buckets:
+                self.__buckets[host] = HostBucket(
+                    self.initial_rate, self.burst, self.max_concurrency, self.clock()
+                )
+            return self.__buckets[host]
+
+    def rate(self, url: str) -> float:
+        return self.__bucket(url_to_host(url)).rate
+
+    def acquire(self, url: str) -> None:
+        """トークンが溜まるまで待つ"""
+        bucket = self.__bucket(url_to_host(url))
+        while True:
+            with self.__lock:
+                now = self.clock()
+                bucket.refill(now)
+                if bucket.tokens >= 1.0:
+                    bucket.tokens -= 1.0
+                    bucket.request_n += 1
+                    return
+                wait = (1.0 - bucket.tokens) / bucket.rate
+            self.sleep(wait)
+
+    def report(self, url: str, latency: float | None = None, error: bool = False) -> None:
+        """リクエストの結果からレートを調整する. latency が None なら応答時間は見ない"""
+        bucket = self.__bucket(url_to_host(url))
+        with self.__lock:
+            bucket.refill(self.clock())
+            if error:
+                bucket.error_n += 1
+                bucket.rate *= self.decrease_factor
+            elif latency is not None and latency > self.target_latency:
+                bucket.rate *= self.decrease_factor ** 0.5
+            else:
+                bucket.rate += self.increase_step
+            bucket.rate = min(self.max_rate, max(self.min_rate, bucket.rate))
+
+    @contextmanager
+    def request(self, url: str, use_latency: bool = True):
+        """with の中身を1リクエストとして, 待機とレートの調整をする
+
+        中で例外が出たらエラーとしてレートを下げる. ホストのせいではない失敗 (パース失敗など) は
+        with の外で扱うこと.
+        """
+        host = url_to_host(url)
+        bucket = self.__bucket(host)
+        with bucket.semaphore:
+            self.acquire(url)
+            self.metrics.counter("http_requests_total", host=host).inc()
+            start = self.clock()
+            try:
+                yield
+            except BaseException:
+                self.metrics.counter("http_request_errors_total", host=host).inc()
+                self.report(url, error=True)
+                raise
+            latency = self.clock() - start
+            self.metrics.histogram("http_request_seconds", host=host).observe(latency)
+            self.report(url, latency if use_latency else None)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        with self.__lock:
+            return {
+                host: {"rate": b.rate, "request_n": b.request_n, "error_n": b.error_n}
+                for host, b in self.__buckets.items()
+            }
+
+
+_shared_rate_limiter: HostRateLimiter | None = None
+_shared_lock = threading.Lock()
+
+def get_shared_rate_limiter() -> HostRateLimiter:
+    """スクレイパーやダウンローダーで共有するデフォルトのリミッター"""
+    global _shared_rate_limiter
+    with _shared_lock:
+        if _shared_rate_limiter is None:
+            _shared_rate_limiter = HostRateLimiter()
+        return _shared_rate_limiter
@@ -0,0 +1,43 @@
+"""レコード型 (dataclass) の別の形を作る
+
+取得したデータのレコード型は普通の `@dataclass` のままにしてある (属性を後から足すコードや pickle 済みのデータのため).
+ここでは同じフィールドで slots にした型や frozen にした型を作る.
+- `Slotted*`: インスタンスごとの `__dict__` を持たない. 大量に読み込むときにメモリを減らす
+- `Frozen*`: slots + frozen. 読み込んだ後に書き換えないデータをスレッドやキャッシュで共有したり,
+  set や dict のキーにしたりするときに使う. `__init__` が遅い (3倍ほど)
+```python
+SlottedYouTubeVideoData = variant(YouTubeVideoData)
+FrozenYouTubeVideoData = variant(YouTubeVideoData, frozen=True)
+```
+"""
+
+import dataclasses
+from typing import TypeVar
+
+T = TypeVar("T")
+
+def variant(cls: type[T], *, slots: bool = True, frozen: bool = False, name: str | None = None) -> type[T]:
+    """cls と同じフィールドとデフォルト値で, slots と frozen を指定した dataclass を作る
+
+    `from_json` などのクラスメソッドも引き継ぐので, `from_json` / `asdict` はそのまま使える.
+    入れ子のフィールドの型は元のまま.
+    """
+    fields = []
+    for f in dataclasses.fields(cls):
+        kwargs = {}
+        if f.default is not dataclasses.MISSING:
+            kwargs["default"] = f.default
+        if f.default_factory is not dataclasses.MISSING:
+            kwargs["default_factory"] = f.default_factory
+        fields.append((f.name, f.type, dataclasses.field(**kwargs)))
+
+    namespace = {
+        key: value for key, value in vars(cls).items()
+        if isinstance(value, (classmethod, staticmethod))
+    }
+    if name is None:
+        name = ("Frozen" if frozen else "Slotted" if slots else "") + cls.__name__
+    new_cls = dataclasses.make_dataclass(name, fields, namespace=namespace, frozen=frozen, slots=slots)
+    new_cls.__module__ = cls.__module__
+    new_cls.__doc__ = cls.__doc__
+    return new_cls
@@ -0,0 +1,167 @@
+"""WebDriver の生成と使い回し
+
+- `ChromeDriverManager().install()` はバージョン確認の通信が走るので, 解決したパスをキャッシュする
+- デフォルトで headless. 画像, CSS, フォント, 広告などは CDP でブロックする
+- page load strategy は eager (DOMContentLoaded で戻る)
+- 使い終わった WebDriver はプールに戻して, 別のスクレイパーで使い回す
+"""
+
+import os
+import json
+import time
+import atexit
+import pathlib
+import threading
+
+from selenium import webdriver
+from selenium.common.exceptions import SessionNotCreatedException, WebDriverException
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+DRIVER_CACHE_PATH = pathlib.Path.home().joinpath(".cache", "vtuber-scraper", "chromedriver.json")
+
+BLOCKED_URL_PATTERNS = (
+    # 画像, CSS, フォント
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf",
+    # サムネイルと広告, 解析
+    "*ytimg.com*", "*ggpht.com*",
+    "*googlesyndication.com*", "*doubleclick.net*", "*adservice.google.*",
+    "*google-analytics.com*", "*googletagmanager.com*", "*amazon-adsystem.com*",
+)
+
+class WebDriverFactory:
+    """Chrome の WebDriver を作って使い回す. スレッドセーフ"""
+
+    DRIVER_CACHE_TTL = 24 * 60 * 60
+    """chromedriver のパスを再解決するまでの秒数. Chrome の更新に追従するため"""
+
+    def __init__(self,
+        headless: bool = True, block_resources: bool = True,
+        blocked_url_patterns: tuple[str, ...] = BLOCKED_URL_PATTERNS,
+        page_load_strategy: str = "eager",
+        driver_cache_path: pathlib.Path = DRIVER_CACHE_PATH
+    ) -> None:
+        self.headless = headless
+        self.block_resources = block_resources
+        self.blocked_url_patterns = blocked_url_patterns
+        self.page_load_strategy = page_load_strategy
+        self.driver_cache_path = driver_cache_path
+
+        self.__lock = threading.Lock()
+        self.__driver_path: str | None = None
+        self.__idle_drivers: list[webdriver.Chrome] = []
+
+    def __load_cached_driver_path(self) -> str | None:
+        if not os.path.exists(self.driver_cache_path):
+            return None
+        with open(self.driver_cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if time.time() - cache["resolved_at"] > self.DRIVER_CACHE_TTL:
+            return None
+        if not os.path.isfile(cache["path"]):
+            return None
+        return cache["path"]
+
+    def driver_path(self, refresh: bool = False) -> str:
+        with self.__lock:
+            if self.__driver_path and not refresh:
+                return self.__driver_path
+
+            path = None if refresh else self.__load_cached_driver_path()
+            if path is None:
+                path = ChromeDriverManager().install()
+                os.makedirs(self.driver_cache_path.parent, exist_ok=True)
+                with open(self.driver_cache_path, "w", encoding="utf-8") as f:
+                    json.dump({"path": path, "resolved_at": time.time()}, f)
+
+            self.__driver_path = path
+            return path
+
+    def options(self) -> webdriver.ChromeOptions:
+        options = webdriver.ChromeOptions()
+        options.page_load_strategy = self.page_load_strategy
+        if self.headless:
+            options.add_argument("--headless=new")
+        options.add_argument("--window-size=1280,2000")
+        options.add_argument("--disable-extensions")
+        if self.block_resources:
+            options.add_experimental_option("prefs", {
+                "profile.managed_default_content_settings.images": 2,
+            })
+        return options
+
+    def create(self) -> webdriver.Chrome:
+        """新しい WebDriver を立ち上げる"""
+        try:
+            driver = webdriver.Chrome(service=ChromeService(self.driver_path()), options=self.options())
+        except SessionNotCreatedException:
+            # Chrome が更新されてキャッシュした chromedriver と合わなくなった
+            driver = webdriver.Chrome(service=ChromeService(self.driver_path(refresh=True)), options=self.options())
+
+        if self.block_resources:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(self.blocked_url_patterns)})
+        return driver
+
+    def acquire(self) -> webdriver.Chrome:
+        """プールに空きがあればそれを, なければ新しく立ち上げて返す"""
+        while True:
+            with self.__lock:
+                if not self.__idle_drivers:
+                    break
+                driver = self.__idle_drivers.pop()
+            if is_alive(driver):
+                return driver
+            discard(driver)
+        return self.create()
+
+    def release(self, driver: webdriver.Chrome) -> None:
+        """使い終わった WebDriver をプールに戻す"""
+        with self.__lock:
+            self.__idle_drivers.append(driver)
+
+    def quit_all(self) -> None:
+        with self.__lock:
+            drivers, self.__idle_drivers = self.__idle_drivers, []
+        for driver in drivers:
+            discard(driver)
+
+def is_alive(driver: webdriver.Chrome) -> bool:
+    try:
+        driver.current_url
+        return True
+    except WebDriverException:
+        return False
+
+def discard(driver: webdriver.Chrome) -> None:
+    """落ちているかもしれない WebDriver を後始末する"""
+    try:
+        driver.quit()
+    except WebDriverException:
+        pass
+
+_shared_factory: WebDriverFactory | None = None
+_shared_lock = threading.Lock()
+
+def get_driver_factory() -> WebDriverFactory:
+    """スクレイパー間で共有するデフォルトの factory"""
+    global _shared_factory
+    with _shared_lock:
+        if _shared_factory is None:
+            _shared_factory = WebDriverFactory()
+        return _shared_factory
+
+def set_driver_factory(factory: WebDriverFactory) -> None:
+    """headless をやめるときなど, 共有の factory を差し替える"""
+    global _shared_factory
+    with _shared_lock:
+        if _shared_factory is not None:
+            _shared_factory.quit_all()
+        _shared_factory = factory
+
+@atexit.register
+def _quit_shared_drivers() -> None:
+    # プールに残っている WebDriver を終了時に閉じる
+    if _shared_factory is not None:
+        _shared_factory.quit_all()
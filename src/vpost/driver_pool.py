@@ -0,0 +1,137 @@
+"""複数の WebDriver で並列にスクレイピングするためのワーカープール"""
+
+import queue
+import logging
+import threading
+from typing import Callable, Generic, TypeVar
+
+from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+T = TypeVar("T")
+
+class DriverWorker:
+    """1スレッドが専有する WebDriver. 必要になるまで起動しない"""
+    def __init__(self,
+        create_driver: Callable[[], webdriver.Chrome],
+        release_driver: Callable[[webdriver.Chrome], None] | None = None
+    ) -> None:
+        """
+        Args:
+            release_driver: 使い終わった WebDriver を返す先. None なら quit する.
+        """
+        self.create_driver = create_driver
+        self.release_driver = release_driver
+        self.__driver: webdriver.Chrome | None = None
+
+    @property
+    def driver(self) -> webdriver.Chrome:
+        if self.__driver is None:
+            self.__driver = self.create_driver()
+        return self.__driver
+
+    def quit(self) -> None:
+        if self.__driver is None:
+            return
+        if self.release_driver is not None:
+            self.release_driver(self.__driver)
+        else:
+            self.__driver.quit()
+        self.__driver = None
+
+    def restart(self) -> None:
+        """落ちた WebDriver を捨てて, 次に driver を触ったときに立ち上げ直す"""
+        if self.__driver is None:
+            return
+        try:
+            self.__driver.quit()
+        except WebDriverException:
+            # 落ちたブラウザの後始末なので失敗しても気にしない
+            pass
+        self.__driver = None
+
+class DriverWorkerPool(Generic[T]):
+    """WebDriver を持つワーカーを N 個立ち上げ, 共有キューから取り出した対象を処理する
+
+    ブラウザが落ちた場合は, そのワーカーの WebDriver を再起動して対象をキューに戻す.
+    """
+
+    MAX_RETRY = 2
+
+    def __init__(self,
+        worker_n: int,
+        create_driver: Callable[[], webdriver.Chrome],
+        scrape: Callable[[DriverWorker, str], T],
+        logger: logging.Logger,
+        release_driver: Callable[[webdriver.Chrome], None] | None = None
+    ) -> None:
+        self.worker_n = max(1, worker_n)
+        self.create_driver = create_driver
+        self.release_driver = release_driver
+        self.scrape = scrape
+        self.logger = logger
+
+        self.__lock = threading.Lock()
+
+    def run(self, targets: list[str], on_result: Callable[[str, T], None]) -> list[str]:
+        """targets を全て処理する. on_result はロックの内側で呼ぶ. 失敗した対象を返す"""
+        target_queue: queue.Queue[tuple[str, int]] = queue.Queue()
+        for target in targets:
+            target_queue.put((target, 0))
+
+        failed: list[str] = []
+        workers = [DriverWorker(self.create_driver, self.release_driver) for _ in range(min(self.worker_n, len(targets)))]
+        threads = [
+            threading.Thread(target=self.__work, args=(worker, target_queue, on_result, failed), daemon=True)
+            for worker in workers
+        ]
+        self.logger.info(f"start {len(threads)} workers for {len(targets)} targets")
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return failed
+
+    def __work(self,
+        worker: DriverWorker, target_queue: "queue.Queue[tuple[str, int]]",
+        on_result: Callable[[str, T], None], failed: list[str]
+    ) -> None:
+        try:
+            while True:
+                try:
+                    target, retry_n = target_queue.get_nowait()
+                except queue.Empty:
+                    return
+
+                try:
+                    result = self.scrape(worker, target)
+
+                except (NoSuchElementException, LookupError) as e:
+                    # ページの構造が想定と違うだけなので, やり直しても変わらない
+                    self.logger.warning(f"failed to parse {target}: {e!r}")
+                    with self.__lock:
+                        failed.append(target)
+                    continue
+
+                except WebDriverException as e:
+                    self.logger.warning(f"driver crashed at {target}: {e!r}")
+                    worker.restart()
+                    if retry_n < self.MAX_RETRY:
+                        target_queue.put((target, retry_n + 1))
+                    else:
+                        with self.__lock:
+                            failed.append(target)
+                    continue
+
+                except Exception as e:
+                    self.logger.warning(f"error at {target}: {e!r}")
+                    with self.__lock:
+                        failed.append(target)
+                    continue
+
+                self.logger.debug(f"scraped {target}")
+                with self.__lock:
+                    on_result(target, result)
+        finally:
+            worker.quit()
@@ -0,0 +1,121 @@
+"""ページ内の全行を `execute_script` 1回で取り出すための JS と, その結果の変換
+
+`find_element` / `get_attribute` は1回ごとに chromedriver との往復が発生するので,
+行ごとのフィールドをブラウザ側でまとめて JSON にしてから Python で dataclass にする.
+"""
+
+import re
+
+from .vtuber_data import VTuberData, VTuberDetails, VideoData
+
+_TEXT_HELPER = """
+const textOf = (root, cls) => {
+    const elm = root.getElementsByClassName(cls)[0];
+    return elm ? elm.innerText : null;
+};
+"""
+
+LIST_ROWS_SCRIPT = _TEXT_HELPER + """
+const list = document.getElementsByClassName("vtuber_list")[0];
+if (!list) { return null; }
+return Array.from(list.getElementsByClassName("clearfix")).map(row => {
+    const channel = row.getElementsByClassName("channel")[0];
+    const link = channel ? channel.getElementsByTagName("a")[0] : null;
+    return {
+        name: textOf(row, "name"),
+        youtube_link: link ? link.getAttribute("href") : null,
+        regist: textOf(row, "regist"),
+        play: textOf(row, "play"),
+        upload: textOf(row, "upload"),
+        group: textOf(row, "group"),
+    };
+});
+"""
+"""一覧ページの `.vtuber_list .clearfix` を全て dict にして返す"""
+
+DETAIL_SCRIPT = _TEXT_HELPER + """
+let twitterId = null;
+for (const group of document.getElementsByClassName("group")) {
+    const text = group.innerText;
+    if (text.includes("Twitter") && text.includes("@")) {
+        const link = group.getElementsByTagName("a")[0];
+        twitterId = link ? link.innerText : null;
+    }
+}
+const videos = [];
+for (const movieList of document.getElementsByClassName("movie_list")) {
+    for (const row of movieList.getElementsByClassName("clearfix")) {
+        const title = row.getElementsByClassName("title")[0];
+        const link = title ? title.getElementsByTagName("a")[0] : null;
+        videos.push({
+            video_id: link ? link.getAttribute("videoid") : null,
+            title: link ? link.innerText : null,
+            time: textOf(row, "time"),
+            play: textOf(row, "play"),
+            eval: textOf(row, "eval"),
+        });
+    }
+}
+return {description: textOf(document, "desc"), twitter_id: twitterId, videos: videos};
+"""
+"""個人ページの説明文, Twitter id, 動画一覧を dict にして返す"""
+
+
+def to_int(text: str, *units: str) -> int:
+    for unit in units:
+        text = text.replace(unit, "")
+    return int(text.replace(",", ""))
+
+def required(row: dict, key: str) -> str:
+    """Selenium の find_element と同じく, 要素がなければ LookupError"""
+    value = row.get(key)
+    if value is None:
+        raise LookupError(f"element not found: {key}")
+    return value
+
+YOUTUBE_CHANNEL_PATTERN = re.compile(r"channel/([\d\w-]+)")
+
+def row_to_vtuber_data(row: dict) -> VTuberData:
+    match = YOUTUBE_CHANNEL_PATTERN.search(required(row, "youtube_link"))
+
+    return VTuberData(
+        name=required(row, "name"),
+
+        youtube_id=match.groups()[0],
+
+        registrants_n=to_int(required(row, "regist"), "人"),
+        play_times=to_int(required(row, "play"), "回"),
+        upload_videos=to_int(required(row, "upload"), "本"),
+
+        group_name=required(row, "group"),
+    )
+
+def row_to_videodata(row: dict) -> VideoData | None:
+    try:
+        # timestamp をよしなに変換する処理を from_json にしか作ってないのでとりあえず
+        return VideoData.from_json({
+            "video_id": required(row, "video_id"),
+            "title": required(row, "title"),
+            "timestamp": required(row, "time"),
+            "view_n": to_int(required(row, "play"), "回"),
+            "good": to_int(required(row, "eval")),
+        })
+    except (ValueError, LookupError):
+        # timestamp が壊れてるデータがあるとエラーになる
+        # 面倒くさいので、フォーマットが乱れてるデータは無視
+        return None
+
+def rows_to_vtuber_datum(rows: list[dict] | None) -> list[VTuberData]:
+    if rows is None:
+        raise LookupError("element not found: vtuber_list")
+    return list(map(row_to_vtuber_data, rows))
+
+def detail_to_vtuber_details(youtube_id: str, detail: dict) -> VTuberDetails:
+    video_list = [row_to_videodata(row) for row in detail["videos"]]
+
+    return VTuberDetails(
+        youtube_id=youtube_id,
+        description=required(detail, "description"),
+        twitter_id=detail.get("twitter_id"),
+        recent_videos=[v for v in video_list if v is not None]
+    )
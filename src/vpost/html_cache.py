@@ -0,0 +1,163 @@
+"""vpost から取得した HTML をそのまま保存しておくキャッシュ
+
+本文は内容のハッシュ (sha256) をファイル名にして gzip で保存し, 同じ内容は1つにまとめる.
+どの URL (キー) がいつどの本文だったかは `index.jsonl` に追記していく.
+パーサーを直したときは, ネットワークに繋がずにキャッシュから `vtuber_data.json` / `detail_data.json` を作り直せる.
+index.jsonl も本文も追記するだけでは増え続けるので, `prune` で古い履歴と使っていない本文を消す.
+"""
+
+import os
+import gzip
+import time
+import json
+import pathlib
+import hashlib
+import threading
+from dataclasses import dataclass, asdict
+
+from utils.file import PathLike
+from utils.metrics import MetricsRegistry, get_shared_metrics
+
+LIST_PAGE_KIND = "list"
+DETAIL_PAGE_KIND = "detail"
+
+def list_page_key(order: int, limit: int, page_num: int) -> str:
+    """一覧ページは POST なので, 検索条件とページ番号をキーにする"""
+    return f"list?order={order}&limit={limit}&page={page_num}"
+
+@dataclass
+class CacheEntry:
+    key: str
+    kind: str
+    sha256: str
+    fetched_at: float
+    """UNIX time"""
+    meta: dict
+
+class HtmlCache:
+    INDEX_FILE_NAME = "index.jsonl"
+    OBJECTS_DIR = "objects"
+
+    def __init__(self, cache_dir: PathLike, ttl: float | None = 7 * 24 * 60 * 60, metrics: MetricsRegistry | None = None) -> None:
+        """
+        Args:
+            ttl (float | None): これより古いキャッシュは `get` で返さない [s]. None なら期限なし.
+            metrics (MetricsRegistry | None): 書き込んだバイト数の記録先. None なら共有のもの.
+        """
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.index_path = self.cache_dir.joinpath(self.INDEX_FILE_NAME)
+        self.objects_dir = self.cache_dir.joinpath(self.OBJECTS_DIR)
+        self.ttl = ttl
+        self.metrics = metrics or get_shared_metrics()
+
+        self.__lock = threading.Lock()
+        self.entries: dict[str, CacheEntry] = {}
+        """key ごとの最新のエントリ"""
+        self.__used_at: dict[str, float] = {}
+        """key ごとに, このプロセスで最後に `get` で返した時刻. prune で最近使ったものを残すのに使う"""
+        self.__load_index()
+
+    def __load_index(self) -> None:
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = CacheEntry(**json.loads(line))
+                except json.JSONDecodeError:
+                    # 書き込み途中で止まった行
+                    continue
+                self.entries[entry.key] = entry
+
+    def __object_path(self, sha256: str) -> pathlib.Path:
+        return self.objects_dir.joinpath(sha256[:2], f"{sha256}.html.gz")
+
+    def put(self, key: str, kind: str, html: str, **meta) -> CacheEntry:
+        """html を保存する. meta には youtube_id や page_num など, 作り直すときに必要な値を入れる"""
+        body = html.encode("utf-8")
+        sha256 = hashlib.sha256(body).hexdigest()
+        object_path = self.__object_path(sha256)
+        entry = CacheEntry(key, kind, sha256, time.time(), meta)
+
+        with self.__lock:
+            if not os.path.exists(object_path):
+                os.makedirs(object_path.parent, exist_ok=True)
+                temp_path = f"{object_path}.tmp"
+                with gzip.open(temp_path, "wb") as f:
+                    f.write(body)
+                os.replace(temp_path, object_path)
+                self.metrics.counter("bytes_written_total", kind="html_cache").inc(os.path.getsize(object_path))
+
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(entry), ensure_ascii=False) + "\n")
+            self.entries[key] = entry
+
+        return entry
+
+    def read(self, entry: CacheEntry) -> str:
+        with gzip.open(self.__object_path(entry.sha256), "rb") as f:
+            return f.read().decode("utf-8")
+
+    def get(self, key: str) -> str | None:
+        """期限内のキャッシュがあれば返す"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry.fetched_at > self.ttl:
+            return None
+        self.__used_at[key] = time.time()
+        return self.read(entry)
+
+    def latest_entries(self, kind: str) -> list[CacheEntry]:
+        """kind の各キーの最新のエントリを, 取得した順に返す"""
+        entries = [e for e in self.entries.values() if e.kind == kind]
+        return sorted(entries, key=lambda e: e.fetched_at)
+
+    def size(self) -> int:
+        """本文のファイルの合計バイト数"""
+        return sum(path.stat().st_size for path in self.objects_dir.glob("*/*.html.gz"))
+
+    def prune(self, max_bytes: int | None = None, max_age: float | None = None) -> int:
+        """古いキャッシュを消して, 消したバイト数を返す
+
+        - index.jsonl を各キーの最新のエントリだけに書き直す (履歴を捨てる)
+        - max_age [s] より前に取得したエントリを消す
+        - 本文の合計が max_bytes 以下になるように, 最後に使った (`put` か `get`) のが古いキーから消す
+        - どのキーからも指されていない本文を消す
+        """
+        with self.__lock:
+            now = time.time()
+            entries = [e for e in self.entries.values() if max_age is None or now - e.fetched_at <= max_age]
+            entries.sort(key=lambda e: max(e.fetched_at, self.__used_at.get(e.key, 0.0)), reverse=True)
+
+            # 最近使ったものから詰めていく. 同じ本文は1回だけ数える
+            sizes: dict[str, int] = {}
+            kept: list[CacheEntry] = []
+            total = 0
+            for entry in entries:
+                if entry.sha256 not in sizes:
+                    object_path = self.__object_path(entry.sha256)
+                    if not os.path.exists(object_path):
+                        continue
+                    size = os.path.getsize(object_path)
+                    if max_bytes is not None and total + size > max_bytes:
+                        continue
+                    sizes[entry.sha256] = size
+                    total += size
+                kept.append(entry)
+            kept.sort(key=lambda e: e.fetched_at)
+
+            temp_path = f"{self.index_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for entry in kept:
+                    f.write(json.dumps(asdict(entry), ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.index_path)
+            self.entries = {e.key: e for e in kept}
+            self.__used_at = {key: t for key, t in self.__used_at.items() if key in self.entries}
+
+            removed = 0
+            for path in self.objects_dir.glob("*/*"):
+                if path.name.removesuffix(".html.gz") not in sizes:
+                    removed += path.stat().st_size
+                    os.remove(path)
+        return removed
@@ -0,0 +1,82 @@
+"""vpost をブラウザなしで叩くための HTTP クライアント
+
+静的な HTML を読むだけなので, Selenium を使わずに requests のコネクションプールで取得する.
+"""
+
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.rate_limiter import HostRateLimiter, get_shared_rate_limiter
+from .parser import parse_search_form, find_checkbox_value
+
+VTUBER_DATABASE_URL = "https://vtuber-post.com/database/index.php"
+
+def VTuber_detail_url(youtube_id: str) -> str:
+    return f"https://vtuber-post.com/database/detail.php?id={youtube_id}"
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0 Safari/537.36"
+
+class VPostHttpClient:
+    """vpost の一覧ページ (検索フォームの POST) と個人ページを取得する"""
+
+    PAGE_FIELD_NAME = "page"
+    """`FormSubmit(n)` がセットするページ番号のフィールド. 値は 0 始まり"""
+
+    def __init__(self,
+        pool_size: int = 4, timeout: float = 30.0,
+        rate_limiter: HostRateLimiter | None = None
+    ) -> None:
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=Retry(total=3, backoff_factor=1.0, status_forcelist=(500, 502, 503, 504))
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.form_action: str | None = None
+        self.form_fields: dict[str, str] | None = None
+        self.non_movie_value: str | None = None
+
+    def __request(self, method: str, url: str, **kwargs) -> str:
+        with self.rate_limiter.request(url):
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            response.raise_for_status()
+        response.encoding = response.apparent_encoding or response.encoding
+        return response.text
+
+    def get_index(self) -> str:
+        html = self.__request("GET", VTUBER_DATABASE_URL)
+        action, self.form_fields = parse_search_form(html)
+        self.form_action = urljoin(VTUBER_DATABASE_URL, action or "")
+        self.non_movie_value = find_checkbox_value(html, "non_movie")
+        return html
+
+    def post_search(self, page_num: int, limit: int, order: int, non_movie: bool = True) -> str:
+        """検索フォームに条件とページ番号を入れて送信. page_num は 1 始まり"""
+        if self.form_fields is None:
+            self.get_index()
+
+        fields = dict(self.form_fields)
+        fields["limit"] = str(limit)
+        fields["order"] = str(order)
+        if non_movie and self.non_movie_value is not None:
+            fields["non_movie"] = self.non_movie_value
+        else:
+            fields.pop("non_movie", None)
+        fields[self.PAGE_FIELD_NAME] = str(page_num - 1)
+
+        return self.__request("POST", self.form_action, data=fields)
+
+    def get_detail(self, youtube_id: str) -> str:
+        return self.__request("GET", VTuber_detail_url(youtube_id))
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,244 @@
+"""vpost のページの HTML を Selenium なしでパースする
+
+Selenium 版 (`scraper.element_to_vtuber_data` など) と同じ class 名を辿って,
+`extract_script` と同じ形の dict を作り, 同じ変換で dataclass を組み立てる.
+"""
+
+import re
+from html.parser import HTMLParser
+
+from .vtuber_data import VTuberData, VTuberDetails, VideoData
+from .extract_script import row_to_vtuber_data, row_to_videodata, detail_to_vtuber_details
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+class HTMLNode:
+    """必要最低限の DOM ノード"""
+    def __init__(self, tag: str, attrs: dict[str, str], parent: "HTMLNode | None" = None) -> None:
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children: list["HTMLNode | str"] = []
+
+    @property
+    def classes(self) -> list[str]:
+        return self.attrs.get("class", "").split()
+
+    def get_attribute(self, name: str) -> str | None:
+        return self.attrs.get(name)
+
+    def iter(self):
+        for child in self.children:
+            if isinstance(child, HTMLNode):
+                yield child
+                yield from child.iter()
+
+    def find_all(self, class_name: str | None = None, tag: str | None = None) -> list["HTMLNode"]:
+        return [
+            node for node in self.iter()
+            if (class_name is None or class_name in node.classes)
+            and (tag is None or node.tag == tag)
+        ]
+
+    def find(self, class_name: str | None = None, tag: str | None = None) -> "HTMLNode":
+        """見つからなければ LookupError, Selenium の find_element と同じ扱い"""
+        for node in self.iter():
+            if (class_name is None or class_name in node.classes) \
+                and (tag is None or node.tag == tag):
+                return node
+        raise LookupError(f"element not found: class={class_name}, tag={tag}")
+
+    def __raw_text(self) -> str:
+        texts = []
+        for child in self.children:
+            if isinstance(child, str):
+                texts.append(child)
+            elif child.tag == "br":
+                texts.append("\n")
+            elif child.tag not in ("script", "style"):
+                texts.append(child.__raw_text())
+        return "".join(texts)
+
+    @property
+    def text(self) -> str:
+        """Selenium の `.text` に寄せて, 行ごとに空白を詰めたテキスト"""
+        lines = [" ".join(line.split()) for line in self.__raw_text().split("\n")]
+        return "\n".join(lines).strip()
+
+    @property
+    def outer_html(self) -> str:
+        attrs = "".join(f' {k}="{v}"' for k, v in self.attrs.items())
+        inner = "".join(
+            c if isinstance(c, str) else c.outer_html for c in self.children
+        )
+        if self.tag in VOID_ELEMENTS:
+            return f"<{self.tag}{attrs}>"
+        return f"<{self.tag}{attrs}>{inner}</{self.tag}>"
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.root = HTMLNode("document", {})
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        node = HTMLNode(tag, {k: v or "" for k, v in attrs}, self.stack[-1])
+        self.stack[-1].children.append(node)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        node = HTMLNode(tag, {k: v or "" for k, v in attrs}, self.stack[-1])
+        self.stack[-1].children.append(node)
+
+    def handle_endtag(self, tag):
+        # 閉じタグの抜けがあっても, 対応する開始タグまで戻る
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+def parse_html(html: str) -> HTMLNode:
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def _text_of(node: HTMLNode, class_name: str) -> str | None:
+    found = node.find_all(class_name)
+    return found[0].text if found else None
+
+def node_to_row(node: HTMLNode) -> dict:
+    """一覧ページの1行を `extract_script.LIST_ROWS_SCRIPT` と同じ形の dict にする"""
+    links = [a for channel in node.find_all("channel") for a in channel.find_all(tag="a")]
+    return {
+        "name": _text_of(node, "name"),
+        "youtube_link": links[0].get_attribute("href") if links else None,
+        "regist": _text_of(node, "regist"),
+        "play": _text_of(node, "play"),
+        "upload": _text_of(node, "upload"),
+        "group": _text_of(node, "group"),
+    }
+
+def node_to_video_row(node: HTMLNode) -> dict:
+    links = [a for title in node.find_all("title") for a in title.find_all(tag="a")]
+    return {
+        "video_id": links[0].get_attribute("videoid") if links else None,
+        "title": links[0].text if links else None,
+        "time": _text_of(node, "time"),
+        "play": _text_of(node, "play"),
+        "eval": _text_of(node, "eval"),
+    }
+
+def node_to_vtuber_data(node: HTMLNode) -> VTuberData:
+    return row_to_vtuber_data(node_to_row(node))
+
+def node_to_videodata(node: HTMLNode) -> VideoData | None:
+    return row_to_videodata(node_to_video_row(node))
+
+FORM_SUBMIT_PATTERN = re.compile(r"FormSubmit\(([\d]+)\)")
+
+def extract_page_num(node: HTMLNode) -> int | None:
+    """ページ送りのリンクからページ番号を取り出す. FormSubmit の引数は 0 始まり"""
+    match = FORM_SUBMIT_PATTERN.search(node.outer_html)
+    if not match:
+        return None
+    return int(match.groups()[0]) + 1
+
+class ListPage:
+    """一覧ページ1枚分のパース結果"""
+    def __init__(self, vtuber_datum: list[VTuberData], page_num: int, last_page_num: int) -> None:
+        self.vtuber_datum = vtuber_datum
+        self.page_num = page_num
+        self.last_page_num = last_page_num
+
+    @property
+    def has_next(self) -> bool:
+        return self.page_num < self.last_page_num
+
+def parse_list_page(html: str) -> ListPage:
+    """想定した構造でなければ LookupError. 数値が読めないときも LookupError にして, 呼び出し側で Selenium に切り替えられるようにする"""
+    try:
+        return _parse_list_page(html)
+    except ValueError as e:
+        raise LookupError(f"unexpected list page: {e}") from e
+
+def _parse_list_page(html: str) -> ListPage:
+    root = parse_html(html)
+    vtuber_list = root.find("vtuber_list")
+    vtuber_datum = list(map(node_to_vtuber_data, vtuber_list.find_all("clearfix")))
+
+    page_num = int(root.find("now").text)
+    linked_pages = [
+        extract_page_num(link)
+        for pagenation in root.find_all("pagenation")
+        for link in pagenation.find_all(tag="a")
+    ]
+    last_page_num = max([page_num] + [p for p in linked_pages if p is not None])
+
+    return ListPage(vtuber_datum, page_num, last_page_num)
+
+def parse_detail_page(html: str, youtube_id: str) -> VTuberDetails:
+    root = parse_html(html)
+
+    twitter_id = None
+    for link_elm in root.find_all("group"):
+        if "Twitter" in link_elm.text and "@" in link_elm.text:
+            twitter_id = link_elm.find(tag="a").text
+
+    return detail_to_vtuber_details(youtube_id, {
+        "description": root.find("desc").text,
+        "twitter_id": twitter_id,
+        "videos": [
+            node_to_video_row(elm)
+            for movie_list in root.find_all("movie_list")
+            for elm in movie_list.find_all("clearfix")
+        ],
+    })
+
+def parse_search_form(html: str, submit_id: str = "search_submit") -> tuple[str | None, dict[str, str]]:
+    """検索フォームの action と, 送信される初期値を取り出す"""
+    root = parse_html(html)
+    form = None
+    for node in root.find_all(tag="form"):
+        if any(n.get_attribute("id") == submit_id for n in node.iter()):
+            form = node
+            break
+    if form is None:
+        raise LookupError("search form not found")
+
+    fields: dict[str, str] = {}
+    for node in form.iter():
+        name = node.get_attribute("name")
+        if not name:
+            continue
+
+        if node.tag == "input":
+            input_type = node.get_attribute("type") or "text"
+            if input_type in ("submit", "button", "image", "reset"):
+                continue
+            if input_type in ("checkbox", "radio") and "checked" not in node.attrs:
+                continue
+            fields[name] = node.get_attribute("value") or ""
+
+        elif node.tag == "select":
+            options = node.find_all(tag="option")
+            selected = [o for o in options if "selected" in o.attrs] or options[:1]
+            if selected:
+                fields[name] = selected[0].get_attribute("value") or selected[0].text
+
+    return form.get_attribute("action"), fields
+
+def find_checkbox_value(html: str, name: str) -> str | None:
+    """チェックを入れたときに送られる値"""
+    for node in parse_html(html).find_all(tag="input"):
+        if node.get_attribute("name") == name:
+            return node.get_attribute("value") or "on"
+    return None
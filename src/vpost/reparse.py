@@ -0,0 +1,32 @@
+"""HTML キャッシュから vpost のデータを作り直す. ネットワークには繋がない"""
+
+import logging
+
+from .html_cache import HtmlCache, LIST_PAGE_KIND, DETAIL_PAGE_KIND
+from .parser import parse_list_page, parse_detail_page
+from .vtuber_data import VTuberData, VTuberDetails
+
+def reparse_vtuber_datum(cache: HtmlCache, logger: logging.Logger) -> list[VTuberData]:
+    """一覧ページのキャッシュを取得した順にパースし, youtube_id ごとに新しい値で上書きする"""
+    vtuber_dict: dict[str, VTuberData] = {}
+    for entry in cache.latest_entries(LIST_PAGE_KIND):
+        try:
+            page = parse_list_page(cache.read(entry))
+        except (LookupError, ValueError) as e:
+            logger.warning(f"failed to parse {entry.key}: {e!r}")
+            continue
+
+        for data in page.vtuber_datum:
+            vtuber_dict[data.youtube_id] = data
+
+    return list(vtuber_dict.values())
+
+def reparse_detail_datum(cache: HtmlCache, logger: logging.Logger) -> list[VTuberDetails]:
+    detail_datum = []
+    for entry in cache.latest_entries(DETAIL_PAGE_KIND):
+        try:
+            detail_datum.append(parse_detail_page(cache.read(entry), entry.meta["youtube_id"]))
+        except (LookupError, ValueError) as e:
+            logger.warning(f"failed to parse {entry.key}: {e!r}")
+
+    return detail_datum
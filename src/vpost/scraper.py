@@ -2,24 +2,58 @@ import os
 import pathlib
 import json
 import re
-import time
+import logging
+import threading
+from dataclasses import asdict
+from enum import Enum, unique
+from typing import Callable
 
 from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.select import Select
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions
 
-from .vtuber_data import VTuberData, load_detail_datum, load_vtuber_datum, save_vtuber_datum, VTuberDetails, VideoData, save_detail_datum
+from utils.logger import get_logger
+from utils.journal import Journal
+from utils.rate_limiter import HostRateLimiter, get_shared_rate_limiter
+from utils.metrics import MetricsRegistry, Progress, get_shared_metrics
+from .driver import get_driver_factory
+from .driver_pool import DriverWorker, DriverWorkerPool
+from .vtuber_data import VTuberData, iter_detail_datum, iter_vtuber_datum, load_vtuber_datum, save_vtuber_datum, VTuberDetails, VideoData, save_detail_datum, date_handler
+from .http_client import VTUBER_DATABASE_URL, VTuber_detail_url, VPostHttpClient
+from .parser import FORM_SUBMIT_PATTERN, parse_list_page, parse_detail_page
+from .html_cache import HtmlCache, LIST_PAGE_KIND, DETAIL_PAGE_KIND, list_page_key
+from .extract_script import LIST_ROWS_SCRIPT, DETAIL_SCRIPT, rows_to_vtuber_datum, detail_to_vtuber_details
 
-VTUBER_DATABASE_URL = "https://vtuber-post.com/database/index.php"
+@unique
+class Backend(str, Enum):
+    """ページの取得方法"""
 
-def VTuber_detail_url(youtube_id: str) -> str:
-    return f"https://vtuber-post.com/database/detail.php?id={youtube_id}"
+    Selenium = "selenium"
+    """Chrome で開いて読む. JS が必要なページにも対応できる"""
+
+    Http = "http"
+    """HTTP で HTML だけ取得してパースする. 失敗したら Selenium にフォールバック"""
+
+@unique
+class Extraction(str, Enum):
+    """Selenium でページから値を取り出す方法"""
+
+    Element = "element"
+    """行ごと, フィールドごとに find_element する. 1フィールド1往復"""
+
+    Script = "script"
+    """execute_script 1回でページ内の全行を JSON にして受け取る"""
 
 def get_web_driver() -> webdriver.Chrome:
-    return webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()))
+    """共有のプールから WebDriver を借りる. 使い終わったら release_web_driver で返す"""
+    return get_driver_factory().acquire()
+
+def release_web_driver(web_driver: webdriver.Chrome) -> None:
+    get_driver_factory().release(web_driver)
 
 def element_to_vtuber_data(web_element: WebElement) -> VTuberData:
     name = web_element.find_element(by=By.CLASS_NAME, value="name").text
@@ -71,31 +105,172 @@ def element_to_videodata(web_element: WebElement) -> VideoData:
         return None
 
 
+def elements_to_vtuber_details(web_driver: webdriver.Chrome, youtube_id: str) -> VTuberDetails:
+    description = web_driver.find_element(by=By.CLASS_NAME, value="desc").text
+
+    twitter_id = None
+    link_elms = web_driver.find_elements(by=By.CLASS_NAME, value="group")
+    for link_elm in link_elms:
+        if "Twitter" in link_elm.text and "@" in link_elm.text:
+            twitter_id = link_elm.find_element(by=By.TAG_NAME, value="a").text
+
+    # video data
+    movie_list_elms = web_driver.find_elements(by=By.CLASS_NAME, value="movie_list")
+    video_elms = [elms.find_elements(by=By.CLASS_NAME, value="clearfix") for elms in movie_list_elms]
+    video_list = [list(map(lambda elm: element_to_videodata(elm), elm_list)) for elm_list in video_elms]
+    video_list = sum(video_list, [])
+    video_list = list(filter(lambda x: x is not None, video_list))
+
+    return VTuberDetails(
+        youtube_id=youtube_id,
+        description=description,
+        twitter_id=twitter_id,
+        recent_videos=video_list
+    )
+
+def extract_vtuber_datum(web_driver: webdriver.Chrome, extraction: Extraction = Extraction.Script) -> list[VTuberData]:
+    """表示中の一覧ページの全行を取り出す"""
+    if extraction == Extraction.Script:
+        return rows_to_vtuber_datum(web_driver.execute_script(LIST_ROWS_SCRIPT))
+
+    vtuber_list = web_driver.find_element(by=By.CLASS_NAME, value="vtuber_list")
+    vtuber_elms = vtuber_list.find_elements(by=By.CLASS_NAME, value="clearfix")
+    return list(map(element_to_vtuber_data, vtuber_elms))
+
+def extract_vtuber_details(web_driver: webdriver.Chrome, youtube_id: str, extraction: Extraction = Extraction.Script) -> VTuberDetails:
+    """表示中の個人ページから詳細情報を取り出す"""
+    if extraction == Extraction.Script:
+        return detail_to_vtuber_details(youtube_id, web_driver.execute_script(DETAIL_SCRIPT))
+
+    return elements_to_vtuber_details(web_driver, youtube_id)
+
+def scrape_detail_page(
+    web_driver: webdriver.Chrome, youtube_id: str,
+    extraction: Extraction = Extraction.Script, rate_limiter: HostRateLimiter | None = None
+) -> VTuberDetails:
+    url = VTuber_detail_url(youtube_id)
+    with (rate_limiter or get_shared_rate_limiter()).request(url):
+        web_driver.get(url)
+    # パースの失敗はホストのせいではないので, レートの調整には含めない
+    return extract_vtuber_details(web_driver, youtube_id, extraction)
+
 
 STATE_DATA_FILE_NAME = "state.json"
 VTUBER_DATA_FILE_NAME = "vtuber_data.json"
 DETAIL_DATA_FILE_NAME = "detail_data.json"
+VTUBER_DATA_JOURNAL_NAME = "vtuber_data.journal.jsonl"
+DETAIL_DATA_JOURNAL_NAME = "detail_data.journal.jsonl"
+
+REFRESH_COUNTERS = ("registrants_n", "play_times", "upload_videos")
+
+def update_counters(known: VTuberData, latest: VTuberData) -> bool:
+    """登録者数などのカウンタを latest の値で更新する. 変わったものがあれば True"""
+    changed = False
+    for name in REFRESH_COUNTERS:
+        value = getattr(latest, name)
+        if value is not None and getattr(known, name) != value:
+            setattr(known, name, value)
+            changed = True
+    return changed
+
+def load_saved_vtuber_dict(save_dir: pathlib.Path) -> dict[str, VTuberData]:
+    """vtuber_data.json にまだまとめていないジャーナルの分も重ねて読み込む"""
+    vtuber_data_json_path = save_dir.joinpath(VTUBER_DATA_FILE_NAME)
+    vtuber_dict: dict[str, VTuberData] = {}
+    if os.path.exists(vtuber_data_json_path):
+        vtuber_dict = {d.youtube_id: d for d in iter_vtuber_datum(vtuber_data_json_path)}
+
+    for entry in Journal(save_dir.joinpath(VTUBER_DATA_JOURNAL_NAME)).replay():
+        data = VTuberData.from_json(entry)
+        vtuber_dict[data.youtube_id] = data
+    return vtuber_dict
 
 class VTuberListScraper:
+    """一覧ページを1ページずつ取得する
+
+    取得した行は `vtuber_data.journal.jsonl` に追記し, ページごとに state.json を更新する.
+    `save` でジャーナルを `vtuber_data.json` にまとめる. 同じ youtube_id は上書きするので, 再開時に重複しない.
+
+    refresh=True なら新しい順に取得して, 取得済みの youtube_id が KNOWN_RUN_LIMIT 件続いたところで止める.
+    取得済みの VTuber は登録者数などのカウンタだけ更新する.
+    """
 
-    SAVE_PERIOD = 10
     ITEM_LIMIT = 100
+    NEWEST_FIRST = 1
     OLDEST_FIRST = 2
-
-    def __init__(self, save_dir: str) -> None:
+    PAGE_LOAD_TIMEOUT = 30
+    KNOWN_RUN_LIMIT = 200
+    """refresh で, 取得済みの VTuber がこれだけ続いたら以降は取得済みとみなす"""
+
+    def __init__(self,
+        save_dir: str, backend: Backend = Backend.Selenium,
+        extraction: Extraction = Extraction.Script,
+        page_range: tuple[int, int] | None = None,
+        rate_limiter: HostRateLimiter | None = None,
+        refresh: bool = False,
+        html_cache: HtmlCache | None = None,
+        metrics: MetricsRegistry | None = None,
+        logger: logging.Logger | None = None
+    ) -> None:
+        """
+        Args:
+            page_range (tuple[int, int] | None): 取得するページの範囲 (両端を含む). None なら最後まで.
+            rate_limiter (HostRateLimiter | None): None なら他のスクレイパーと共有のものを使う.
+            refresh (bool): 新しく登録された VTuber だけ取得する差分更新モード. state.json は読み書きしない.
+            html_cache (HtmlCache | None): 取得したページの HTML を保存する. http backend なら期限内のキャッシュを使う.
+            metrics (MetricsRegistry | None): 取得したページ数と行数の記録先. None なら共有のもの.
+            logger (logging.Logger | None): None ならこのモジュールのもの.
+        """
         self.save_dir = pathlib.Path(save_dir)
         self.state_json_path = self.save_dir.joinpath(STATE_DATA_FILE_NAME)
         self.vtuber_data_json_path = self.save_dir.joinpath(VTUBER_DATA_FILE_NAME)
-
-        self.web_driver = get_web_driver()
-        self.vtuber_datum: list[VTuberData] = []
+        self.journal = Journal(self.save_dir.joinpath(VTUBER_DATA_JOURNAL_NAME))
+
+        self.backend = Backend(backend)
+        self.extraction = Extraction(extraction)
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.__web_driver: webdriver.Chrome | None = None
+        self.http_client = VPostHttpClient(rate_limiter=self.rate_limiter) if self.backend == Backend.Http else None
+        self.html_cache = html_cache
+        self.metrics = metrics or get_shared_metrics()
+        self.logger = logger or get_logger(__name__, logging.DEBUG)
+
+        self.first_page_num, self.last_page_num = page_range if page_range else (1, None)
+        self.page_num = self.first_page_num
+        """次に取得するページ"""
+        self.vtuber_dict: dict[str, VTuberData] = {}
+        """key: youtube_id"""
+
+        self.refresh = refresh
+        self.order = self.NEWEST_FIRST if refresh else self.OLDEST_FIRST
+        self.known_run = 0
+        """refresh で, 直前まで連続した取得済みの VTuber の数"""
+        self.added_n = 0
+        self.updated_n = 0
+
+    @property
+    def web_driver(self) -> webdriver.Chrome:
+        # http backend では必要になるまで Chrome を立ち上げない
+        if self.__web_driver is None:
+            self.__web_driver = get_web_driver()
+        return self.__web_driver
+
+    @property
+    def vtuber_datum(self) -> list[VTuberData]:
+        return list(self.vtuber_dict.values())
+
+    @property
+    def finished(self) -> bool:
+        if self.refresh and self.known_run >= self.KNOWN_RUN_LIMIT:
+            return True
+        return self.last_page_num is not None and self.page_num > self.last_page_num
 
     def __load_state(self) -> None:
         if os.path.exists(self.state_json_path):
             with open(self.state_json_path, "r", encoding="utf-8") as f:
                 state_dict = json.load(f)
 
-            assert self.__jump_page(state_dict["page_num"])
+            self.page_num = state_dict["page_num"]
 
     def __get_current_page_num(self) -> int:
         pagination = self.web_driver.find_element(by=By.CLASS_NAME, value="now")
@@ -108,7 +283,7 @@ class VTuberListScraper:
 
         order_select = self.web_driver.find_element(by=By.NAME, value="order")
         order_select = Select(order_select)
-        order_select.select_by_value(str(self.OLDEST_FIRST))
+        order_select.select_by_value(str(self.order))
 
         non_movie_check = self.web_driver.find_element(by=By.NAME, value="non_movie")
         non_movie = non_movie_check.get_attribute("value")
@@ -116,156 +291,398 @@ class VTuberListScraper:
             non_movie_check.click()
 
         submit_button = self.web_driver.find_element(by=By.ID, value="search_submit")
-        submit_button.click()
-
-        time.sleep(3)
+        self.__submit_and_wait(submit_button.click)
 
-    def __extract_page_num(self, link: WebElement) -> int|None:
-        html = link.get_attribute("outerHTML")
-        match = re.search(r"FormSubmit\(([\d]+)\)", html)
-        if not match:
-            return None
-        return int(match.groups()[0]) +1
+    def __submit_and_wait(self, submit: Callable[[], None]) -> None:
+        """フォームを送信して, 次のページの読み込みが終わるまで待つ"""
+        old_document = self.web_driver.find_element(by=By.TAG_NAME, value="html")
+        with self.rate_limiter.request(VTUBER_DATABASE_URL):
+            submit()
+            wait = WebDriverWait(self.web_driver, self.PAGE_LOAD_TIMEOUT)
+            wait.until(expected_conditions.staleness_of(old_document))
+            wait.until(lambda driver: driver.execute_script("return document.readyState") == "complete")
 
     def __jump_page(self, target_page_num: int) -> bool:
-        previous_link = 0
-        while self.__get_current_page_num() != previous_link:
-            if self.__get_current_page_num() == target_page_num:
-                return True
+        """ページ送りのリンクと同じく FormSubmit にページ番号を渡して, 目的のページに直接移動する"""
+        if self.__get_current_page_num() == target_page_num:
+            return True
+
+        # FormSubmit の引数は 0 始まり
+        self.__submit_and_wait(lambda: self.web_driver.execute_script(f"FormSubmit({target_page_num - 1})"))
 
-            pagenation = self.web_driver.find_element(by=By.CLASS_NAME, value="pagenation")
-            page_links = pagenation.find_elements(by=By.TAG_NAME, value="a")
-            link_tuples = [(self.__extract_page_num(link), link) for link in page_links]
+        try:
+            return self.__get_current_page_num() == target_page_num
+        except NoSuchElementException:
+            # 最終ページより先を指定した場合
+            return False
 
-            previous_link = self.__get_current_page_num()
+    def get_last_page_num(self) -> int:
+        """ページ送りのリンクから最終ページの番号を取得"""
+        if self.backend == Backend.Http:
+            html = self.http_client.post_search(1, self.ITEM_LIMIT, self.order)
+            return parse_list_page(html).last_page_num
 
-            time.sleep(1.2)
-            if target_page_num < link_tuples[0][0]:
-                # 目的のページを過ぎてるから戻る
-                link_tuples[0][1].click()
+        pagenation_html = self.web_driver.find_element(by=By.CLASS_NAME, value="pagenation").get_attribute("outerHTML")
+        linked_pages = [int(n) + 1 for n in FORM_SUBMIT_PATTERN.findall(pagenation_html)]
+        return max([self.__get_current_page_num()] + linked_pages)
 
-            elif target_page_num > link_tuples[-1][0]:
-                # 目的のページはまだ先
-                link_tuples[-1][1].click()
+    def __ready_selenium(self) -> None:
+        with self.rate_limiter.request(VTUBER_DATABASE_URL):
+            self.web_driver.get(VTUBER_DATABASE_URL)
 
-            else:
-                for page_num, link in link_tuples:
-                    if page_num == target_page_num:
-                        link.click()
-                        break
+        self.__set_search_cond()
 
-        return False
+    def __fallback_to_selenium(self, e: Exception) -> None:
+        self.logger.info(f"http backend failed ({e!r}), fallback to selenium")
+        self.backend = Backend.Selenium
+        self.__ready_selenium()
+        assert self.__jump_page(self.page_num)
 
     def ready_scraper(self) -> None:
-        self.web_driver.get(VTUBER_DATABASE_URL)
-        time.sleep(3)
+        self.vtuber_dict = load_saved_vtuber_dict(self.save_dir)
+        if not self.refresh:
+            self.__load_state()
+
+        if self.backend == Backend.Selenium:
+            self.__ready_selenium()
+            if not self.finished:
+                assert self.__jump_page(self.page_num)
+        else:
+            try:
+                self.http_client.get_index()
+            except (LookupError, OSError) as e:
+                self.__fallback_to_selenium(e)
+
+    def __scrape_page(self) -> bool:
+        """self.page_num のページを取得. 次のページがあれば True"""
+        cache_key = list_page_key(self.order, self.ITEM_LIMIT, self.page_num)
+        if self.backend == Backend.Http:
+            try:
+                html = self.__fetch_list_page(cache_key)
+                page = parse_list_page(html)
+                self.__add_vtuber_datum(page.vtuber_datum)
+                return page.has_next
+            except (LookupError, OSError) as e:
+                self.__fallback_to_selenium(e)
+
+        self.__add_vtuber_datum(extract_vtuber_datum(self.web_driver, self.extraction))
+        if self.html_cache is not None:
+            self.html_cache.put(cache_key, LIST_PAGE_KIND, self.web_driver.page_source, page_num=self.page_num)
+        # Selenium では次のページに移動できたかで判定する
+        return True
+
+    def __fetch_list_page(self, cache_key: str) -> str:
+        if self.html_cache is None:
+            return self.http_client.post_search(self.page_num, self.ITEM_LIMIT, self.order)
+
+        # refresh は最新の値が欲しいのでキャッシュを使わない
+        html = None if self.refresh else self.html_cache.get(cache_key)
+        if html is None:
+            html = self.http_client.post_search(self.page_num, self.ITEM_LIMIT, self.order)
+            self.html_cache.put(cache_key, LIST_PAGE_KIND, html, page_num=self.page_num)
+        return html
+
+    def __add_vtuber_datum(self, vtuber_datum: list[VTuberData]) -> None:
+        self.metrics.counter("vpost_pages_total", kind=LIST_PAGE_KIND).inc()
+        self.metrics.counter("vpost_items_total", kind=LIST_PAGE_KIND).inc(len(vtuber_datum))
+        if self.refresh:
+            self.__refresh_vtuber_datum(vtuber_datum)
+            return
+
+        for data in vtuber_datum:
+            self.vtuber_dict[data.youtube_id] = data
+        self.journal.append(map(asdict, vtuber_datum))
+
+    def __refresh_vtuber_datum(self, vtuber_datum: list[VTuberData]) -> None:
+        """新しい VTuber は追加, 取得済みの VTuber は変わったカウンタだけ更新する"""
+        changed: list[VTuberData] = []
+        for data in vtuber_datum:
+            known = self.vtuber_dict.get(data.youtube_id)
+            if known is None:
+                self.known_run = 0
+                self.vtuber_dict[data.youtube_id] = data
+                self.added_n += 1
+                changed.append(data)
+                continue
 
-        self.__set_search_cond()
-        if os.path.exists(self.vtuber_data_json_path):
-            self.vtuber_datum = load_vtuber_datum(self.vtuber_data_json_path)
-        self.__load_state()
+            self.known_run += 1
+            if update_counters(known, data):
+                self.updated_n += 1
+                changed.append(known)
 
-    def __scrape_page(self) -> None:
-        vtuber_list = self.web_driver.find_element(by=By.CLASS_NAME, value="vtuber_list")
-        vtuber_elms = vtuber_list.find_elements(by=By.CLASS_NAME, value="clearfix")
-        self.vtuber_datum.extend(map(element_to_vtuber_data, vtuber_elms))
+        self.journal.append(map(asdict, changed))
 
-    def scrape_vtuber_list(self) -> None:
-        i = 0
-        while True:
-            i += 1
-            if i % self.SAVE_PERIOD == 0:
-                self.save()
+    def __move_next_page(self) -> bool:
+        if self.last_page_num is not None and self.page_num >= self.last_page_num:
+            # 担当範囲の最後まで取得した
+            self.page_num += 1
+            return False
+
+        if self.backend == Backend.Selenium and not self.__jump_page(self.page_num + 1):
+            return False
 
-            self.__scrape_page()
-            if not self.__jump_page(self.__get_current_page_num()+1):
-                # 次のページに飛べなかったら終了
-                break
+        self.page_num += 1
+        return True
 
+    def scrape_vtuber_list(self) -> None:
+        with self.journal.flush_on_sigint():
+            while not self.finished:
+                has_next = self.__scrape_page()
+                moved = has_next and not self.finished and self.__move_next_page()
+                self.checkpoint()
+                if not moved:
+                    # 次のページに飛べなかったら終了
+                    break
+
+        if self.refresh:
+            self.logger.info(f"refreshed: {self.added_n} added, {self.updated_n} updated")
         self.save()
 
-    def save(self) -> None:
+    def checkpoint(self) -> None:
+        """ジャーナルを書き出してから, 次に取得するページを保存する"""
         os.makedirs(self.save_dir, exist_ok=True)
+        self.journal.flush()
 
+        if self.refresh:
+            # 全件取得の再開位置は上書きしない
+            return
         with open(self.state_json_path, "w", encoding="utf-8") as f:
-            json.dump({"page_num": self.__get_current_page_num()}, f)
+            json.dump({"page_num": self.page_num}, f)
 
-        save_vtuber_datum(self.vtuber_datum, self.vtuber_data_json_path)
+    def save(self) -> None:
+        self.checkpoint()
+        self.journal.compact(
+            lambda path: save_vtuber_datum(self.vtuber_datum, path),
+            self.vtuber_data_json_path
+        )
 
     def __del__(self):
-        self.web_driver.quit()
+        if self.__web_driver is not None:
+            release_web_driver(self.__web_driver)
+        if self.http_client is not None:
+            self.http_client.close()
+
+def log_concurrency(logger: logging.Logger, worker_n: int, rate_limiter: HostRateLimiter) -> None:
+    """実際に同時に取得できるページ数を出力する. ホストごとの上限が worker_n より少なければ, 残りのワーカーは待つだけになる"""
+    logger.info(f"{worker_n} workers, at most {rate_limiter.max_concurrency} concurrent requests per host")
+    if rate_limiter.max_concurrency < worker_n:
+        logger.warning(f"{worker_n - rate_limiter.max_concurrency} workers will wait for the per-host limit. raise --max-concurrency to use them")
+
+def split_page_range(first_page_num: int, last_page_num: int, worker_n: int) -> list[tuple[int, int]]:
+    """[first_page_num, last_page_num] をなるべく均等な連続区間に分ける"""
+    page_n = last_page_num - first_page_num + 1
+    worker_n = max(1, min(worker_n, page_n))
+    size, rest = divmod(page_n, worker_n)
+
+    ranges = []
+    start = first_page_num
+    for i in range(worker_n):
+        end = start + size - 1 + (1 if i < rest else 0)
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+class PartitionedListScraper:
+    """一覧ページの範囲を分割して, 複数のワーカーで並列に取得する
+
+    ワーカーごとに `save_dir/partitions/worker_{i}/` に state.json と vtuber_data.json を持つので,
+    途中で止めてもワーカー単位で再開できる. 全ワーカーが終わったら `save_dir/vtuber_data.json` にまとめる.
+    """
+
+    PARTITIONS_DIR = "partitions"
+    PLAN_FILE_NAME = "plan.json"
+
+    def __init__(self,
+        save_dir: str, worker_n: int,
+        backend: Backend = Backend.Selenium, extraction: Extraction = Extraction.Script,
+        rate_limiter: HostRateLimiter | None = None,
+        html_cache: HtmlCache | None = None,
+        logger: logging.Logger | None = None
+    ) -> None:
+        self.save_dir = pathlib.Path(save_dir)
+        self.partitions_dir = self.save_dir.joinpath(self.PARTITIONS_DIR)
+        self.plan_json_path = self.partitions_dir.joinpath(self.PLAN_FILE_NAME)
+        self.vtuber_data_json_path = self.save_dir.joinpath(VTUBER_DATA_FILE_NAME)
+
+        self.worker_n = worker_n
+        self.backend = Backend(backend)
+        self.extraction = Extraction(extraction)
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.html_cache = html_cache
+        self.logger = logger or get_logger(__name__, logging.DEBUG)
+
+    def __worker_dir(self, i: int) -> pathlib.Path:
+        return self.partitions_dir.joinpath(f"worker_{i}")
+
+    def __plan(self) -> list[tuple[int, int]]:
+        """分割の仕方は初回に決めて保存し, 再開時も同じ分け方を使う"""
+        if os.path.exists(self.plan_json_path):
+            with open(self.plan_json_path, "r", encoding="utf-8") as f:
+                return [tuple(r) for r in json.load(f)]
+
+        probe = VTuberListScraper(self.partitions_dir, self.backend, self.extraction, (1, 1), self.rate_limiter)
+        probe.ready_scraper()
+        last_page_num = probe.get_last_page_num()
+        del probe
+
+        ranges = split_page_range(1, last_page_num, self.worker_n)
+        os.makedirs(self.partitions_dir, exist_ok=True)
+        with open(self.plan_json_path, "w", encoding="utf-8") as f:
+            json.dump(ranges, f)
+        return ranges
+
+    def __run_worker(self, i: int, page_range: tuple[int, int]) -> None:
+        self.logger.info(f"worker {i} scrapes pages {page_range[0]}-{page_range[1]}")
+        scraper = VTuberListScraper(
+            self.__worker_dir(i), self.backend, self.extraction, page_range, self.rate_limiter,
+            html_cache=self.html_cache, logger=self.logger
+        )
+        try:
+            scraper.ready_scraper()
+            scraper.scrape_vtuber_list()
+            self.logger.info(f"worker {i} finished at page {scraper.page_num - 1}")
+        except Exception as e:
+            # 他のワーカーは止めずに, 再実行時に state.json から再開する
+            self.logger.warning(f"worker {i} stopped: {e!r}")
+            scraper.checkpoint()
+
+    def scrape_vtuber_list(self) -> None:
+        ranges = self.__plan()
+        log_concurrency(self.logger, len(ranges), self.rate_limiter)
+        threads = [
+            threading.Thread(target=self.__run_worker, args=(i, r))
+            for i, r in enumerate(ranges)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.merge(len(ranges))
+
+    def merge(self, worker_n: int) -> None:
+        """ワーカーごとの結果をページ順に youtube_id で重複を除いてまとめる"""
+        merged: dict[str, VTuberData] = {}
+        if os.path.exists(self.vtuber_data_json_path):
+            merged = {d.youtube_id: d for d in iter_vtuber_datum(self.vtuber_data_json_path)}
+
+        for i in range(worker_n):
+            merged.update(load_saved_vtuber_dict(self.__worker_dir(i)))
+
+        save_vtuber_datum(list(merged.values()), self.vtuber_data_json_path)
+        self.logger.info(f"merged {len(merged)} vtubers into {self.vtuber_data_json_path}")
 
 class VTuberDetailScraper:
 
     SAVE_PERIOD = 10
 
-    def __init__(self, save_dir: str) -> None:
+    def __init__(self,
+        save_dir: str, backend: Backend = Backend.Selenium,
+        extraction: Extraction = Extraction.Script,
+        worker_n: int = 1, rate_limiter: HostRateLimiter | None = None,
+        html_cache: HtmlCache | None = None, metrics: MetricsRegistry | None = None,
+        logger: logging.Logger | None = None
+    ) -> None:
+        """
+        Args:
+            worker_n (int): 並列に動かす WebDriver (http backend ならリクエスト) の数.
+            rate_limiter (HostRateLimiter | None): ホストごとの同時接続数とリクエスト間隔を決める. None なら共有のもの.
+            html_cache (HtmlCache | None): 取得したページの HTML を保存する. 期限内のキャッシュがあれば取得しない.
+            metrics (MetricsRegistry | None): 取得したページ数と進捗の記録先. None なら共有のもの.
+            logger (logging.Logger | None): None ならこのモジュールのもの.
+        """
         self.save_dir = pathlib.Path(save_dir)
         self.detail_data_json_path = self.save_dir.joinpath(DETAIL_DATA_FILE_NAME)
         self.vtuber_data_json_path = self.save_dir.joinpath(VTUBER_DATA_FILE_NAME)
-
-        self.web_driver = get_web_driver()
+        self.journal = Journal(self.save_dir.joinpath(DETAIL_DATA_JOURNAL_NAME), date_handler)
+        self.logger = logger or get_logger(__name__, logging.DEBUG)
+
+        self.backend = Backend(backend)
+        self.extraction = Extraction(extraction)
+        self.worker_n = worker_n
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.http_client = VPostHttpClient(pool_size=worker_n, rate_limiter=self.rate_limiter) if self.backend == Backend.Http else None
+        self.html_cache = html_cache
+        self.metrics = metrics or get_shared_metrics()
+        self.progress: Progress | None = None
         if os.path.exists(self.detail_data_json_path):
-            detail_list = load_detail_datum(self.detail_data_json_path)
-            self.detail_dict: dict = {d.youtube_id :d for d in detail_list}
+            self.detail_dict: dict = {d.youtube_id :d for d in iter_detail_datum(self.detail_data_json_path)}
         else:
             self.detail_dict: dict = {}
+        for entry in self.journal.replay():
+            details = VTuberDetails.from_json(entry)
+            self.detail_dict[details.youtube_id] = details
         self.vtuber_datum = load_vtuber_datum(self.vtuber_data_json_path)
-
-    def __scrape_page(self, youtube_id: str) -> VTuberDetails:
-        self.web_driver.get(VTuber_detail_url(youtube_id))
-
-        description = self.web_driver.find_element(by=By.CLASS_NAME, value="desc").text
-
-        twitter_id = None
-        link_elms = self.web_driver.find_elements(by=By.CLASS_NAME, value="group")
-        for link_elm in link_elms:
-            if "Twitter" in link_elm.text and "@" in link_elm.text:
-                twitter_id = link_elm.find_element(by=By.TAG_NAME, value="a").text
-
-        # video data
-        movie_list_elms = self.web_driver.find_elements(by=By.CLASS_NAME, value="movie_list")
-        video_elms = [elms.find_elements(by=By.CLASS_NAME, value="clearfix") for elms in movie_list_elms]
-        video_list = [list(map(lambda elm: element_to_videodata(elm), elm_list)) for elm_list in video_elms]
-        video_list = sum(video_list, [])
-        video_list = list(filter(lambda x: x is not None, video_list))
-
-        time.sleep(3)
-        return VTuberDetails(
-            youtube_id=youtube_id,
-            description=description,
-            twitter_id=twitter_id,
-            recent_videos=video_list
-        )
-
-    def scrape_youtube_datum(self) -> None:
-        for i, value in enumerate(self.vtuber_datum):
-            print(value.name)
+        self.scraped_n = 0
+
+    def __scrape(self, worker: DriverWorker, youtube_id: str) -> VTuberDetails:
+        url = VTuber_detail_url(youtube_id)
+        cached_html = self.html_cache.get(url) if self.html_cache is not None else None
+        if cached_html is not None:
+            try:
+                return parse_detail_page(cached_html, youtube_id)
+            except LookupError:
+                pass
+
+        if self.backend == Backend.Http:
+            html = self.http_client.get_detail(youtube_id)
+            if self.html_cache is not None:
+                # パースに失敗しても, パーサーを直してから作り直せるように保存する
+                self.html_cache.put(url, DETAIL_PAGE_KIND, html, youtube_id=youtube_id)
+            try:
+                return parse_detail_page(html, youtube_id)
+            except LookupError as e:
+                # 想定した構造でなければ Chrome で開き直す
+                self.logger.info(f"http backend failed at {youtube_id} ({e!r}), fallback to selenium")
+
+        details = scrape_detail_page(worker.driver, youtube_id, self.extraction, self.rate_limiter)
+        if self.html_cache is not None:
+            self.html_cache.put(url, DETAIL_PAGE_KIND, worker.driver.page_source, youtube_id=youtube_id)
+        return details
+
+    def __extract_targets(self) -> list[str]:
+        targets = []
+        for value in self.vtuber_datum:
             # 動画の数が少ないのはデビュー直後 or 引退済み
             if not value.upload_videos or value.upload_videos < 5:
                 continue
 
             # 取得済みはスキップ
-            if value.youtube_id in self.detail_dict.keys():
+            if not value.youtube_id or value.youtube_id in self.detail_dict:
                 continue
 
-            if i and i % self.SAVE_PERIOD == 0:
-                self.save()
+            targets.append(value.youtube_id)
+        return targets
 
-            youtube_id = value.youtube_id
-            if youtube_id:
-                try:
-                    yt_data = self.__scrape_page(youtube_id)
-                    self.detail_dict[youtube_id] = yt_data
-                except:
-                    print(f"errror at {value.name}")
+    def __on_scraped(self, youtube_id: str, details: VTuberDetails) -> None:
+        self.detail_dict[youtube_id] = details
+        self.journal.append([asdict(details)])
+        self.scraped_n += 1
+        self.metrics.counter("vpost_pages_total", kind=DETAIL_PAGE_KIND).inc()
+        self.progress.advance()
+        if self.scraped_n % self.SAVE_PERIOD == 0:
+            self.journal.flush()
+
+    def scrape_youtube_datum(self) -> None:
+        targets = self.__extract_targets()
+        log_concurrency(self.logger, self.worker_n, self.rate_limiter)
+        self.progress = self.metrics.progress("vpost_detail_pages", len(targets), self.logger)
+        pool = DriverWorkerPool(self.worker_n, get_web_driver, self.__scrape, self.logger, release_web_driver)
+        with self.journal.flush_on_sigint():
+            failed = pool.run(targets, self.__on_scraped)
+        if failed:
+            self.logger.warning(f"failed to scrape {len(failed)} pages: {failed}")
 
         self.save()
 
     def save(self) -> None:
+        """ジャーナルを detail_data.json にまとめる"""
         os.makedirs(self.save_dir, exist_ok=True)
-        detail_datum = self.detail_dict.values()
-        save_detail_datum(detail_datum, self.detail_data_json_path)
+        self.journal.compact(
+            lambda path: save_detail_datum(self.detail_dict.values(), path),
+            self.detail_data_json_path
+        )
 
     def __del__(self):
-        self.web_driver.quit()
+        if self.http_client is not None:
+            self.http_client.close()
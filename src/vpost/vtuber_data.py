@@ -1,6 +1,10 @@
-import json
 import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from utils.file import PathLike, iter_json_records, save_records
+from utils.codec import Codec, strftime_format
+from utils.records import variant
 
 @dataclass
 class VTuberData:
@@ -19,15 +23,18 @@ class VTuberData:
     def from_json(cls, json_dict: dict):
         return cls(**json_dict)
 
-def load_vtuber_datum(json_path) -> list[VTuberData]:
-    with open(json_path, "r", encoding="utf-8") as f:
-        vtuber_data_dict = json.load(f)
-    return [VTuberData.from_json(vdd) for vdd in vtuber_data_dict]
+VTUBER_CODEC = Codec(VTuberData)
+
+def iter_vtuber_datum(json_path: PathLike) -> Iterator[VTuberData]:
+    """JSON でも JSON Lines でも, 1件ずつ読み込む"""
+    return map(VTUBER_CODEC.decode, iter_json_records(json_path))
 
-def save_vtuber_datum(datum: list[VTuberData], json_path) -> None:
-    save_obj = [asdict(d) for d in datum]
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(save_obj, f, ensure_ascii=False, indent=4, separators=(',', ': '))
+def load_vtuber_datum(json_path: PathLike) -> list[VTuberData]:
+    return list(iter_vtuber_datum(json_path))
+
+def save_vtuber_datum(datum: Iterable[VTuberData], json_path: PathLike) -> None:
+    """拡張子が .jsonl なら JSON Lines で保存する"""
+    save_records(json_path, map(VTUBER_CODEC.encode, datum))
 
 
 
@@ -46,7 +53,10 @@ class VideoData:
         json_dict["timestamp"] = datetime.datetime.strptime(
             json_dict["timestamp"], TIMESTAMP_FORMAT
         )
-        return VideoData(**json_dict)
+        return cls(**json_dict)
+
+SlottedVideoData = variant(VideoData)
+FrozenVideoData = variant(VideoData, frozen=True)
 
 
 
@@ -69,16 +79,22 @@ class VTuberDetails:
             recent_videos = recent_videos
         )
 
-def load_detail_datum(json_path) -> list[VTuberDetails]:
-    with open(json_path, "r", encoding="utf-8") as f:
-        vtuber_details_dict = json.load(f)
-    return [VTuberDetails.from_json(vdd) for vdd in vtuber_details_dict]
+DETAIL_CODEC = Codec(
+    VTuberDetails, strftime_format(TIMESTAMP_FORMAT),
+    defaults = {"description": None, "twitter_id": None}
+)
+
+def iter_detail_datum(json_path: PathLike) -> Iterator[VTuberDetails]:
+    """JSON でも JSON Lines でも, 1件ずつ読み込む"""
+    return map(DETAIL_CODEC.decode, iter_json_records(json_path))
+
+def load_detail_datum(json_path: PathLike) -> list[VTuberDetails]:
+    return list(iter_detail_datum(json_path))
 
 def date_handler(obj):
     return obj.strftime(TIMESTAMP_FORMAT) if hasattr(obj, 'isoformat') else obj
 
-def save_detail_datum(datum: list[VTuberDetails], json_path) -> None:
-    save_obj = [asdict(d) for d in datum]
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(save_obj, f, ensure_ascii=False, indent=4, separators=(',', ': '), default=date_handler)
+def save_detail_datum(datum: Iterable[VTuberDetails], json_path: PathLike) -> None:
+    """拡張子が .jsonl なら JSON Lines で保存する"""
+    save_records(json_path, map(DETAIL_CODEC.encode, datum))
 
@@ -0,0 +1,117 @@
+"""YouTube Data API の id 指定の呼び出し (channels.list, videos.list など) をまとめて実行する
+
+- id は1リクエストあたり最大 50 個まで詰める. 端数のチャンクも落とさない
+- 複数のリクエストを `BatchHttpRequest` で1回の HTTP 通信にまとめる
+- レスポンスの item を id に対応付け, 返ってこなかった id を `missing` として返す
+- etag_cache を渡すと, 中のリクエストを If-None-Match 付きにして 304 は保存済みの本文で返す
+- クォータは BatchHttpRequest ごとに `ApiKeyPool` から計上する. 足りなくなったら残りの id を `failed` にして止まる
+"""
+
+import logging
+from typing import Any, Callable, Iterable
+from dataclasses import dataclass, field
+
+from utils.metrics import MetricsRegistry, get_shared_metrics
+from .quota import LIST_COST, ApiKeyPool, QuotaExceeded, is_quota_error
+from .etag_cache import EtagCache
+
+MAX_IDS_PER_REQUEST = 50
+"""YouTube Data API の id パラメータに渡せる数の上限"""
+MAX_REQUESTS_PER_BATCH = 50
+"""BatchHttpRequest 1回にまとめるリクエスト数. API 側の上限は 1000 だが, 大きくしすぎると全体のやり直しが重くなる"""
+
+def chunk_ids(ids: Iterable[str], size: int = MAX_IDS_PER_REQUEST) -> list[list[str]]:
+    """重複を除いて size 個ずつに分ける. 最後の端数のチャンクも含む"""
+    unique_ids = list(dict.fromkeys(ids))
+    return [unique_ids[i:i+size] for i in range(0, len(unique_ids), size)]
+
+@dataclass
+class BatchResult:
+    found: dict[str, dict] = field(default_factory=dict)
+    """key: id, value: レスポンスの item"""
+    missing: list[str] = field(default_factory=list)
+    """リクエストは成功したが item が返ってこなかった id (削除済み, 存在しない id など)"""
+    failed: dict[str, Exception] = field(default_factory=dict)
+    """リクエスト自体が失敗した id と, その例外"""
+
+class BatchExecutor:
+    def __init__(self,
+        key_pool: ApiKeyPool, logger: logging.Logger,
+        ids_per_request: int = MAX_IDS_PER_REQUEST,
+        requests_per_batch: int = MAX_REQUESTS_PER_BATCH,
+        etag_cache: EtagCache | None = None, metrics: MetricsRegistry | None = None
+    ) -> None:
+        """
+        Args:
+            etag_cache (EtagCache | None): レスポンスの item に etag が含まれるように, fields に etag を入れること
+            metrics (MetricsRegistry | None): BatchHttpRequest の数と応答時間, 取得した item 数を記録する. None なら共有のもの.
+        """
+        self.key_pool = key_pool
+        self.etag_cache = etag_cache
+        self.logger = logger
+        self.ids_per_request = ids_per_request
+        self.requests_per_batch = requests_per_batch
+        self.metrics = metrics or get_shared_metrics()
+
+    def execute(self,
+        make_request: Callable[[Any, list[str]], Any], ids: Iterable[str],
+        id_of: Callable[[dict], str] = lambda item: item["id"]
+    ) -> BatchResult:
+        """
+        Args:
+            make_request (Callable[[Any, list[str]], Any]): クライアントと id のリストから HttpRequest を作る.
+                例: `lambda youtube, ids: youtube.channels().list(id=",".join(ids), ...)`
+            ids (Iterable[str]): 取得する id
+            id_of (Callable[[dict], str]): レスポンスの item から id を取り出す
+        """
+        result = BatchResult()
+        chunks = chunk_ids(ids, self.ids_per_request)
+        for i in range(0, len(chunks), self.requests_per_batch):
+            try:
+                self.__execute_batch(make_request, chunks[i:i+self.requests_per_batch], id_of, result)
+            except QuotaExceeded as e:
+                for chunk in chunks[i:]:
+                    for id in chunk:
+                        result.failed[id] = e
+                self.logger.warning(f"stop batch requests: {e}")
+                break
+
+        if result.missing:
+            self.logger.info(f"{len(result.missing)} ids are missing in responses: {result.missing}")
+        if result.failed:
+            self.logger.warning(f"{len(result.failed)} ids are failed to get")
+        return result
+
+    def __execute_batch(self,
+        make_request: Callable[[Any, list[str]], Any], chunks: list[list[str]],
+        id_of: Callable[[dict], str], result: BatchResult
+    ) -> None:
+        # 中のリクエスト1つごとに list 1回分のコストがかかる
+        youtube = self.key_pool.acquire(len(chunks) * LIST_COST)
+        requests = [make_request(youtube, chunk) for chunk in chunks]
+
+        def callback(request_id: str, response: dict | None, exception: Exception | None) -> None:
+            chunk = chunks[int(request_id)]
+            if self.etag_cache is not None:
+                response, exception = self.etag_cache.resolve(requests[int(request_id)], response, exception)
+            if exception is not None:
+                if is_quota_error(exception):
+                    self.key_pool.exhaust(youtube)
+                for id in chunk:
+                    result.failed[id] = exception
+                return
+
+            items = response.get("items", [])
+            self.metrics.counter("youtube_items_total", method="batch").inc(len(items))
+            for item in items:
+                result.found[id_of(item)] = item
+            result.missing.extend(id for id in chunk if id not in result.found)
+
+        batch = youtube.new_batch_http_request(callback=callback)
+        for i, request in enumerate(requests):
+            if self.etag_cache is not None:
+                self.etag_cache.prepare(request)
+            batch.add(request, request_id=str(i))
+        self.metrics.counter("youtube_requests_total", method="batch").inc()
+        with self.metrics.histogram("youtube_request_seconds", method="batch").time():
+            batch.execute()
@@ -0,0 +1,127 @@
+"""YouTube Data API のレスポンスを ETag 付きで保存し, 条件付きリクエストにする
+
+- キーはリクエストの URI (API key を除き, パラメータを並べ替えたもの). 別の API key でも同じキャッシュを使う
+- 2回目からは `If-None-Match` を付け, 304 が返ってきたら保存しておいた本文を返す
+- `discovery.build(..., http=CachingHttp(httplib2.Http(), cache))` で通常のリクエストに,
+  `BatchExecutor(..., etag_cache=cache)` で BatchHttpRequest の中のリクエストに使う
+"""
+
+import os
+import json
+import pathlib
+import hashlib
+import threading
+from typing import Any
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+ETAG_CACHE_DIR = pathlib.Path.home().joinpath(".cache", "vtuber-scraper", "youtube_etag")
+
+def request_key(uri: str) -> str:
+    """API key を除いて, クエリを並べ替えた URI"""
+    parts = urlsplit(uri)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "key")
+    return f"{parts.path}?{urlencode(query)}"
+
+class EtagCache:
+    """レスポンスの本文と ETag の保存先. スレッドセーフ"""
+    def __init__(self, cache_dir: pathlib.Path = ETAG_CACHE_DIR) -> None:
+        self.cache_dir = pathlib.Path(cache_dir)
+
+        self.__lock = threading.Lock()
+        self.hit_n = 0
+        """304 で保存済みの本文を返した数"""
+        self.miss_n = 0
+        """本文を取得した数 (キャッシュなし, または内容が変わっていた)"""
+
+    def __path(self, key: str) -> pathlib.Path:
+        sha256 = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.cache_dir.joinpath(sha256[:2], f"{sha256}.json")
+
+    def get(self, uri: str) -> tuple[str, str] | None:
+        """(etag, 本文)"""
+        path = self.__path(request_key(uri))
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except json.JSONDecodeError:
+            return None
+        return cached["etag"], cached["content"]
+
+    def put(self, uri: str, etag: str, content: str) -> None:
+        path = self.__path(request_key(uri))
+        os.makedirs(path.parent, exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"etag": etag, "content": content}, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def record(self, hit: bool) -> None:
+        with self.__lock:
+            if hit:
+                self.hit_n += 1
+            else:
+                self.miss_n += 1
+
+    def stats(self) -> dict:
+        with self.__lock:
+            total = self.hit_n + self.miss_n
+            return {"requests": total, "hits": self.hit_n, "hit_rate": self.hit_n / total if total else 0.0}
+
+    # BatchHttpRequest の中のリクエスト用
+    def prepare(self, request: Any) -> None:
+        """googleapiclient の HttpRequest に If-None-Match を付ける"""
+        cached = self.get(request.uri)
+        if cached is not None:
+            request.headers["if-none-match"] = cached[0]
+
+    def resolve(self, request: Any, response: dict | None, exception: Exception | None) -> tuple[dict | None, Exception | None]:
+        """BatchHttpRequest のコールバックの (response, exception) を, 304 なら保存済みの本文に置き換える"""
+        resp = getattr(exception, "resp", None)
+        if exception is not None and getattr(resp, "status", None) == 304:
+            cached = self.get(request.uri)
+            if cached is not None:
+                self.record(hit=True)
+                return json.loads(cached[1]), None
+        if exception is None and response is not None:
+            self.record(hit=False)
+            if "etag" in response:
+                self.put(request.uri, response["etag"], json.dumps(response, ensure_ascii=False))
+        return response, exception
+
+class CachingHttp:
+    """httplib2.Http をくるんで, GET に If-None-Match を付ける. `discovery.build` の http に渡す
+
+    httplib2.Http はスレッドセーフではないので, これもスレッドごとに作る.
+    """
+    def __init__(self, http: Any, cache: EtagCache) -> None:
+        self.http = http
+        self.cache = cache
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if method != "GET":
+            return self.http.request(uri, method, body=body, headers=headers, **kwargs)
+
+        headers = dict(headers or {})
+        cached = self.cache.get(uri)
+        if cached is not None:
+            headers["if-none-match"] = cached[0]
+
+        response, content = self.http.request(uri, method, body=body, headers=headers, **kwargs)
+        if response.status == 304 and cached is not None:
+            self.cache.record(hit=True)
+            response.status = 200
+            response["status"] = "200"
+            return response, cached[1].encode("utf-8")
+
+        if response.status == 200:
+            self.cache.record(hit=False)
+            etag = response.get("etag")
+            if etag:
+                self.cache.put(uri, etag, content.decode("utf-8") if isinstance(content, bytes) else content)
+        return response, content
+
+    def __getattr__(self, name):
+        # credentials や timeout など, googleapiclient が参照する属性はそのまま渡す
+        return getattr(self.http, name)
@@ -0,0 +1,270 @@
+"""YouTube Data API をネットワークなしで動かすための代わりの http
+
+`discovery.build(..., http=OfflineHttp(backend), static_discovery=True)` のように渡すと,
+API key も通信もなしで search, channels, playlistItems のレスポンスを返す.
+レスポンスの中身 (backend) は次の2つ.
+- `SyntheticYouTube`: 乱数で作った架空のチャンネルと動画. 件数を増やしてスループットを測るのに使う
+- `Cassette`: `RecordingHttp` で本物の API から記録したレスポンス
+
+latency, エラー率, 何件目からクォータ切れ (403) にするかを指定できる.
+BatchHttpRequest (multipart/mixed) にも対応する.
+"""
+
+import json
+import time
+import email
+import random
+import hashlib
+import datetime
+import threading
+from dataclasses import dataclass, field
+from typing import Any
+from urllib.parse import urlsplit, parse_qsl
+
+from .etag_cache import request_key
+from .time_window_search import to_rfc3339
+
+BATCH_PATHS = ("/batch", "/batch/youtube/v3")
+"""BatchHttpRequest の送り先. 今の discovery document は `batchPath: "batch"` (`https://youtube.googleapis.com/batch`),
+古いものは `/batch/youtube/v3`"""
+
+class OfflineResponse(dict):
+    """httplib2.Response の代わり. googleapiclient は status と reason と dict としてのヘッダーを見る"""
+    def __init__(self, status: int, headers: dict | None = None) -> None:
+        super().__init__({"status": str(status), **(headers or {})})
+        self.status = status
+        self.reason = "OK" if status < 400 else "Error"
+
+def error_content(status: int, reason: str, message: str = "") -> dict:
+    return {"error": {"code": status, "message": message or reason, "errors": [{"reason": reason, "message": message or reason}]}}
+
+def content_etag(content: dict) -> str:
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()[:27]
+
+def paginate(items: list, params: dict, default_max: int = 5, cap: int | None = None) -> dict:
+    """pageToken は先頭からの件数"""
+    max_results = int(params.get("maxResults", default_max))
+    offset = int(params.get("pageToken", 0))
+    reachable = items if cap is None else items[:cap]
+    page = reachable[offset:offset + max_results]
+    content = {"pageInfo": {"totalResults": len(items), "resultsPerPage": max_results}, "items": page}
+    if offset + max_results < len(reachable):
+        content["nextPageToken"] = str(offset + max_results)
+    return content
+
+@dataclass
+class SyntheticYouTube:
+    """架空のチャンネルと動画. スレッドから同時に読んでよい (書き換えない)"""
+    channels: dict[str, dict] = field(default_factory=dict)
+    """key: channel id, value: channels.list の item"""
+    uploads: dict[str, list[dict]] = field(default_factory=dict)
+    """key: 投稿動画の再生リスト id, value: playlistItems.list の item (新しい順)"""
+    videos: list[dict] = field(default_factory=list)
+    """search.list の item"""
+
+    SEARCH_CAP = 500
+    TITLE_TEMPLATES = ("【自己紹介】VTuber自己紹介 {name}", "新人VTuber {name} 初配信", "{name} 歌ってみた", "{name} 雑談 #{i}")
+
+    @classmethod
+    def generate(cls,
+        channel_n: int = 100, videos_per_channel: int = 100, seed: int = 0,
+        start: datetime.datetime = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc),
+        end: datetime.datetime = datetime.datetime(2022, 12, 1, tzinfo=datetime.timezone.utc)
+    ):
+        rand = random.Random(seed)
+        data = cls()
+        span = int((end - start).total_seconds())
+        for c in range(channel_n):
+            channel_id = f"UC{c:022d}"
+            name = f"テスト{c}"
+            video_n = rand.randint(0, videos_per_channel * 2)
+            published = sorted((start + datetime.timedelta(seconds=rand.randrange(span)) for _ in range(video_n)), reverse=True)
+            upload_list_id = "UU" + channel_id[2:]
+            data.channels[channel_id] = {
+                "kind": "youtube#channel", "id": channel_id,
+                "snippet": {"title": name, "description": f"{name} のチャンネル", "publishedAt": to_rfc3339(start)},
+                "contentDetails": {"relatedPlaylists": {"uploads": upload_list_id}},
+                "statistics": {
+                    "viewCount": str(rand.randrange(10**6)), "subscriberCount": str(rand.randrange(10**5)),
+                    "hiddenSubscriberCount": False, "videoCount": str(video_n)
+                },
+            }
+            data.uploads[upload_list_id] = []
+            for i, published_at in enumerate(published):
+                video_id = hashlib.sha256(f"{channel_id}/{i}".encode()).hexdigest()[:11]
+                title = rand.choice(cls.TITLE_TEMPLATES).format(name=name, i=i)
+                snippet = {"publishedAt": to_rfc3339(published_at), "title": title, "description": f"{title} の説明"}
+                data.uploads[upload_list_id].append({
+                    "kind": "youtube#playlistItem",
+                    "snippet": {**snippet, "resourceId": {"kind": "youtube#video", "videoId": video_id}},
+                })
+                data.videos.append({
+                    "kind": "youtube#searchResult", "id": {"kind": "youtube#video", "videoId": video_id},
+                    "snippet": {**snippet, "channelId": channel_id, "channelTitle": name},
+                })
+        data.videos.sort(key=lambda v: v["snippet"]["publishedAt"], reverse=True)
+        return data
+
+    def respond(self, method: str, uri: str) -> tuple[int, dict]:
+        parts = urlsplit(uri)
+        params = dict(parse_qsl(parts.query))
+        resource = parts.path.rstrip("/").rsplit("/", 1)[-1]
+        if resource == "search":
+            return 200, self.__search(params)
+        if resource == "channels":
+            ids = params.get("id", "").split(",")
+            return 200, {"items": [self.channels[id] for id in ids if id in self.channels]}
+        if resource == "playlistItems":
+            playlist_id = params.get("playlistId")
+            if playlist_id not in self.uploads:
+                return 404, error_content(404, "playlistNotFound")
+            return 200, paginate(self.uploads[playlist_id], params)
+        return 404, error_content(404, "notFound", f"{resource} is not supported")
+
+    def __search(self, params: dict) -> dict:
+        terms = params.get("q", "").split()
+        positive = [t for t in terms if not t.startswith("-")]
+        negative = [t[1:] for t in terms if t.startswith("-") and len(t) > 1]
+        after = params.get("publishedAfter", "")
+        before = params.get("publishedBefore", "9999")
+
+        def matches(video: dict) -> bool:
+            title = video["snippet"]["title"]
+            published_at = video["snippet"]["publishedAt"]
+            return (
+                all(t in title for t in positive) and not any(t in title for t in negative)
+                and after <= published_at < before
+            )
+
+        found = [v for v in self.videos if matches(v)]
+        if params.get("order", "relevance") != "date":
+            # date 以外は並びを決めるだけ
+            found.sort(key=lambda v: hashlib.sha256((params.get("order", "") + v["id"]["videoId"]).encode()).digest())
+        return paginate(found, params, cap=self.SEARCH_CAP)
+
+class Cassette:
+    """記録したレスポンス. 1行に1レスポンスの JSONL. API key は記録しない"""
+    def __init__(self, path) -> None:
+        self.path = path
+        self.__lock = threading.Lock()
+        self.responses: dict[tuple[str, str], tuple[int, dict]] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self.responses[(entry["method"], entry["key"])] = (entry["status"], entry["content"])
+        except FileNotFoundError:
+            pass
+
+    def record(self, method: str, uri: str, status: int, content: dict) -> None:
+        key = request_key(uri)
+        with self.__lock:
+            self.responses[(method, key)] = (status, content)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"method": method, "key": key, "status": status, "content": content}, ensure_ascii=False) + "\n")
+
+    def respond(self, method: str, uri: str) -> tuple[int, dict]:
+        return self.responses.get(
+            (method, request_key(uri)),
+            (404, error_content(404, "notRecorded", f"{request_key(uri)} is not recorded"))
+        )
+
+class RecordingHttp:
+    """本物の httplib2.Http をくるんで, JSON のレスポンスを Cassette に記録する
+
+    BatchHttpRequest の中のレスポンスは記録しないので, 記録するときは BatchExecutor を通さずに呼ぶこと.
+    """
+    def __init__(self, http: Any, cassette: Cassette) -> None:
+        self.http = http
+        self.cassette = cassette
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        response, content = self.http.request(uri, method, body=body, headers=headers, **kwargs)
+        if method == "GET" and response.status != 304:
+            try:
+                self.cassette.record(method, uri, response.status, json.loads(content))
+            except ValueError:
+                pass
+        return response, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+class OfflineHttp:
+    """httplib2.Http の代わりに backend のレスポンスを返す
+
+    スレッドごとに作る. quota_exceeded_after などの回数もインスタンスごとに数える.
+    """
+    def __init__(self,
+        backend: SyntheticYouTube | Cassette,
+        latency: float = 0.0, error_rate: float = 0.0,
+        quota_exceeded_after: int | None = None, seed: int | None = None
+    ) -> None:
+        """
+        Args:
+            latency (float): 1回の HTTP 通信にかかる時間 [s]
+            error_rate (float): 500 backendError を返す割合
+            quota_exceeded_after (int | None): この件数のリクエストを返した後は 403 quotaExceeded を返す
+        """
+        self.backend = backend
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_exceeded_after = quota_exceeded_after
+        self.random = random.Random(seed)
+        self.request_n = 0
+
+    def __respond(self, method: str, uri: str, headers: dict) -> tuple[int, dict, dict]:
+        """(status, レスポンスのヘッダー, 本文)"""
+        self.request_n += 1
+        if self.quota_exceeded_after is not None and self.request_n > self.quota_exceeded_after:
+            return 403, {}, error_content(403, "quotaExceeded")
+        if self.random.random() < self.error_rate:
+            return 500, {}, error_content(500, "backendError")
+
+        status, content = self.backend.respond(method, uri)
+        if status != 200:
+            return status, {}, content
+        etag = content_etag(content)
+        content = {"etag": etag, **content}
+        if {k.lower(): v for k, v in headers.items()}.get("if-none-match") == etag:
+            return 304, {"etag": etag}, {}
+        return 200, {"etag": etag}, content
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        headers = headers or {}
+        if urlsplit(uri).path in BATCH_PATHS:
+            return self.__batch(body, headers)
+
+        status, response_headers, content = self.__respond(method, uri, headers)
+        response = OfflineResponse(status, {"content-type": "application/json; charset=UTF-8", **response_headers})
+        return response, (json.dumps(content, ensure_ascii=False).encode("utf-8") if status != 304 else b"")
+
+    def __batch(self, body, headers: dict):
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        content_type = {k.lower(): v for k, v in headers.items()}["content-type"]
+        message = email.message_from_string(f"content-type: {content_type}\r\n\r\n{body}")
+
+        boundary = "offline_batch_boundary"
+        parts = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().replace("\r\n", "\n").partition("\n")
+            method, path, _ = request_line.strip().split(" ", 2)
+            request_headers = dict(
+                line.split(": ", 1) for line in rest.split("\n\n", 1)[0].splitlines() if ": " in line
+            )
+            status, response_headers, content = self.__respond(method, f"https://youtube.googleapis.com{path}", request_headers)
+            content_id = part["Content-ID"].strip("<>")
+            lines = [f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}", "Content-Type: application/json; charset=UTF-8"]
+            lines += [f"{k}: {v}" for k, v in response_headers.items()]
+            payload = "\r\n".join(lines) + "\r\n\r\n" + (json.dumps(content, ensure_ascii=False) if status != 304 else "")
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n{payload}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--\r\n"
+        response = OfflineResponse(200, {"content-type": f"multipart/mixed; boundary={boundary}"})
+        return response, content.encode("utf-8")
@@ -0,0 +1,224 @@
+"""YouTube Data API のクォータ管理
+
+- API key ごと, 太平洋時間の日付ごとに使ったユニット数を記録する (クォータは太平洋時間の 0 時にリセットされる)
+- 記録はファイルに保存するので, 別の実行や別のスクリプトとも共有される. 計上はプロセスの中で持っておき, 一定の間隔でファイルに足し込む
+- リクエストを送る前にユニットを計上し, 足りなければ `QuotaExceeded` を投げる. 呼び出し側はそこで保存して止まる
+- 複数の API key を `ApiKeyPool` にまとめると, 残りの多い key から順に使う
+"""
+
+import os
+import json
+import math
+import time
+import atexit
+import pathlib
+import hashlib
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+from typing import Any, Callable
+
+from utils.file import lock_file
+from utils.metrics import MetricsRegistry, get_shared_metrics
+
+PACIFIC = ZoneInfo("America/Los_Angeles")
+
+DAILY_QUOTA = 10000
+"""API key 1つあたりの1日のユニット数 (デフォルトの割り当て)"""
+
+SEARCH_COST = 100
+"""search.list 1回のコスト"""
+LIST_COST = 1
+"""channels.list, playlistItems.list, videos.list など list 1回のコスト"""
+
+QUOTA_LEDGER_PATH = pathlib.Path.home().joinpath(".cache", "vtuber-scraper", "youtube_quota.json")
+
+class QuotaExceeded(Exception):
+    """どの API key にも必要なユニットが残っていない"""
+
+def pacific_day(now: datetime.datetime | None = None) -> str:
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return now.astimezone(PACIFIC).date().isoformat()
+
+def key_id(api_key: str) -> str:
+    """ファイルに API key をそのまま書かないように, ハッシュの先頭を使う"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+def api_keys_from_env() -> list[str]:
+    """`YOUTUBE_API_KEYS` (カンマ区切り) か `YOUTUBE_API_KEY` / `API_KEY` から API key を読む"""
+    keys = os.getenv("YOUTUBE_API_KEYS")
+    if keys:
+        return [key.strip() for key in keys.split(",") if key.strip()]
+    key = os.getenv("YOUTUBE_API_KEY") or os.getenv("API_KEY")
+    return [key] if key else []
+
+def estimate_search_cost(query_n: int, max_page: int) -> int:
+    return query_n * max_page * SEARCH_COST
+
+def estimate_upload_list_cost(video_counts: list[int], ids_per_request: int = 50) -> int:
+    """channels.list で再生リスト id を引いてから, 各チャンネルの playlistItems.list を全ページ取得するコスト"""
+    channels_cost = math.ceil(len(video_counts) / ids_per_request) * LIST_COST
+    pages_cost = sum(max(1, math.ceil(n / 50)) for n in video_counts) * LIST_COST
+    return channels_cost + pages_cost
+
+class QuotaLedger:
+    """使ったユニット数の記録. {"日付": {"key id": ユニット数}} の JSON で保存する. スレッドセーフ
+
+    計上するたびにファイルを読み書きすると API を呼ぶたびに重くなるので, 計上はメモリに持っておき,
+    flush_interval 秒ごと, exhaust したとき, 終了時にファイルへ書き出す. 書き出すときはロックファイルで別のプロセスと排他し,
+    ファイルの値に書き出していない分を足すので, 同時に動いている別のプロセスの計上を上書きしない.
+    別のプロセスの計上が見えるのは書き出した後なので, その間は合わせて少し多く使うことがある.
+    """
+    def __init__(self,
+        path: pathlib.Path = QUOTA_LEDGER_PATH, daily_quota: int = DAILY_QUOTA,
+        now: Callable[[], datetime.datetime] = lambda: datetime.datetime.now(datetime.timezone.utc),
+        flush_interval: float | None = 10.0, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """
+        Args:
+            flush_interval (float | None): 前に書き出してからこの秒数が経ったら, 次の計上で書き出す. None なら flush を呼んだときと終了時だけ.
+        """
+        self.path = pathlib.Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.daily_quota = daily_quota
+        self.now = now
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.__lock = threading.Lock()
+
+        self.__saved: dict[str, dict[str, int]] = self.__load()
+        """最後に読み書きしたときのファイルの内容"""
+        self.__unsaved: dict[str, dict[str, int]] = {}
+        """まだ書き出していない計上. {"日付": {"key id": ユニット数}}"""
+        self.__exhausted: set[tuple[str, str]] = set()
+        """まだ書き出していない exhaust. (日付, key id)"""
+        self.__flushed_at = clock()
+        atexit.register(self.flush)
+
+    def __load(self) -> dict[str, dict[str, int]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def __used(self, day: str, key: str) -> int:
+        if (day, key) in self.__exhausted:
+            return self.daily_quota
+        return self.__saved.get(day, {}).get(key, 0) + self.__unsaved.get(day, {}).get(key, 0)
+
+    def __flush(self) -> None:
+        with lock_file(self.lock_path):
+            ledger = self.__load()
+            for day, used in self.__unsaved.items():
+                saved = ledger.setdefault(day, {})
+                for key, units in used.items():
+                    saved[key] = saved.get(key, 0) + units
+            for day, key in self.__exhausted:
+                saved = ledger.setdefault(day, {})
+                saved[key] = max(saved.get(key, 0), self.daily_quota)
+
+            # 前日までの記録は残さない
+            today = pacific_day(self.now())
+            ledger = {day: used for day, used in ledger.items() if day >= today}
+            os.makedirs(self.path.parent, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(ledger, f, indent=4)
+            os.replace(temp_path, self.path)
+
+        self.__saved = ledger
+        self.__unsaved = {}
+        self.__exhausted.clear()
+        self.__flushed_at = self.clock()
+
+    def flush(self) -> None:
+        """書き出していない計上をファイルに足し込み, 別のプロセスの計上を読み込む"""
+        with self.__lock:
+            if self.__unsaved or self.__exhausted:
+                self.__flush()
+
+    def used(self, api_key: str) -> int:
+        with self.__lock:
+            return self.__used(pacific_day(self.now()), key_id(api_key))
+
+    def remaining(self, api_key: str) -> int:
+        return max(0, self.daily_quota - self.used(api_key))
+
+    def charge(self, api_key: str, units: int) -> bool:
+        """残りがあれば units を計上して True"""
+        with self.__lock:
+            day, key = pacific_day(self.now()), key_id(api_key)
+            if self.__used(day, key) + units > self.daily_quota:
+                return False
+            unsaved = self.__unsaved.setdefault(day, {})
+            unsaved[key] = unsaved.get(key, 0) + units
+            if self.flush_interval is not None and self.clock() - self.__flushed_at >= self.flush_interval:
+                self.__flush()
+            return True
+
+    def exhaust(self, api_key: str) -> None:
+        """API から quotaExceeded が返ってきたときに, 今日はもう使わないようにする. 別のプロセスにもすぐ伝える"""
+        with self.__lock:
+            self.__exhausted.add((pacific_day(self.now()), key_id(api_key)))
+            self.__flush()
+
+class ApiKeyPool:
+    """複数の API key で作ったクライアントを, 残りユニットの多い順に貸し出す
+
+    httplib2 を使うクライアントはスレッドセーフではないので, クライアントはスレッドごとに作る.
+    """
+    def __init__(self,
+        api_keys: list[str], ledger: QuotaLedger, build: Callable[[str], Any],
+        metrics: MetricsRegistry | None = None
+    ) -> None:
+        """
+        Args:
+            build (Callable[[str], Any]): API key からクライアントを作る. 例: `lambda key: discovery.build('youtube', 'v3', developerKey=key)`
+            metrics (MetricsRegistry | None): 計上したユニット数を記録する. None なら共有のもの.
+        """
+        if not api_keys:
+            raise ValueError("no YouTube API key is configured")
+        self.api_keys = list(dict.fromkeys(api_keys))
+        self.ledger = ledger
+        self.build = build
+        self.metrics = metrics or get_shared_metrics()
+
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__client_keys: dict[int, str] = {}
+        """key: id(client)"""
+
+    def __client(self, api_key: str) -> Any:
+        clients: dict[str, Any] = self.__local.__dict__.setdefault("clients", {})
+        if api_key not in clients:
+            clients[api_key] = self.build(api_key)
+            with self.__lock:
+                self.__client_keys[id(clients[api_key])] = api_key
+        return clients[api_key]
+
+    def acquire(self, units: int) -> Any:
+        """units を計上して, 呼び出したスレッド用のクライアントを返す. どの key にも残っていなければ QuotaExceeded"""
+        for api_key in sorted(self.api_keys, key=self.ledger.remaining, reverse=True):
+            if self.ledger.charge(api_key, units):
+                self.metrics.counter("youtube_quota_units_total", key=key_id(api_key)).inc(units)
+                return self.__client(api_key)
+        raise QuotaExceeded(f"all {len(self.api_keys)} API keys have less than {units} units today")
+
+    def exhaust(self, client: Any) -> None:
+        with self.__lock:
+            api_key = self.__client_keys[id(client)]
+        self.metrics.counter("youtube_quota_exhausted_total", key=key_id(api_key)).inc()
+        self.ledger.exhaust(api_key)
+
+    def remaining(self) -> int:
+        return sum(self.ledger.remaining(key) for key in self.api_keys)
+
+QUOTA_ERROR_REASONS = ("quotaExceeded", "dailyLimitExceeded", "rateLimitExceeded")
+"""403 のうちクォータ切れとして扱う reason. forbidden などそれ以外の 403 は普通のエラー"""
+
+def is_quota_error(e: Exception) -> bool:
+    """googleapiclient の HttpError がクォータ切れかどうか"""
+    if getattr(e, "status_code", None) != 403:
+        return False
+    reasons = [d.get("reason") for d in getattr(e, "error_details", None) or [] if isinstance(d, dict)]
+    return any(r in QUOTA_ERROR_REASONS for r in reasons)
@@ -1,13 +1,27 @@
 import os
+import time
+import logging
 import pathlib
 import datetime
+import threading
+from typing import Any, Callable
+from dataclasses import asdict
+import httplib2
 from apiclient import discovery
-
-from .youtube_data import SearchResult, SearchResultItem, YouTubeChannelData, load_search_datum, save_search_datum, load_channel_datum, save_channel_datum
-from vpost.vtuber_data import VTuberDetails, load_detail_datum
+from googleapiclient.errors import HttpError
+
+from utils.journal import Journal
+from utils.logger import get_logger
+from utils.metrics import MetricsRegistry, get_shared_metrics
+from .batch import BatchExecutor
+from .etag_cache import EtagCache, CachingHttp
+from .quota import SEARCH_COST, ApiKeyPool, QuotaLedger, QuotaExceeded, estimate_search_cost, is_quota_error
+from .youtube_data import SearchResult, SearchResultItem, YouTubeChannelData, load_channel_datum, save_channel_datum, str_to_datetime, date_handler
+from .search_store import SearchStore, load_search_store, save_search_store
+from .time_window_search import TimeWindow, window_key, to_rfc3339
+from vpost.vtuber_data import iter_detail_datum
 
 def response_to_item(response: dict) -> SearchResultItem:
-    print(response)
     return SearchResultItem(
         kind = response["id"]["kind"].replace("youtube", ""),
         video_id = response["id"]["videoId"],
@@ -19,65 +33,358 @@ def response_to_item(response: dict) -> SearchResultItem:
     )
 
 SEARCH_RESULT_JSON_NAME = "search_result.json"
+"""以前の形式. `search_store.json` がなければここから読み込む"""
+SEARCH_STORE_JSON_NAME = "search_store.json"
+SEARCH_RESULT_JOURNAL_NAME = "search_result.journal.jsonl"
+
+class PendingSearch:
+    """途中まで取得した1回分の検索. 再開用に次のページのトークンを持つ"""
+    def __init__(self, timestamp: datetime.datetime, query: str, order: str, window: TimeWindow | None = None) -> None:
+        self.timestamp = timestamp
+        self.query = query
+        self.order = order
+        self.window = window
+        """投稿日時で絞り込む期間. None なら絞り込まない"""
+
+        self.items: dict[str, SearchResultItem] = {}
+        """key: video_id"""
+        self.page_n = 0
+        self.next_page_token: str | None = None
+        self.total_results: int | None = None
+        """最初のページの pageInfo.totalResults (おおよその件数)"""
+
+    @property
+    def key(self) -> str:
+        return search_key(self.query, self.order, self.window)
+
+    def add_page(self, items: list[SearchResultItem], next_page_token: str | None) -> None:
+        for item in items:
+            self.items[item.video_id] = item
+        self.page_n += 1
+        self.next_page_token = next_page_token
+
+    def to_entry(self, items: list[SearchResultItem]) -> dict:
+        """ジャーナルの1行. items はこのページで増えた分"""
+        entry = {
+            "query": self.query, "order": self.order, "timestamp": self.timestamp,
+            "page_n": self.page_n, "next_page_token": self.next_page_token,
+            "total_results": self.total_results,
+            "items": [asdict(item) for item in items],
+        }
+        if self.window is not None:
+            entry["published_after"], entry["published_before"] = self.window
+        return entry
+
+    def to_search_result(self) -> SearchResult:
+        return SearchResult(self.timestamp, self.query, self.order, list(self.items.values()))
+
+def search_key(query: str, order: str, window: TimeWindow | None = None) -> str:
+    if window is None:
+        return f"{order}:{query}"
+    return f"{order}:{query}@{window_key(window)}"
+
+def entry_window(entry: dict) -> TimeWindow | None:
+    if "published_after" not in entry:
+        return None
+    return str_to_datetime(entry["published_after"]), str_to_datetime(entry["published_before"])
+
+HttpFactory = Callable[[], Any]
+"""httplib2.Http の代わりを作る. オフラインで動かすときに `lambda: OfflineHttp(backend)` などを渡す"""
+
+def build_youtube(api_key: str, etag_cache: EtagCache | None = None, http_factory: HttpFactory | None = None):
+    """etag_cache を渡すと, GET のリクエストを ETag による条件付きリクエストにする"""
+    if etag_cache is None and http_factory is None:
+        return discovery.build('youtube', 'v3', developerKey=api_key)
+
+    http = http_factory() if http_factory is not None else httplib2.Http()
+    if etag_cache is not None:
+        http = CachingHttp(http, etag_cache)
+    return discovery.build('youtube', 'v3', developerKey=api_key, http=http, static_discovery=True)
+
+def create_key_pool(
+    api_keys: list[str] | str, ledger: QuotaLedger | None = None, etag_cache: EtagCache | None = None,
+    http_factory: HttpFactory | None = None, metrics: MetricsRegistry | None = None
+) -> ApiKeyPool:
+    if isinstance(api_keys, str):
+        api_keys = [api_keys]
+    return ApiKeyPool(api_keys, ledger or QuotaLedger(), lambda key: build_youtube(key, etag_cache, http_factory), metrics)
 
 class YouTubeSearchScraper:
-    """youtube の検索結果を保存"""
-    def __init__(self, save_dir: str, api_key: str, ng_words: list[str]) -> None:
+    """youtube の検索結果を `search_store.json` に video_id ごとにまとめて保存
+
+    ページを取得するごとに `search_result.journal.jsonl` に追記するので, 途中で止まっても
+    同じ query と order で `search` を呼べば続きのページから再開する.
+    クォータが足りなくなったときも, そこまでをジャーナルに残して止まる.
+    期間 (window) の違う検索は別の検索として扱い, 別々のスレッドから取得してよい.
+    取得し終えた検索もジャーナルに書き, 件数か時間で決めた間隔ごとと `compact` を呼んだときに `search_store.json` にまとめる.
+    """
+    def __init__(self,
+        save_dir: str, api_keys: list[str] | str, ng_words: list[str],
+        ledger: QuotaLedger | None = None, http_factory: HttpFactory | None = None,
+        metrics: MetricsRegistry | None = None,
+        compact_every: int | None = 50, compact_interval: float | None = 600.0,
+        clock: Callable[[], float] = time.monotonic,
+        logger: logging.Logger | None = None
+    ) -> None:
+        """
+        Args:
+            api_keys (list[str] | str): YouTube Data API の api key. 複数渡すと残りの多いものから使う.
+            ledger (QuotaLedger | None): クォータの記録. None ならデフォルトの場所のもの.
+            http_factory (HttpFactory | None): オフラインで動かすときの http. `youtube.offline` 参照.
+            metrics (MetricsRegistry | None): ページ数や応答時間の記録先. None なら共有のもの.
+            compact_every (int | None): 前にまとめてから取得し終えた検索がこの数になったら search_store.json にまとめる. None なら数では見ない.
+            compact_interval (float | None): 前にまとめてからこの秒数が経ったらまとめる. None なら時間では見ない.
+            logger (logging.Logger | None): None ならこのモジュールのもの.
+        """
         self.save_dir = pathlib.Path(save_dir)
-        self.save_path = self.save_dir.joinpath(SEARCH_RESULT_JSON_NAME)
+        self.save_path = self.save_dir.joinpath(SEARCH_STORE_JSON_NAME)
+        self.journal = Journal(self.save_dir.joinpath(SEARCH_RESULT_JOURNAL_NAME), date_handler)
 
-        self.youtube = discovery.build('youtube', 'v3', developerKey=api_key)
+        self.metrics = metrics or get_shared_metrics()
+        self.key_pool = create_key_pool(api_keys, ledger, http_factory=http_factory, metrics=self.metrics)
+        self.logger = logger or get_logger(__name__, logging.DEBUG)
 
         self.ng_words = ng_words
-
-        self.search_results: list[SearchResult] = []
-        if os.path.exists(self.save_path):
-            self.search_results = load_search_datum(self.save_path)
-
-
-    def search(self, query, order="rating", max_page=20) -> None:
-        query += " -" + " -".join(self.ng_words)
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.clock = clock
+        self.__finished_n = 0
+        """最後にまとめてから取得し終えた検索の数"""
+        self.__compacted_at = clock()
+
+        self.store: SearchStore = load_search_store(self.save_path, self.save_dir.joinpath(SEARCH_RESULT_JSON_NAME))
+        self.__finished_windows: set[str] = {
+            search_key(run.query, run.order, (run.published_after, run.published_before))
+            for run in self.store.runs if run.published_after is not None
+        }
+        """保存済みの, 期間で絞った検索の key"""
+
+        self.__lock = threading.RLock()
+        """pending, store, ジャーナルを更新するときに取る. API の呼び出し中は取らない"""
+        self.pending: dict[str, PendingSearch] = {}
+        for entry in self.journal.replay():
+            self.__replay_entry(entry)
+
+    def __replay_entry(self, entry: dict) -> None:
+        if "bounds" in entry:
+            self.__apply_bounds(entry["query"], entry["order"], entry["bounds"] and tuple(map(str_to_datetime, entry["bounds"])))
+            return
+
+        window = entry_window(entry)
+        key = search_key(entry["query"], entry["order"], window)
+        if entry.get("discarded"):
+            self.pending.pop(key, None)
+            return
+
+        if key not in self.pending:
+            self.pending[key] = PendingSearch(
+                str_to_datetime(entry["timestamp"]), entry["query"], entry["order"], window
+            )
+        pending = self.pending[key]
+        if entry.get("finished"):
+            self.__store_result(pending)
+            self.__finished_n += 1
+            return
+        pending.add_page(
+            [SearchResultItem.from_json(d) for d in entry["items"]],
+            entry["next_page_token"]
+        )
+        pending.page_n = entry["page_n"]
+        pending.total_results = entry.get("total_results")
+
+    def __full_query(self, query: str) -> str:
+        return query + " -" + " -".join(self.ng_words)
+
+    def estimate_cost(self, searches: list[tuple[str, str]], max_page=20) -> int:
+        """dry-run 用. (query, order) の検索を `search` したときに使うユニット数の上限. 取得済みのページは除く"""
+        done_page_n = 0
+        for query, order in searches:
+            pending = self.pending.get(search_key(self.__full_query(query), order))
+            if pending is not None:
+                done_page_n += pending.page_n
+        return estimate_search_cost(len(searches), max_page) - done_page_n * SEARCH_COST
+
+    def __pending(self, query: str, order: str, window: TimeWindow | None = None) -> PendingSearch:
+        query = self.__full_query(query)
+        key = search_key(query, order, window)
+        with self.__lock:
+            if key not in self.pending:
+                self.pending[key] = PendingSearch(datetime.datetime.now(), query, order, window)
+            return self.pending[key]
+
+    def has_next_page(self, query: str, order: str, max_page=20, window: TimeWindow | None = None) -> bool:
+        pending = self.__pending(query, order, window)
+        return pending.page_n < max_page and (pending.page_n == 0 or bool(pending.next_page_token))
+
+    def is_finished(self, query: str, order: str, window: TimeWindow) -> bool:
+        """期間で絞った検索を保存済みか. 中断した期間の検索を再開するときに, 取り終えた期間を飛ばす"""
+        return search_key(self.__full_query(query), order, window) in self.__finished_windows
+
+    def page_n(self, query: str, order: str, window: TimeWindow | None = None) -> int:
+        return self.__pending(query, order, window).page_n
+
+    def total_results(self, query: str, order: str, window: TimeWindow | None = None) -> int | None:
+        return self.__pending(query, order, window).total_results
+
+    def known_channel_ids(self) -> set[str]:
+        """保存済みと途中の検索で見つかっているチャンネル"""
+        channel_ids = self.store.channel_ids()
+        for pending in self.pending.values():
+            channel_ids.update(item.channel_id for item in pending.items.values())
+        return channel_ids
+
+    def fetch_page(self, query: str, order: str, window: TimeWindow | None = None) -> list[SearchResultItem]:
+        """query と order の検索の次の1ページを取得してジャーナルに追記する. クォータが足りなければ QuotaExceeded"""
+        pending = self.__pending(query, order, window)
+        window_params = {} if window is None else {
+            "publishedAfter": to_rfc3339(window[0]), "publishedBefore": to_rfc3339(window[1])
+        }
 
         id_fields = "id(kind,videoId)"
         snippet_fields = "snippet(publishedAt,channelId,title,description,channelTitle)"
 
-        request = self.youtube.search().list(
-            part="id,snippet",
-            maxResults=50,
-            type="video",
-            order=order,
-            q=query,
-            fields=f"nextPageToken,items({id_fields},{snippet_fields})"
-        )
-        search_result = SearchResult(
-            timestamp = datetime.datetime.now(),
-            query = query,
-            order = order,
-            items = []
-        )
-
-        i = 0
-        while request and i < max_page:
-            response = request.execute()
-            search_result.items.extend([response_to_item(r) for r in response["items"]])
-            request = self.youtube.search().list_next(request, response)
-            i += 1
-
-        self.search_results.append(search_result)
-        self.__save()
-
-    def __save(self) -> None:
-        os.makedirs(self.save_dir, exist_ok=True)
-        save_search_datum(self.search_results, self.save_path)
+        while True:
+            youtube = self.key_pool.acquire(SEARCH_COST)
+            request = youtube.search().list(
+                part="id,snippet",
+                maxResults=50,
+                type="video",
+                order=order,
+                q=pending.query,
+                fields=f"nextPageToken,pageInfo/totalResults,items({id_fields},{snippet_fields})",
+                **window_params,
+                **({"pageToken": pending.next_page_token} if pending.next_page_token else {})
+            )
+            self.metrics.counter("youtube_requests_total", method="search").inc()
+            try:
+                with self.metrics.histogram("youtube_request_seconds", method="search").time():
+                    response = request.execute()
+                break
+            except HttpError as e:
+                if not is_quota_error(e):
+                    raise
+                # 記録より先に上限に達していた. 別の key で同じページを取り直す
+                self.key_pool.exhaust(youtube)
+
+        items = [response_to_item(r) for r in response["items"]]
+        self.metrics.counter("youtube_pages_total", method="search").inc()
+        self.metrics.counter("youtube_items_total", method="search").inc(len(items))
+        with self.__lock:
+            if pending.page_n == 0:
+                pending.total_results = response.get("pageInfo", {}).get("totalResults")
+            pending.add_page(items, response.get("nextPageToken"))
+            self.journal.append([pending.to_entry(items)])
+            self.journal.flush()
+        return items
+
+    def finish(self, query: str, order: str, window: TimeWindow | None = None) -> None:
+        """途中の検索を打ち切って, そこまでの結果をストアに入れる. まとめる間隔を過ぎていれば search_store.json に保存する"""
+        pending = self.__pending(query, order, window)
+        with self.__lock:
+            self.__store_result(pending)
+            self.journal.append([{**pending.to_entry([]), "finished": True}])
+            self.journal.flush()
+            self.__finished_n += 1
+            if self.__should_compact():
+                self.compact()
+
+    def __store_result(self, pending: PendingSearch) -> None:
+        self.store.add_result(pending.to_search_result(), pending.window)
+        if pending.window is not None:
+            self.__finished_windows.add(pending.key)
+        del self.pending[pending.key]
+
+    def __should_compact(self) -> bool:
+        if self.__finished_n == 0:
+            return False
+        if self.compact_every is not None and self.__finished_n >= self.compact_every:
+            return True
+        return self.compact_interval is not None and self.clock() - self.__compacted_at >= self.compact_interval
+
+    def discard(self, query: str, order: str, window: TimeWindow | None = None) -> None:
+        """途中の検索を保存せずに捨てる. 期間を分割してやり直すときに使う"""
+        pending = self.__pending(query, order, window)
+        with self.__lock:
+            self.__discard(pending)
+            self.journal.flush()
+
+    def __discard(self, pending: PendingSearch) -> None:
+        del self.pending[pending.key]
+        self.journal.append([{**pending.to_entry([]), "discarded": True}])
+
+    def window_bounds(self, query: str, order: str, since: datetime.datetime, until: datetime.datetime) -> TimeWindow:
+        """期間に分けて検索するときの全体の期間
+
+        同じ since で途中まで検索していれば, そのときの終わりを使う. 終わりが実行ごとに変わると期間の区切りも変わり,
+        ジャーナルに残っている途中の検索が再開できない. since が変わったときは, 前の期間の途中の検索を捨てる.
+        """
+        query = self.__full_query(query)
+        with self.__lock:
+            bounds = self.store.bounds.get((query, order))
+            if bounds is not None and bounds[0] == since:
+                return bounds
+
+            for pending in [p for p in self.pending.values() if (p.query, p.order) == (query, order) and p.window is not None]:
+                self.__discard(pending)
+            self.__set_bounds(query, order, (since, until))
+            return since, until
+
+    def end_window_search(self, query: str, order: str) -> None:
+        """期間に分けた検索を最後まで取得した. 次に検索するときは新しい期間にする"""
+        with self.__lock:
+            self.__set_bounds(self.__full_query(query), order, None)
+
+    def __set_bounds(self, query: str, order: str, bounds: TimeWindow | None) -> None:
+        self.__apply_bounds(query, order, bounds)
+        self.journal.append([{"query": query, "order": order, "bounds": bounds}])
+        self.journal.flush()
+
+    def __apply_bounds(self, query: str, order: str, bounds: TimeWindow | None) -> None:
+        if bounds is None:
+            self.store.bounds.pop((query, order), None)
+        else:
+            self.store.bounds[(query, order)] = bounds
+
+    def search(self, query, order="rating", max_page=20) -> bool:
+        """
+        Returns:
+            bool: 最後まで検索できたか. クォータが足りずに止まったら False
+        """
+        with self.journal.flush_on_sigint():
+            while self.has_next_page(query, order, max_page):
+                try:
+                    self.fetch_page(query, order)
+                except QuotaExceeded as e:
+                    self.logger.warning(f"stop searching {query} ({order}) at page {self.__pending(query, order).page_n}: {e}")
+                    return False
+
+        self.finish(query, order)
+        self.compact()
+        return True
+
+    def compact(self) -> None:
+        """ストアを search_store.json に書き出して, ジャーナルには途中の検索だけを残す"""
+        with self.__lock:
+            os.makedirs(self.save_dir, exist_ok=True)
+            self.journal.compact(
+                lambda path: save_search_store(self.store, path),
+                self.save_path
+            )
+            # 他の途中の検索はジャーナルに残しておく
+            self.journal.append([
+                pending.to_entry(list(pending.items.values())) for pending in self.pending.values()
+            ])
+            self.journal.flush()
+            self.__finished_n = 0
+            self.__compacted_at = self.clock()
 
 
 def response_to_channel_data(response: dict) -> YouTubeChannelData:
-    print(response)
     return YouTubeChannelData(
         channel_id = response["id"],
         title = response["snippet"]["title"],
         description = response["snippet"]["description"],
-        publish_time = response["snippet"]["publishedAt"],
+        publish_time = str_to_datetime(response["snippet"]["publishedAt"]),
         upload_list_id = response["contentDetails"]["relatedPlaylists"]["uploads"],
         view_count = int(response["statistics"]["viewCount"]),
         subscriber_count = int(response["statistics"].get("subscriberCount", None)),
@@ -86,62 +393,69 @@ def response_to_channel_data(response: dict) -> YouTubeChannelData:
 
 class YouTubeChannelScraper:
     """ vpost で取得できていない分の VTuber のチャンネルの情報を取得"""
-    def __init__(self, save_dir: str, api_key: str, vpost_data_path: str) -> None:
+    def __init__(self,
+        save_dir: str, api_keys: list[str] | str, vpost_data_path: str,
+        ledger: QuotaLedger | None = None, etag_cache: EtagCache | None = None,
+        http_factory: HttpFactory | None = None, metrics: MetricsRegistry | None = None,
+        logger: logging.Logger | None = None
+    ) -> None:
         """
         Args:
-            save_dir (str): 保存先のディレクトリ. 取得対象の channel id も `save_dir/search_result.json` から取得.
-            api_key (str): YouTube Data API の api key
+            save_dir (str): 保存先のディレクトリ. 取得対象の channel id も `save_dir/search_store.json` から取得.
+            api_keys (list[str] | str): YouTube Data API の api key
             vpost_data_path (str): `vpost_data_path` 以下にすでに保存済みのチャンネルは取得しない.
+            http_factory (HttpFactory | None): オフラインで動かすときの http. `youtube.offline` 参照.
+            metrics (MetricsRegistry | None): リクエスト数や応答時間の記録先. None なら共有のもの.
+            logger (logging.Logger | None): None ならこのモジュールのもの.
         """
+        self.logger = logger or get_logger(__name__, logging.DEBUG)
         self.save_dir = pathlib.Path(save_dir)
         self.save_path = self.save_dir.joinpath("channels.json")
-        self.result_path = self.save_dir.joinpath(SEARCH_RESULT_JSON_NAME)
+        self.vpost_data_path = vpost_data_path
+        self.store_path = self.save_dir.joinpath(SEARCH_STORE_JSON_NAME)
 
-        self.youtube = discovery.build('youtube', 'v3', developerKey=api_key)
+        self.etag_cache = etag_cache
+        self.metrics = metrics or get_shared_metrics()
+        self.key_pool = create_key_pool(api_keys, ledger, etag_cache, http_factory, self.metrics)
+        self.batch_executor = BatchExecutor(self.key_pool, self.logger, etag_cache=etag_cache, metrics=self.metrics)
 
-        self.yt_search_list: list[SearchResult] = load_search_datum(self.result_path)
-        self.vtuber_details: list[VTuberDetails] = load_detail_datum(vpost_data_path)
+        self.search_store: SearchStore = load_search_store(self.store_path, self.save_dir.joinpath(SEARCH_RESULT_JSON_NAME))
         self.vtuber_channel_data: list[YouTubeChannelData] = []
+        self.missing_channel_ids: list[str] = []
+        """削除済みなどで情報が返ってこなかったチャンネル"""
 
         self.__extract_target()
 
     def __extract_target(self) -> None:
-        self.target: dict[str, SearchResultItem] = {}
-        detailed_ids: set[str] = set(map(lambda x: x.youtube_id, self.vtuber_details))
-        for search_result in self.yt_search_list:
-            for item in search_result.items:
-                if item.channel_id in detailed_ids:
-                    continue
-
-                if item.channel_id in self.target:
-                    continue
+        detailed_ids: set[str] = {d.youtube_id for d in iter_detail_datum(self.vpost_data_path)}
+        self.target: dict[str, SearchResultItem] = {
+            channel_id: self.search_store.channel_item(channel_id)
+            for channel_id in sorted(self.search_store.channel_ids() - detailed_ids)
+        }
 
-                self.target[item.channel_id] = item
-
-        print(f"target num is {len(self.target)}")
+        self.logger.info(f"target num is {len(self.target)}")
 
     def scrape(self) -> None:
-        target_channels = list(self.target.keys())
-        divide_n = 50
-        part_n = int(len(target_channels) / divide_n)
-        subdivided_targets = [target_channels[divide_n*i: divide_n*(i+1)] for i in range(part_n)]
-
         snippet_fields = "snippet(title,description,publishedAt)"
         content_details_fields = "contentDetails/relatedPlaylists/uploads"
         statistics_fields = "statistics(viewCount,subscriberCount,hiddenSubscriberCount,videoCount)"
 
-        for targets in subdivided_targets:
-            request = self.youtube.channels().list(
+        # id を指定した channels.list は1回で全件返るのでページングはいらない
+        result = self.batch_executor.execute(
+            lambda youtube, ids: youtube.channels().list(
                 part="id,snippet,contentDetails,statistics",
-                id=','.join(targets),
+                id=','.join(ids),
                 maxResults=50,
-                fields=f"nextPageToken,items(id,{snippet_fields},{content_details_fields},{statistics_fields})"
-            )
-
-            while request:
-                response = request.execute()
-                self.vtuber_channel_data.extend([response_to_channel_data(r) for r in response["items"]])
-                request = self.youtube.search().list_next(request, response)
+                fields=f"etag,items(id,{snippet_fields},{content_details_fields},{statistics_fields})"
+            ),
+            self.target.keys()
+        )
+        self.vtuber_channel_data.extend([response_to_channel_data(r) for r in result.found.values()])
+        self.missing_channel_ids = result.missing
+        if result.failed:
+            self.logger.warning(f"failed to get channels: {list(result.failed.keys())}")
+        if self.etag_cache is not None:
+            self.logger.info(f"etag cache: {self.etag_cache.stats()}")
 
         self.__save()
 
@@ -0,0 +1,108 @@
+"""複数の query × order の検索を, 新しいチャンネルの見つかりやすいものから順にページ送りする
+
+search.list は1ページ 100 ユニットと高いので, 全部の検索を max_page まで取るのではなく,
+直近のページで見つかった新しいチャンネル数 (収穫) が多い検索から次のページを取る.
+収穫が min_new_channels 未満のページが patience 回続いた検索は打ち切る.
+"""
+
+import heapq
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from .quota import SEARCH_COST, QuotaExceeded
+
+if TYPE_CHECKING:
+    from .scraper import YouTubeSearchScraper
+
+@dataclass
+class PlannedSearch:
+    query: str
+    order: str
+    page_n: int = 0
+    new_channel_n: int = 0
+    yields: list[int] = field(default_factory=list)
+    """ページごとの新しいチャンネル数"""
+    low_yield_run: int = 0
+    """収穫が閾値を下回ったページの連続数"""
+
+    def priority(self) -> float:
+        """小さいほど先に取る. まだ取っていない検索は最優先"""
+        if not self.yields:
+            return -float("inf")
+        return -self.yields[-1]
+
+class SearchPlanner:
+    def __init__(self,
+        scraper: "YouTubeSearchScraper", logger: logging.Logger,
+        min_new_channels: int = 3, patience: int = 2, max_page: int = 20,
+        known_channel_ids: set[str] | None = None
+    ) -> None:
+        """
+        Args:
+            min_new_channels (int): 1ページあたりの新しいチャンネル数がこれ未満なら収穫が少ないとみなす
+            patience (int): 収穫が少ないページがこの回数続いたら, その検索を打ち切る
+            known_channel_ids (set[str] | None): vpost で取得済みなど, 見つけても新しいとみなさないチャンネル
+        """
+        self.scraper = scraper
+        self.logger = logger
+        self.min_new_channels = min_new_channels
+        self.patience = patience
+        self.max_page = max_page
+
+        self.known_channel_ids: set[str] = scraper.known_channel_ids() | (known_channel_ids or set())
+        self.spent_units = 0
+
+    def run(self, searches: list[tuple[str, str]]) -> list[PlannedSearch]:
+        """searches の (query, order) を収穫の多い順に交互に取得する. クォータが足りなくなったら止まる"""
+        planned = [PlannedSearch(query, order) for query, order in searches]
+        queue = [(p.priority(), i) for i, p in enumerate(planned)]
+        heapq.heapify(queue)
+
+        with self.scraper.journal.flush_on_sigint():
+            while queue:
+                _, i = heapq.heappop(queue)
+                search = planned[i]
+                if not self.scraper.has_next_page(search.query, search.order, self.max_page):
+                    self.__finish(search, "no more pages")
+                    continue
+
+                try:
+                    items = self.scraper.fetch_page(search.query, search.order)
+                except QuotaExceeded as e:
+                    # 途中の検索はジャーナルに残っているので, 次回はそこから再開する
+                    self.logger.warning(f"stop planning: {e}")
+                    break
+                self.spent_units += SEARCH_COST
+
+                if self.__record_page(search, items):
+                    heapq.heappush(queue, (search.priority(), i))
+                else:
+                    self.__finish(search, f"yield is below {self.min_new_channels} for {self.patience} pages")
+
+        total_new_n = sum(p.new_channel_n for p in planned)
+        self.logger.info(
+            f"found {total_new_n} new channels with {self.spent_units} units "
+            f"({total_new_n / max(self.spent_units, 1) * 100:.2f} channels / 100 units)"
+        )
+        return planned
+
+    def __record_page(self, search: PlannedSearch, items) -> bool:
+        """ページの収穫を記録して, 続けるなら True"""
+        new_channel_ids = {item.channel_id for item in items} - self.known_channel_ids
+        self.known_channel_ids |= new_channel_ids
+
+        search.page_n += 1
+        search.new_channel_n += len(new_channel_ids)
+        search.yields.append(len(new_channel_ids))
+        self.logger.debug(f"{search.query} ({search.order}) page {search.page_n}: {len(new_channel_ids)} new channels")
+
+        if len(new_channel_ids) < self.min_new_channels:
+            search.low_yield_run += 1
+        else:
+            search.low_yield_run = 0
+        return search.low_yield_run < self.patience
+
+    def __finish(self, search: PlannedSearch, reason: str) -> None:
+        self.logger.info(f"finish {search.query} ({search.order}) after {search.page_n} pages, {search.new_channel_n} new channels: {reason}")
+        self.scraper.finish(search.query, search.order)
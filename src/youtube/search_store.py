@@ -0,0 +1,126 @@
+"""YouTube の検索結果を video_id ごとに1つだけ持つストア
+
+検索ごとに `SearchResult` を丸ごと積むと, 同じ動画が何度も保存されて読み込みも重くなる.
+ここでは動画は1回だけ保存し, どの検索 (query, order, timestamp) の何位で見つかったかを出典として持つ.
+チャンネルごとの索引も持つので, 取得対象のチャンネルは集合の差で求められる.
+
+保存形式 (`search_store.json`)
+```
+{
+    "runs": [{"query": ..., "order": ..., "timestamp": ...}, ...],
+    "items": [{...SearchResultItem, "hits": [[runs の添字, 順位], ...]}, ...],
+    "bounds": [{"query": ..., "order": ..., "published_after": ..., "published_before": ...}, ...]
+}
+```
+`bounds` は期間に分けて検索している途中の query の全体の期間. 再開するときに同じ期間に分けるために持つ.
+"""
+
+import os
+import json
+import datetime
+from dataclasses import dataclass, asdict
+
+from utils.file import PathLike
+from .youtube_data import SearchResult, SearchResultItem, str_to_datetime, date_handler, load_search_datum
+
+@dataclass
+class SearchRun:
+    query: str
+    order: str
+    timestamp: datetime.datetime
+    published_after: datetime.datetime | None = None
+    published_before: datetime.datetime | None = None
+    """投稿日時で期間を絞った検索なら, その期間"""
+
+    @classmethod
+    def from_json(cls, json_dict: dict):
+        for key in ("timestamp", "published_after", "published_before"):
+            if json_dict.get(key) is not None:
+                json_dict[key] = str_to_datetime(json_dict[key])
+        return cls(**json_dict)
+
+@dataclass
+class SearchHit:
+    run: SearchRun
+    rank: int
+    """検索結果の中での順位. 0 始まり"""
+
+class SearchStore:
+    def __init__(self) -> None:
+        self.runs: list[SearchRun] = []
+        self.items: dict[str, SearchResultItem] = {}
+        """key: video_id"""
+        self.hits: dict[str, list[SearchHit]] = {}
+        """key: video_id, value: その動画が見つかった検索"""
+        self.channels: dict[str, list[str]] = {}
+        """key: channel_id, value: そのチャンネルの video_id (見つかった順)"""
+        self.bounds: dict[tuple[str, str], tuple[datetime.datetime, datetime.datetime]] = {}
+        """key: (query, order), value: 期間に分けて検索している途中の, 全体の期間"""
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add_result(self, result: SearchResult, window: tuple[datetime.datetime, datetime.datetime] | None = None) -> None:
+        run = SearchRun(result.query, result.order, result.timestamp, *(window or (None, None)))
+        self.runs.append(run)
+        for rank, item in enumerate(result.items):
+            self.__add_item(item, [SearchHit(run, rank)])
+
+    def __add_item(self, item: SearchResultItem, hits: list[SearchHit]) -> None:
+        if item.video_id not in self.items:
+            self.items[item.video_id] = item
+            self.hits[item.video_id] = []
+            self.channels.setdefault(item.channel_id, []).append(item.video_id)
+        self.hits[item.video_id].extend(hits)
+
+    def channel_ids(self) -> set[str]:
+        return set(self.channels.keys())
+
+    def channel_item(self, channel_id: str) -> SearchResultItem:
+        """チャンネルで最初に見つかった動画"""
+        return self.items[self.channels[channel_id][0]]
+
+    def to_json(self) -> dict:
+        run_index = {id(run): i for i, run in enumerate(self.runs)}
+        return {
+            "runs": [asdict(run) for run in self.runs],
+            "items": [
+                {**asdict(item), "hits": [[run_index[id(hit.run)], hit.rank] for hit in self.hits[video_id]]}
+                for video_id, item in self.items.items()
+            ],
+            "bounds": [
+                {"query": query, "order": order, "published_after": after, "published_before": before}
+                for (query, order), (after, before) in self.bounds.items()
+            ],
+        }
+
+    @classmethod
+    def from_json(cls, json_dict: dict):
+        store = cls()
+        store.runs = [SearchRun.from_json(d) for d in json_dict["runs"]]
+        for d in json_dict["items"]:
+            hits = [SearchHit(store.runs[run_i], rank) for run_i, rank in d.pop("hits")]
+            store.__add_item(SearchResultItem.from_json(d), hits)
+        for d in json_dict.get("bounds", []):
+            store.bounds[(d["query"], d["order"])] = (str_to_datetime(d["published_after"]), str_to_datetime(d["published_before"]))
+        return store
+
+    @classmethod
+    def from_search_results(cls, results: list[SearchResult]):
+        store = cls()
+        for result in results:
+            store.add_result(result)
+        return store
+
+def load_search_store(json_path: PathLike, legacy_json_path: PathLike | None = None) -> SearchStore:
+    """json_path がなく legacy_json_path (`search_result.json`) があれば, そこから作る"""
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            return SearchStore.from_json(json.load(f))
+    if legacy_json_path is not None and os.path.exists(legacy_json_path):
+        return SearchStore.from_search_results(load_search_datum(legacy_json_path))
+    return SearchStore()
+
+def save_search_store(store: SearchStore, json_path: PathLike) -> None:
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(store.to_json(), f, ensure_ascii=False, indent=4, separators=(',', ': '), default=date_handler)
@@ -0,0 +1,105 @@
+"""1つの query を投稿日時の期間 (publishedAfter / publishedBefore) に分けて検索する
+
+search.list は1つの検索で 500 件程度までしか返さないので, 長い期間の動画を取りきれない.
+期間ごとに最初のページの totalResults を見て, 上限を超えていれば期間を半分に分けてやり直す.
+期間は [after, before) の半開区間で重ならないので, 同じページを2回取ることはない (分割時の最初のページを除く).
+各期間の検索は独立なので並列に動かせる.
+中断した検索を同じ全体の期間で再開すると, 期間の区切りも同じになるので, 保存済みの期間は飛ばして途中の期間は続きから取る.
+"""
+
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import TYPE_CHECKING
+
+from .quota import QuotaExceeded
+
+if TYPE_CHECKING:
+    from .scraper import YouTubeSearchScraper
+
+TimeWindow = tuple[datetime.datetime, datetime.datetime]
+"""[publishedAfter, publishedBefore)"""
+
+RESULT_CAP = 500
+"""1つの検索で取得できる件数の上限 (おおよそ)"""
+
+def to_rfc3339(dt: datetime.datetime) -> str:
+    return dt.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def window_key(window: TimeWindow) -> str:
+    return f"{to_rfc3339(window[0])}/{to_rfc3339(window[1])}"
+
+def split_window(window: TimeWindow, n: int) -> list[TimeWindow]:
+    """window を n 個の同じ長さの期間に分ける. 境界は秒単位に丸める"""
+    after, before = window
+    step = (before - after) / n
+    bounds = [after] + [(after + step * i).replace(microsecond=0) for i in range(1, n)] + [before]
+    return [(bounds[i], bounds[i+1]) for i in range(n) if bounds[i] < bounds[i+1]]
+
+class TimeWindowSearch:
+    def __init__(self,
+        scraper: "YouTubeSearchScraper", logger: logging.Logger,
+        worker_n: int = 4, result_cap: int = RESULT_CAP,
+        min_window: datetime.timedelta = datetime.timedelta(hours=1)
+    ) -> None:
+        """
+        Args:
+            worker_n (int): 並列に検索する期間の数
+            result_cap (int): totalResults がこれを超える期間は分割する
+            min_window (datetime.timedelta): これより短い期間は上限を超えていても分割しない
+        """
+        self.scraper = scraper
+        self.logger = logger
+        self.worker_n = worker_n
+        self.result_cap = result_cap
+        self.min_window = min_window
+
+    def search(self, query: str, order: str, window: TimeWindow, initial_split: int = 1) -> bool:
+        """
+        Args:
+            window (TimeWindow): 検索する期間全体
+            initial_split (int): 最初に期間を何個に分けておくか. 分割の probe を減らせる
+        Returns:
+            bool: 最後まで検索できたか. クォータが足りずに止まったら False
+        """
+        quota_error: QuotaExceeded | None = None
+        with self.scraper.journal.flush_on_sigint(), ThreadPoolExecutor(max_workers=self.worker_n) as executor:
+            running: dict[Future, TimeWindow] = {
+                executor.submit(self.__search_window, query, order, w): w
+                for w in split_window(window, initial_split)
+            }
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    try:
+                        children = future.result()
+                    except QuotaExceeded as e:
+                        quota_error = e
+                        continue
+                    if quota_error is not None:
+                        continue
+                    for child in children:
+                        running[executor.submit(self.__search_window, query, order, child)] = child
+
+        if quota_error is not None:
+            self.logger.warning(f"stop searching {query} ({order}): {quota_error}")
+            return False
+        return True
+
+    def __search_window(self, query: str, order: str, window: TimeWindow) -> list[TimeWindow]:
+        """window を検索する. 上限を超えていれば検索せずに分割した期間を返す"""
+        if self.scraper.is_finished(query, order, window):
+            return []
+        if self.scraper.page_n(query, order, window) == 0:
+            self.scraper.fetch_page(query, order, window)
+            total_results = self.scraper.total_results(query, order, window) or 0
+            if total_results > self.result_cap and window[1] - window[0] >= self.min_window * 2:
+                self.logger.debug(f"{query} ({order}) {window_key(window)} has {total_results} results. bisect")
+                self.scraper.discard(query, order, window)
+                return split_window(window, 2)
+
+        while self.scraper.has_next_page(query, order, window=window):
+            self.scraper.fetch_page(query, order, window)
+        self.scraper.finish(query, order, window)
+        return []
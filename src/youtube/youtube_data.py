@@ -1,13 +1,24 @@
-import json
 import re
 import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from utils.file import PathLike, iter_json_records, save_records
+from utils.codec import Codec, DatetimeFormat
+from utils.records import variant
 
 def str_to_datetime(timestamp: str) -> datetime.datetime:
     timestamp = timestamp.replace("Z", "+00:00")
     timestamp = re.sub(r"\.[\d]+", "", timestamp)
     return datetime.datetime.fromisoformat(timestamp)
 
+def decode_timestamp(timestamp: str) -> datetime.datetime:
+    """str_to_datetime と同じ結果. 保存した isoformat の文字列は置き換えずにそのままパースする"""
+    if "Z" in timestamp or "." in timestamp:
+        return str_to_datetime(timestamp)
+    return datetime.datetime.fromisoformat(timestamp)
+
+YOUTUBE_DATETIME = DatetimeFormat(datetime.datetime.isoformat, decode_timestamp)
 
 @dataclass
 class SearchResultItem:
@@ -27,6 +38,9 @@ class SearchResultItem:
         json_dict["publish_time"] = str_to_datetime(json_dict["publish_time"])
         return cls(**json_dict)
 
+SlottedSearchResultItem = variant(SearchResultItem)
+FrozenSearchResultItem = variant(SearchResultItem, frozen=True)
+
 @dataclass
 class SearchResult:
     timestamp: datetime.datetime
@@ -45,18 +59,21 @@ class SearchResult:
             items = items
         )
 
-def load_search_datum(json_path) -> list[SearchResult]:
-    with open(json_path, "r", encoding="utf-8") as f:
-        search_results_dict = json.load(f)
-        return [SearchResult.from_json(vdd) for vdd in search_results_dict]
+SEARCH_CODEC = Codec(SearchResult, YOUTUBE_DATETIME)
+
+def iter_search_datum(json_path: PathLike) -> Iterator[SearchResult]:
+    """JSON でも JSON Lines でも, 1件ずつ読み込む"""
+    return map(SEARCH_CODEC.decode, iter_json_records(json_path))
+
+def load_search_datum(json_path: PathLike) -> list[SearchResult]:
+    return list(iter_search_datum(json_path))
 
 def date_handler(obj):
     return obj.isoformat() if hasattr(obj, 'isoformat') else obj
 
-def save_search_datum(datum: list[SearchResult], json_path) -> None:
-    save_obj = [asdict(d) for d in datum]
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(save_obj, f, ensure_ascii=False, indent=4, separators=(',', ': '), default=date_handler)
+def save_search_datum(datum: Iterable[SearchResult], json_path: PathLike) -> None:
+    """拡張子が .jsonl なら JSON Lines で保存する"""
+    save_records(json_path, map(SEARCH_CODEC.encode, datum))
 
 @dataclass
 class YouTubeChannelData:
@@ -77,13 +94,15 @@ class YouTubeChannelData:
         json_dict["publish_time"] = str_to_datetime(json_dict["publish_time"])
         return cls(**json_dict)
 
+CHANNEL_CODEC = Codec(YouTubeChannelData, YOUTUBE_DATETIME)
+
+def iter_channel_datum(json_path: PathLike) -> Iterator[YouTubeChannelData]:
+    """JSON でも JSON Lines でも, 1件ずつ読み込む"""
+    return map(CHANNEL_CODEC.decode, iter_json_records(json_path))
 
-def load_channel_datum(json_path) -> list[YouTubeChannelData]:
-    with open(json_path, "r", encoding="utf-8") as f:
-        channel_data_dict = json.load(f)
-        return [YouTubeChannelData.from_json(vdd) for vdd in channel_data_dict]
+def load_channel_datum(json_path: PathLike) -> list[YouTubeChannelData]:
+    return list(iter_channel_datum(json_path))
 
-def save_channel_datum(datum: list[YouTubeChannelData], json_path) -> None:
-    save_obj = [asdict(d) for d in datum]
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(save_obj, f, ensure_ascii=False, indent=4, separators=(',', ': '), default=date_handler)
+def save_channel_datum(datum: Iterable[YouTubeChannelData], json_path: PathLike) -> None:
+    """拡張子が .jsonl なら JSON Lines で保存する"""
+    save_records(json_path, map(CHANNEL_CODEC.encode, datum))
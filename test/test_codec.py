@@ -0,0 +1,86 @@
+import pytest
+
+import os
+import json
+import datetime
+from dataclasses import asdict
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from utils.codec import *
+from utils.file import save_records
+from dataset_for_annotator.data_types.common import *
+from dataset_for_annotator.data_types.merged import *
+from vpost.vtuber_data import *
+from vpost.vtuber_data import date_handler as vpost_date_handler
+from youtube.youtube_data import *
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+def merged_datum() -> list[VTuberMergedData]:
+    create_at = datetime.datetime(2022, 10, 1, 12, 34, 56, 789, tzinfo=JST)
+    return [
+        VTuberMergedData("a", create_at, YouTubeData("UCa", "名前\n\"a\"", None, create_at, 10, 20, 3, 3)),
+        VTuberMergedData(
+            "b", create_at, YouTubeData("UCb"),
+            YouTubeVideoData("v", "自己紹介", None, create_at),
+            TwitterData("b_twitter", recent_tweet_urls=["https://twitter.com/b/status/1"]),
+        ),
+        VTuberMergedData("c", create_at, YouTubeData("UCc"), MissingValue.NotExist, MissingValue.Failed),
+    ]
+
+def read(path: Path) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+@pytest.mark.parametrize("suffix", [".json", ".jsonl"])
+def test_merged_codec_matches_asdict(suffix):
+    datum = merged_datum()
+    save_records(TEMP_DIR.joinpath(f"codec_asdict{suffix}"), map(asdict, datum), date_handler)
+    save_vtuber_merged_datum(datum, TEMP_DIR.joinpath(f"codec_merged{suffix}"))
+    assert read(TEMP_DIR.joinpath(f"codec_asdict{suffix}")) == read(TEMP_DIR.joinpath(f"codec_merged{suffix}"))
+
+    loaded = load_vtuber_merged_datum(TEMP_DIR.joinpath(f"codec_merged{suffix}"))
+    assert loaded == datum
+    assert loaded == [VTuberMergedData.from_json(d) for d in json.loads(json.dumps([asdict(d) for d in datum], default=date_handler))]
+
+def test_empty_twitter_id_is_unacquired():
+    d = VTUBER_MERGED_CODEC.encode(merged_datum()[1])
+    d["twitter"]["twitter_id"] = ""
+    assert VTUBER_MERGED_CODEC.decode(d).twitter is MissingValue.Unacquired
+
+def test_detail_codec_uses_timestamp_format():
+    details = [
+        VTuberDetails("UCa", None, None, [VideoData("v1", "t", datetime.datetime(2022, 1, 2, 3, 4), 10, None)]),
+        VTuberDetails("UCb", "説明", "b_twitter", []),
+    ]
+    save_records(TEMP_DIR.joinpath("codec_detail_asdict.json"), map(asdict, details), vpost_date_handler)
+    save_detail_datum(details, TEMP_DIR.joinpath("codec_detail.json"))
+    assert read(TEMP_DIR.joinpath("codec_detail_asdict.json")) == read(TEMP_DIR.joinpath("codec_detail.json"))
+    assert load_detail_datum(TEMP_DIR.joinpath("codec_detail.json")) == details
+
+    # 古いファイルには description, twitter_id がない
+    assert DETAIL_CODEC.decode({"youtube_id": "UCc", "recent_videos": []}) == VTuberDetails("UCc", None, None, [])
+
+def test_search_codec_decodes_api_timestamps():
+    d = {
+        "timestamp": "2022-10-01T00:00:00.123Z", "query": "VTuber", "order": "date",
+        "items": [{
+            "kind": "youtube#video", "video_id": "v", "publish_time": "2022-09-30T12:00:00Z",
+            "title": "t", "description": "", "channel_id": "UCa", "channel_title": "a",
+        }],
+    }
+    assert SEARCH_CODEC.decode(json.loads(json.dumps(d))) == SearchResult.from_json(json.loads(json.dumps(d)))
+
+def test_strftime_format_fallback():
+    fmt = strftime_format("%Y/%m/%d %H:%M")
+    assert fmt.decode("2022/01/02 03:04") == datetime.datetime(2022, 1, 2, 3, 4)
+    assert fmt.decode("2022/1/2 3:04") == datetime.datetime(2022, 1, 2, 3, 4)
+    for d in (datetime.datetime(2022, 11, 12, 13, 14), datetime.datetime(999, 1, 2, 3, 4)):
+        assert fmt.encode(d) == d.strftime("%Y/%m/%d %H:%M")
@@ -0,0 +1,77 @@
+import pytest
+
+import os
+import json
+import shutil
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from youtube.etag_cache import *
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+class FakeResponse(dict):
+    def __init__(self, status: int, etag: str | None = None) -> None:
+        super().__init__(status=str(status), **({"etag": etag} if etag else {}))
+        self.status = status
+
+class FakeHttp:
+    """If-None-Match が今の etag と同じなら 304 を返す"""
+    def __init__(self) -> None:
+        self.etag = "v1"
+        self.content = b'{"items": [1]}'
+        self.sent_headers = []
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.sent_headers.append(headers)
+        if headers.get("if-none-match") == self.etag:
+            return FakeResponse(304), b""
+        return FakeResponse(200, self.etag), self.content
+
+@pytest.fixture
+def cache() -> EtagCache:
+    path = TEMP_DIR.joinpath("test_etag_cache")
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    return EtagCache(path)
+
+def test_request_key_ignores_api_key_and_order():
+    assert request_key("https://x/youtube/v3/channels?id=a&key=K1&part=id") == request_key("https://x/youtube/v3/channels?part=id&key=K2&id=a")
+
+def test_caching_http_serves_304_from_cache(cache):
+    http = FakeHttp()
+    caching_http = CachingHttp(http, cache)
+    uri = "https://x/youtube/v3/playlistItems?playlistId=UU1&key=K"
+
+    _, content = caching_http.request(uri, headers={})
+    assert content == http.content
+
+    response, content = caching_http.request(uri, headers={})
+    assert http.sent_headers[-1]["if-none-match"] == "v1"
+    assert response.status == 200
+    assert content == http.content
+
+    http.etag, http.content = "v2", b'{"items": [2]}'
+    _, content = caching_http.request(uri, headers={})
+    assert content == b'{"items": [2]}'
+    assert cache.stats() == {"requests": 3, "hits": 1, "hit_rate": 1 / 3}
+
+def test_resolve_batch_response(cache):
+    class Request:
+        uri = "https://x/youtube/v3/channels?id=UC1"
+        headers = {}
+    class NotModified(Exception):
+        resp = FakeResponse(304)
+
+    response = {"etag": "v1", "items": [{"id": "UC1"}]}
+    assert cache.resolve(Request, response, None) == (response, None)
+
+    cache.prepare(Request)
+    assert Request.headers["if-none-match"] == "v1"
+    assert cache.resolve(Request, None, NotModified()) == (response, None)
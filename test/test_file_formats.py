@@ -0,0 +1,70 @@
+import pytest
+
+import os
+import json
+import datetime
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from utils.file import *
+from dataset_for_annotator.data_types.common import *
+from dataset_for_annotator.data_types.merged import *
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+RECORDS = [
+    {"id": i, "text": "改行\nと \"引用符\" " * (i % 7), "values": [1, 2.5, None, True], "nested": {"n": -i}}
+    for i in range(200)
+]
+
+@pytest.mark.parametrize("shape_output", [True, False])
+def test_save_records_matches_save_json(shape_output):
+    save_json(TEMP_DIR.joinpath("records_a.json"), RECORDS, shape_output=shape_output)
+    save_records(TEMP_DIR.joinpath("records_b.json"), iter(RECORDS), shape_output=shape_output)
+    with open(TEMP_DIR.joinpath("records_a.json"), encoding="utf-8") as a, open(TEMP_DIR.joinpath("records_b.json"), encoding="utf-8") as b:
+        assert a.read() == b.read()
+
+    save_records(TEMP_DIR.joinpath("records_empty.json"), [])
+    assert load_json(TEMP_DIR.joinpath("records_empty.json")) == []
+
+@pytest.mark.parametrize("chunk_size", [1, 7, READ_CHUNK_SIZE])
+def test_iter_json_array(chunk_size):
+    save_json(TEMP_DIR.joinpath("records_array.json"), RECORDS + [1234567, "end"])
+    assert list(iter_json_array(TEMP_DIR.joinpath("records_array.json"), chunk_size)) == RECORDS + [1234567, "end"]
+
+def test_detect_and_convert():
+    json_path = TEMP_DIR.joinpath("records_convert.json")
+    jsonl_path = TEMP_DIR.joinpath("records_convert.jsonl")
+    save_json(json_path, RECORDS, shape_output=False)
+    assert not is_jsonl(json_path)
+
+    assert convert_records(json_path, jsonl_path) == len(RECORDS)
+    assert is_jsonl(jsonl_path)
+    with open(jsonl_path, encoding="utf-8") as f:
+        assert json.loads(f.readline()) == RECORDS[0]
+
+    # 拡張子が .json のままでも中身で判定する
+    renamed_path = TEMP_DIR.joinpath("records_convert_renamed.json")
+    os.replace(jsonl_path, renamed_path)
+    assert is_jsonl(renamed_path)
+    assert list(iter_json_records(renamed_path)) == RECORDS
+
+def test_typed_jsonl_roundtrip():
+    datum = [
+        VTuberMergedData(
+            f"UC{i}", datetime.datetime.fromisoformat("2022-01-01T00:00:00+09:00"),
+            YouTubeData(f"UC{i}", f"テスト{i}", video_count_n=i),
+            YouTubeVideoData(f"video{i}", "【自己紹介】", None, datetime.datetime.fromisoformat("2019-04-20T08:30:00+09:00")),
+        )
+        for i in range(5)
+    ]
+    save_vtuber_merged_datum(iter(datum), TEMP_DIR.joinpath("merged.jsonl"))
+    loaded = iter_vtuber_merged_datum(TEMP_DIR.joinpath("merged.jsonl"))
+    assert next(loaded) == datum[0]
+    assert list(loaded) == datum[1:]
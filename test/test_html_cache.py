@@ -0,0 +1,79 @@
+import pytest
+
+import os
+import shutil
+import logging
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from vpost.html_cache import *
+from vpost.reparse import reparse_vtuber_datum, reparse_detail_datum
+from test_vpost_parser import LIST_PAGE_HTML, DETAIL_PAGE_HTML
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+@pytest.fixture
+def cache_dir() -> Path:
+    path = TEMP_DIR.joinpath("test_html_cache")
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    return path
+
+def test_same_html_is_stored_once(cache_dir):
+    cache = HtmlCache(cache_dir)
+    a = cache.put(list_page_key(1, 100, 1), LIST_PAGE_KIND, LIST_PAGE_HTML, page_num=1)
+    b = cache.put(list_page_key(1, 100, 2), LIST_PAGE_KIND, LIST_PAGE_HTML, page_num=2)
+    assert a.sha256 == b.sha256
+    assert len(list(cache_dir.joinpath(HtmlCache.OBJECTS_DIR).glob("*/*.html.gz"))) == 1
+
+    reloaded = HtmlCache(cache_dir)
+    assert reloaded.get(list_page_key(1, 100, 2)) == LIST_PAGE_HTML
+    assert reloaded.get(list_page_key(1, 100, 3)) is None
+
+    expired = HtmlCache(cache_dir, ttl=-1)
+    assert expired.get(list_page_key(1, 100, 1)) is None
+
+def test_reparse_from_cache(cache_dir):
+    cache = HtmlCache(cache_dir)
+    cache.put(list_page_key(1, 100, 1), LIST_PAGE_KIND, LIST_PAGE_HTML, page_num=1)
+    cache.put("detail?id=UCabc-123_x", DETAIL_PAGE_KIND, DETAIL_PAGE_HTML, youtube_id="UCabc-123_x")
+    cache.put("detail?id=broken", DETAIL_PAGE_KIND, "<html></html>", youtube_id="broken")
+
+    logger = logging.getLogger(__name__)
+    vtuber_datum = reparse_vtuber_datum(HtmlCache(cache_dir, ttl=None), logger)
+    assert [d.youtube_id for d in vtuber_datum] == ["UCabc-123_x", "UCdef456"]
+
+    detail_datum = reparse_detail_datum(HtmlCache(cache_dir, ttl=None), logger)
+    assert [d.youtube_id for d in detail_datum] == ["UCabc-123_x"]
+
+def test_prune_drops_history_and_least_recently_used(cache_dir):
+    cache = HtmlCache(cache_dir)
+    cache.put("a", DETAIL_PAGE_KIND, "<html>a 1</html>")
+    cache.put("a", DETAIL_PAGE_KIND, "<html>a 2</html>")
+    cache.put("b", DETAIL_PAGE_KIND, "<html>b</html>")
+    cache.put("c", DETAIL_PAGE_KIND, "<html>c</html>")
+    assert cache.get("a") == "<html>a 2</html>"
+
+    # 上書きされた a の古い本文だけ消える
+    total = cache.size()
+    removed = cache.prune()
+    assert removed > 0 and cache.size() == total - removed
+    with open(cache.index_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+
+    # 最後に使ったのが一番古い b が消える
+    cache.prune(max_bytes=cache.size() - 1)
+    assert sorted(cache.entries) == ["a", "c"]
+    reloaded = HtmlCache(cache_dir)
+    assert reloaded.get("b") is None
+    assert reloaded.get("a") == "<html>a 2</html>" and reloaded.get("c") == "<html>c</html>"
+    assert len(list(cache_dir.joinpath(HtmlCache.OBJECTS_DIR).glob("*/*.html.gz"))) == 2
+
+    reloaded.prune(max_age=-1)
+    assert reloaded.entries == {} and reloaded.size() == 0
@@ -0,0 +1,81 @@
+import pytest
+
+import os
+import json
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from utils.journal import *
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+@pytest.fixture
+def journal_path() -> Path:
+    path = TEMP_DIR.joinpath("test_journal.jsonl")
+    if os.path.exists(path):
+        os.remove(path)
+    return path
+
+def test_replay_appended_entries(journal_path):
+    journal = Journal(journal_path)
+    journal.append([{"youtube_id": "a", "n": 1}, {"youtube_id": "b", "n": 2}])
+    journal.append([{"youtube_id": "a", "n": 3}])
+    journal.close()
+
+    assert list(Journal(journal_path).replay()) == [
+        {"youtube_id": "a", "n": 1}, {"youtube_id": "b", "n": 2}, {"youtube_id": "a", "n": 3}
+    ]
+
+def test_replay_ignores_truncated_last_line(journal_path):
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write('{"youtube_id": "a"}\n{"youtube_id": "b"}\n{"youtube_')
+
+    assert list(Journal(journal_path).replay()) == [{"youtube_id": "a"}, {"youtube_id": "b"}]
+
+def test_append_after_crash_drops_truncated_line(journal_path):
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write('{"youtube_id": "a"}\n{"youtube_')
+
+    # 再開して追記しても, 途中で止まった行とつながらない
+    journal = Journal(journal_path)
+    journal.append([{"youtube_id": "b"}])
+    journal.close()
+    assert list(Journal(journal_path).replay()) == [{"youtube_id": "a"}, {"youtube_id": "b"}]
+
+    # 改行が1つもないときは全部捨てる
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write('{"youtube_')
+    journal = Journal(journal_path)
+    journal.append([{"youtube_id": "c"}])
+    journal.close()
+    assert list(Journal(journal_path).replay()) == [{"youtube_id": "c"}]
+
+def test_truncate_partial_line_across_blocks(journal_path):
+    with open(journal_path, "wb") as f:
+        f.write(b'{"youtube_id": "a"}\n' + b"x" * 100)
+    assert truncate_partial_line(journal_path, block_size=7) == 100
+    assert os.path.getsize(journal_path) == len(b'{"youtube_id": "a"}\n')
+    assert truncate_partial_line(journal_path) == 0
+
+def test_compact_writes_and_clears(journal_path):
+    save_path = TEMP_DIR.joinpath("test_journal_compacted.json")
+    journal = Journal(journal_path)
+    journal.append([{"youtube_id": "a"}])
+
+    def save(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([e for e in Journal(journal_path).replay()], f)
+
+    journal.flush()
+    journal.compact(save, save_path)
+
+    with open(save_path, "r", encoding="utf-8") as f:
+        assert json.load(f) == [{"youtube_id": "a"}]
+    assert not os.path.exists(journal_path)
+    assert list(journal.replay()) == []
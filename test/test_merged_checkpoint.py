@@ -0,0 +1,138 @@
+import pytest
+
+import os
+import logging
+import datetime
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from utils.journal import Journal
+from utils.metrics import MetricsRegistry
+from dataset_for_annotator.data_types.common import *
+from dataset_for_annotator.data_types.merged import *
+from dataset_for_annotator.merged_checkpoint import *
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+CREATE_AT = datetime.datetime(2022, 10, 1, tzinfo=JST)
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def paths() -> tuple[Path, Path]:
+    json_path = TEMP_DIR.joinpath("checkpoint_merged.json")
+    journal_path = TEMP_DIR.joinpath("checkpoint_merged.journal.jsonl")
+    for path in (json_path, journal_path):
+        if os.path.exists(path):
+            os.remove(path)
+    return json_path, journal_path
+
+def make_datum(n: int) -> BuilderMergedData:
+    return {f"UC{i}": VTuberMergedData(f"UC{i}", CREATE_AT, YouTubeData(f"UC{i}", f"名前{i}")) for i in range(n)}
+
+def make_checkpoint(paths, **kwargs) -> MergedCheckpoint:
+    return MergedCheckpoint(*paths, metrics=MetricsRegistry(), logger=logging.getLogger(__name__), **kwargs)
+
+def test_save_appends_only_dirty_records(paths):
+    datum = make_datum(5)
+    checkpoint = make_checkpoint(paths, compact_every=None, compact_interval=None)
+    assert checkpoint.save(datum) == 5
+    assert checkpoint.save(datum) == 0
+
+    # その場で書き換えたものも拾う
+    datum["UC1"].youtube.got_video_n = 10
+    datum["UC3"].target_video = MissingValue.NotExist
+    assert checkpoint.save(datum) == 2
+    assert [e["vtuber_id"] for e in Journal(paths[1]).replay()] == ["UC0", "UC1", "UC2", "UC3", "UC4", "UC1", "UC3"]
+    assert not os.path.exists(paths[0])
+
+    # merged.json がなくてもジャーナルから戻せる
+    assert make_checkpoint(paths).load() == datum
+
+def test_load_replays_journal_over_merged_json(paths):
+    datum = make_datum(3)
+    checkpoint = make_checkpoint(paths, compact_every=None, compact_interval=None)
+    checkpoint.save(datum, compact=True)
+    assert not os.path.exists(paths[1])
+
+    datum["UC2"].youtube.name = "変更"
+    checkpoint.save(datum, [datum["UC2"]])
+    # 書き込み途中で止まった行は捨てる
+    with open(paths[1], "a", encoding="utf-8") as f:
+        f.write('{"vtuber_id": "UC0", "crea')
+
+    loaded = make_checkpoint(paths).load()
+    assert loaded == datum
+    assert load_vtuber_merged_datum(paths[0])[2].youtube.name == "名前2"
+
+def test_compact_by_count_and_interval(paths):
+    clock = FakeClock()
+    datum = make_datum(10)
+    checkpoint = make_checkpoint(paths, compact_every=15, compact_interval=60.0, clock=clock)
+    checkpoint.save(datum)
+    assert os.path.exists(paths[1]) and not os.path.exists(paths[0])
+
+    for data in list(datum.values())[:5]:
+        data.youtube.got_video_n = 1
+    checkpoint.save(datum)
+    assert os.path.exists(paths[0]) and not os.path.exists(paths[1])
+    assert load_vtuber_merged_datum(paths[0]) == list(datum.values())
+
+    datum["UC0"].youtube.got_video_n = 2
+    checkpoint.save(datum)
+    assert os.path.exists(paths[1])
+    clock.now = 61.0
+    checkpoint.save(datum)
+    assert not os.path.exists(paths[1])
+    assert load_vtuber_merged_datum(paths[0])[0].youtube.got_video_n == 2
+
+def test_failed_compaction_keeps_previous_files(paths):
+    datum = make_datum(3)
+    checkpoint = make_checkpoint(paths, compact_every=None, compact_interval=None)
+    checkpoint.save(datum, compact=True)
+    with open(paths[0], encoding="utf-8") as f:
+        before = f.read()
+
+    datum["UC0"].youtube.name = "変更"
+    checkpoint.save(datum)
+
+    def broken_save(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("[")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        checkpoint.journal.compact(broken_save, paths[0])
+    with open(paths[0], encoding="utf-8") as f:
+        assert f.read() == before
+    assert make_checkpoint(paths).load() == datum
+
+def test_save_with_changed_encodes_only_changed(paths, monkeypatch):
+    import dataset_for_annotator.merged_checkpoint as merged_checkpoint
+    datum = make_datum(100)
+    checkpoint = make_checkpoint(paths, compact_every=None, compact_interval=None)
+    checkpoint.save(datum, compact=True)
+
+    encoded = []
+    original = merged_checkpoint.fingerprint
+    monkeypatch.setattr(merged_checkpoint, "fingerprint", lambda data: encoded.append(data.vtuber_id) or original(data))
+    datum["UC1"].youtube.got_video_n = 10
+    assert checkpoint.save(datum, [datum["UC1"], datum["UC2"]]) == 1
+    assert sorted(encoded) == ["UC1", "UC1", "UC2"]
+
+    # まとめるときに全件を比べ直さない
+    encoded.clear()
+    checkpoint.save(datum, [], compact=True)
+    assert encoded == []
+    assert make_checkpoint(paths).load() == datum
@@ -0,0 +1,81 @@
+import pytest
+
+import os
+import datetime
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from dataset_for_annotator.data_types.common import *
+from dataset_for_annotator.data_types.merged import *
+from dataset_for_annotator.data_filter import *
+from dataset_for_annotator.merged_store import *
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+CREATE_AT = datetime.datetime.fromisoformat("2022-01-01T00:00:00+09:00")
+
+def merged_data(vtuber_id: str, name: str, video_count_n, got_video_n, target_video=MissingValue.Unacquired) -> VTuberMergedData:
+    return VTuberMergedData(vtuber_id, CREATE_AT, YouTubeData(vtuber_id, name, None, None, 100, 1000, video_count_n, got_video_n), target_video)
+
+@pytest.fixture
+def store() -> MergedDataStore:
+    db_path = TEMP_DIR.joinpath("test_merged_store.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(f"{db_path}{suffix}"):
+            os.remove(f"{db_path}{suffix}")
+    store = MergedDataStore(db_path)
+    yield store
+    store.close()
+
+@pytest.fixture
+def datum() -> list[VTuberMergedData]:
+    video = YouTubeVideoData("video1", "【自己紹介】はじめまして", None, datetime.datetime.fromisoformat("2019-04-20T08:30:00+09:00"))
+    return [
+        merged_data("UC-few", "動画の少ない人", 2, None),
+        merged_data("UC-clip", "切り抜きチャンネル", 100, 100),
+        merged_data("UC-unknown", "動画数不明", None, None),
+        merged_data("UC-found", "自己紹介した人", 10, 10, video),
+        merged_data("UC-gone", "自己紹介がない人", 10, 12, MissingValue.NotExist),
+    ]
+
+def test_upsert_and_get(store, datum):
+    store.upsert(datum)
+    assert len(store) == 5
+    assert store.get("UC-found") == datum[3]
+
+    datum[0].youtube.got_video_n = 2
+    store.upsert([datum[0]])
+    assert len(store) == 5
+    assert store.get("UC-few").youtube.got_video_n == 2
+    assert [d.vtuber_id for d in store.select()] == [d.vtuber_id for d in datum]
+
+@pytest.mark.parametrize("filter_conds", [
+    youtube_basic_filter_conds,
+    youtube_filter_conds,
+    (got_upload_lists,),
+    (tried_to_get_self_intro_video, enough_uploads),
+])
+def test_select_matches_python_filters(store, datum, filter_conds):
+    store.upsert(datum)
+    expected = list(adopt_filters(filter_conds, datum))
+    assert list(store.select(filter_conds)) == expected
+
+def test_transaction_rollback(store, datum):
+    store.upsert(datum[:1])
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.upsert(datum[1:])
+            raise RuntimeError()
+    assert len(store) == 1
+
+def test_export_json(store, datum):
+    store.upsert(datum)
+    json_path = TEMP_DIR.joinpath("test_merged_store.json")
+    store.export_json(json_path)
+    assert load_vtuber_merged_datum(json_path) == datum
@@ -0,0 +1,72 @@
+import pytest
+
+import json
+import math
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from utils.metrics import *
+
+TEMP_DIR = Path("temp")
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_counter_and_histogram():
+    metrics = MetricsRegistry()
+    metrics.counter("requests_total", host="a").inc()
+    metrics.counter("requests_total", host="a").inc(2)
+    metrics.counter("requests_total", host="b").inc()
+    histogram = metrics.histogram("request_seconds", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+
+    snapshot = metrics.to_json()
+    assert {s["labels"]["host"]: s["value"] for s in snapshot["counters"]["requests_total"]} == {"a": 3, "b": 1}
+    assert histogram.cumulative() == [(0.1, 1), (1.0, 3), (math.inf, 4)]
+    assert snapshot["histograms"]["request_seconds"][0]["sum"] == pytest.approx(4.25)
+
+def test_progress_eta():
+    clock = FakeClock()
+    metrics = MetricsRegistry(clock)
+    progress = metrics.progress("pages", 100)
+    assert progress.eta() is None
+
+    clock.now = 10.0
+    progress.advance(20)
+    assert progress.rate() == pytest.approx(2.0)
+    assert progress.eta() == pytest.approx(40.0)
+    assert str(progress) == "pages: 20/100 (2.00/s, ETA 0:00:40)"
+
+def test_prometheus_and_export():
+    clock = FakeClock()
+    metrics = MetricsRegistry(clock)
+    metrics.describe("http_requests_total", "HTTP requests")
+    metrics.counter("http_requests_total", host="vtuber-post.com").inc(5)
+    metrics.histogram("http_request_seconds", buckets=(1.0,), host="vtuber-post.com").observe(0.5)
+    metrics.progress("videos", 10)
+    clock.now = 2.0
+    metrics.progress("videos", 10).advance(4)
+
+    text = metrics.to_prometheus()
+    assert "# HELP http_requests_total HTTP requests" in text
+    assert 'http_requests_total{host="vtuber-post.com"} 5' in text
+    assert 'http_request_seconds_bucket{host="vtuber-post.com",le="1"} 1' in text
+    assert 'http_request_seconds_bucket{host="vtuber-post.com",le="+Inf"} 1' in text
+    assert 'progress_done{task="videos"} 4' in text
+
+    TEMP_DIR.mkdir(exist_ok=True)
+    json_path = TEMP_DIR.joinpath("metrics.json")
+    with metrics.exporting(json_path, interval=60):
+        metrics.counter("http_requests_total", host="vtuber-post.com").inc()
+    with open(json_path, "r", encoding="utf-8") as f:
+        assert json.load(f)["counters"]["http_requests_total"][0]["value"] == 6
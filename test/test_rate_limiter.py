@@ -0,0 +1,66 @@
+import pytest
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from utils.rate_limiter import *
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+def test_acquire_waits_for_token(clock):
+    limiter = HostRateLimiter(initial_rate=0.5, burst=1.0, clock=clock, sleep=clock.sleep)
+    limiter.acquire("https://example.com/a")
+    assert clock.now == 0.0
+    limiter.acquire("https://example.com/b")
+    assert clock.now == pytest.approx(2.0)
+
+    # ホストが違えば待たない
+    limiter.acquire("https://example.org/")
+    assert clock.now == pytest.approx(2.0)
+
+def test_rate_adapts_to_responses(clock):
+    limiter = HostRateLimiter(
+        initial_rate=1.0, min_rate=0.1, max_rate=1.2, target_latency=1.0,
+        increase_step=0.1, decrease_factor=0.5, clock=clock, sleep=clock.sleep
+    )
+    url = "https://example.com/"
+
+    for _ in range(5):
+        limiter.report(url, latency=0.1)
+    assert limiter.rate(url) == pytest.approx(1.2) # 上限で止まる
+
+    limiter.report(url, error=True)
+    assert limiter.rate(url) == pytest.approx(0.6)
+
+    limiter.report(url, latency=3.0)
+    assert limiter.rate(url) == pytest.approx(0.6 * 0.5 ** 0.5)
+
+    for _ in range(10):
+        limiter.report(url, error=True)
+    assert limiter.rate(url) == pytest.approx(0.1) # 下限で止まる
+
+def test_request_reports_error(clock):
+    limiter = HostRateLimiter(initial_rate=1.0, clock=clock, sleep=clock.sleep)
+    url = "https://example.com/"
+    with pytest.raises(OSError):
+        with limiter.request(url):
+            raise OSError("connection reset")
+
+    assert limiter.rate(url) == pytest.approx(0.5)
+    assert limiter.stats()["example.com"]["error_n"] == 1
@@ -0,0 +1,61 @@
+import pytest
+
+import datetime
+import dataclasses
+from dataclasses import asdict
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from utils.codec import Codec
+from utils.records import *
+from dataset_for_annotator.data_types.common import *
+from dataset_for_annotator.data_types.merged import *
+from vpost.vtuber_data import VideoData, FrozenVideoData
+from youtube.youtube_data import SearchResultItem, FrozenSearchResultItem
+
+TIMESTAMP = datetime.datetime(2022, 10, 1, 12, 0, tzinfo=JST)
+
+@pytest.mark.parametrize("cls", [VideoData, YouTubeVideoData, SearchResultItem, YouTubeData, VTuberMergedData])
+def test_record_types_keep_dict_and_slotted_variant_does_not(cls):
+    # 公開している型は今まで通り __dict__ を持ち, 後から属性を足せる
+    assert "__slots__" not in vars(cls)
+    slotted = variant(cls)
+    assert slotted.__name__ == "Slotted" + cls.__name__
+    assert "__slots__" in vars(slotted)
+    assert "__dict__" not in dir(slotted)
+
+def test_record_types_accept_extra_attributes():
+    video = YouTubeVideoData("v", "自己紹介", None, TIMESTAMP)
+    video.note = "メモ"
+    assert video.note == "メモ"
+    with pytest.raises(AttributeError):
+        SlottedYouTubeVideoData("v", "自己紹介", None, TIMESTAMP).note = "メモ"
+
+def test_frozen_variant():
+    video = FrozenYouTubeVideoData("v", "自己紹介", None, TIMESTAMP)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        video.title = "変更"
+    assert not hasattr(video, "__dict__")
+    assert len({video, FrozenYouTubeVideoData("v", "自己紹介", None, TIMESTAMP)}) == 1
+
+    # from_json と asdict は元の型と同じように使える
+    original = YouTubeVideoData("v", "自己紹介", None, TIMESTAMP)
+    json_dict = asdict(original, dict_factory=lambda items: {k: date_handler(v) for k, v in items})
+    assert asdict(FrozenYouTubeVideoData.from_json(dict(json_dict))) == asdict(original)
+    assert isinstance(FrozenVideoData.from_json({
+        "video_id": "v", "title": None, "timestamp": "2022/10/01 12:00", "view_n": None, "good": None
+    }), FrozenVideoData)
+
+    codec = Codec(FrozenYouTubeVideoData)
+    assert codec.decode(codec.encode(video)) == video
+
+def test_variant_keeps_defaults():
+    item = SlottedYouTubeData("UC0")
+    assert asdict(item) == asdict(YouTubeData("UC0"))
+    assert not hasattr(item, "__dict__")
+    assert FrozenSearchResultItem.__name__ == "FrozenSearchResultItem"
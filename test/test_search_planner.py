@@ -0,0 +1,74 @@
+import pytest
+
+import logging
+import datetime
+import contextlib
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from youtube.search_planner import *
+from youtube.youtube_data import SearchResultItem
+
+def item(channel_id: str) -> SearchResultItem:
+    return SearchResultItem("#video", f"v-{channel_id}", datetime.datetime(2022, 1, 1), "", "", channel_id, "")
+
+class FakeJournal:
+    def flush_on_sigint(self):
+        return contextlib.nullcontext()
+
+class FakeSearchScraper:
+    """query ごとに決まったページを返す"""
+    def __init__(self, pages: dict[str, list[list[str]]], budget_pages: int = 100) -> None:
+        self.pages = pages
+        self.page_n = {query: 0 for query in pages}
+        self.fetched: list[str] = []
+        self.finished: list[str] = []
+        self.budget_pages = budget_pages
+        self.journal = FakeJournal()
+
+    def known_channel_ids(self):
+        return {"UC_known"}
+
+    def has_next_page(self, query, order, max_page):
+        return self.page_n[query] < min(max_page, len(self.pages[query]))
+
+    def fetch_page(self, query, order):
+        if len(self.fetched) >= self.budget_pages:
+            raise QuotaExceeded("budget")
+        page = self.pages[query][self.page_n[query]]
+        self.page_n[query] += 1
+        self.fetched.append(query)
+        return [item(c) for c in page]
+
+    def finish(self, query, order):
+        self.finished.append(query)
+
+def test_planner_stops_low_yield_query():
+    scraper = FakeSearchScraper({
+        # 2ページ目以降は既出のチャンネルばかり
+        "dry": [["a", "b", "c"], ["a", "b", "UC_known"], ["a"], ["b"], ["c"]],
+        "rich": [["d", "e", "f"], ["g", "h", "i"], ["j", "k", "l"]],
+    })
+    planner = SearchPlanner(scraper, logging.getLogger(__name__), min_new_channels=2, patience=2)
+    planned = planner.run([("dry", "date"), ("rich", "date")])
+
+    assert scraper.page_n == {"dry": 3, "rich": 3}
+    assert sorted(scraper.finished) == ["dry", "rich"]
+    assert [p.new_channel_n for p in planned] == [3, 9]
+    assert planner.spent_units == 6 * SEARCH_COST
+
+def test_planner_prefers_higher_yield_and_stops_at_budget():
+    scraper = FakeSearchScraper({
+        "dry": [["a"], ["b"], ["c"]],
+        "rich": [["d", "e", "f"], ["g", "h", "i"], ["j", "k", "l"]],
+    }, budget_pages=4)
+    planner = SearchPlanner(scraper, logging.getLogger(__name__), min_new_channels=1, patience=1)
+    planner.run([("dry", "date"), ("rich", "date")])
+
+    assert scraper.fetched == ["dry", "rich", "rich", "rich"]
+    assert scraper.finished == ["rich"]
@@ -0,0 +1,64 @@
+import pytest
+
+import os
+import datetime
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from youtube.search_store import *
+from youtube.youtube_data import SearchResult, SearchResultItem, save_search_datum
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+def item(video_id: str, channel_id: str) -> SearchResultItem:
+    return SearchResultItem(
+        "#video", video_id, datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc),
+        f"title {video_id}", "", channel_id, f"channel {channel_id}"
+    )
+
+RESULTS = [
+    SearchResult(datetime.datetime(2022, 1, 2), "VTuber自己紹介", "rating", [item("v1", "UC1"), item("v2", "UC2")]),
+    SearchResult(datetime.datetime(2022, 1, 3), "VTuber自己紹介", "date", [item("v3", "UC1"), item("v1", "UC1")]),
+]
+
+def test_store_keeps_each_video_once_with_provenance():
+    store = SearchStore.from_search_results(RESULTS)
+    assert len(store) == 3
+    assert [(h.run.order, h.rank) for h in store.hits["v1"]] == [("rating", 0), ("date", 1)]
+    assert store.channels == {"UC1": ["v1", "v3"], "UC2": ["v2"]}
+    assert store.channel_ids() - {"UC1"} == {"UC2"}
+
+def test_save_and_load_store():
+    path = TEMP_DIR.joinpath("test_search_store.json")
+    store = SearchStore.from_search_results(RESULTS)
+    save_search_store(store, path)
+
+    loaded = load_search_store(path)
+    assert loaded.items == store.items
+    assert [(h.run, h.rank) for h in loaded.hits["v1"]] == [(h.run, h.rank) for h in store.hits["v1"]]
+    assert loaded.hits["v1"][1].run is loaded.runs[1]
+
+def test_load_from_legacy_search_result():
+    path = TEMP_DIR.joinpath("test_search_store_missing.json")
+    legacy_path = TEMP_DIR.joinpath("test_search_result.json")
+    if os.path.exists(path):
+        os.remove(path)
+    save_search_datum(RESULTS, legacy_path)
+
+    store = load_search_store(path, legacy_path)
+    assert sorted(store.items.keys()) == ["v1", "v2", "v3"]
+
+def test_save_and_load_bounds():
+    path = TEMP_DIR.joinpath("test_search_store.json")
+    store = SearchStore.from_search_results(RESULTS)
+    bounds = (datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc), datetime.datetime(2022, 10, 1, tzinfo=datetime.timezone.utc))
+    store.bounds[("VTuber自己紹介", "date")] = bounds
+    save_search_store(store, path)
+
+    assert load_search_store(path).bounds == {("VTuber自己紹介", "date"): bounds}
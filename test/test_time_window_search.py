@@ -0,0 +1,106 @@
+import pytest
+
+import logging
+import datetime
+import threading
+import contextlib
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from youtube.time_window_search import *
+
+UTC = datetime.timezone.utc
+START = datetime.datetime(2022, 1, 1, tzinfo=UTC)
+
+class FakeJournal:
+    def flush_on_sigint(self):
+        return contextlib.nullcontext()
+
+class FakeWindowScraper:
+    """1時間に1本ずつ投稿されている動画を, 1ページ2件で返す"""
+    PAGE_SIZE = 2
+
+    def __init__(self, video_n: int) -> None:
+        self.videos = [START + datetime.timedelta(hours=i) for i in range(video_n)]
+        self.journal = FakeJournal()
+        self.lock = threading.Lock()
+        self.pages: dict[TimeWindow, int] = {}
+        self.fetched_page_n = 0
+        self.finished: dict[TimeWindow, list[datetime.datetime]] = {}
+
+    def __in_window(self, window):
+        return [v for v in self.videos if window[0] <= v < window[1]]
+
+    def is_finished(self, query, order, window):
+        return window in self.finished
+
+    def page_n(self, query, order, window):
+        return self.pages.get(window, 0)
+
+    def total_results(self, query, order, window):
+        return len(self.__in_window(window))
+
+    def has_next_page(self, query, order, max_page=20, window=None):
+        return self.page_n(query, order, window) * self.PAGE_SIZE < len(self.__in_window(window))
+
+    def fetch_page(self, query, order, window):
+        with self.lock:
+            self.pages[window] = self.pages.get(window, 0) + 1
+            self.fetched_page_n += 1
+
+    def discard(self, query, order, window):
+        del self.pages[window]
+
+    def finish(self, query, order, window):
+        with self.lock:
+            self.finished[window] = self.__in_window(window)
+
+def test_split_window():
+    windows = split_window((START, START + datetime.timedelta(days=3)), 3)
+    assert windows[0] == (START, START + datetime.timedelta(days=1))
+    assert windows[-1][1] == START + datetime.timedelta(days=3)
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+
+def test_bisects_windows_over_cap_without_overlap():
+    scraper = FakeWindowScraper(video_n=40)
+    searcher = TimeWindowSearch(scraper, logging.getLogger(__name__), worker_n=3, result_cap=6)
+    assert searcher.search("VTuber自己紹介", "date", (START, START + datetime.timedelta(hours=64)))
+
+    found = sorted(v for videos in scraper.finished.values() for v in videos)
+    assert found == scraper.videos
+    assert all(len(videos) <= 6 for videos in scraper.finished.values())
+    windows = sorted(scraper.finished.keys())
+    assert all(a[1] <= b[0] for a, b in zip(windows, windows[1:]))
+
+def test_resume_skips_finished_windows():
+    window = (START, START + datetime.timedelta(hours=64))
+    uninterrupted = FakeWindowScraper(video_n=40)
+    TimeWindowSearch(uninterrupted, logging.getLogger(__name__), worker_n=1, result_cap=6).search("VTuber自己紹介", "date", window)
+
+    class QuotaAfter(FakeWindowScraper):
+        def __init__(self, video_n, limit):
+            super().__init__(video_n)
+            self.limit = limit
+
+        def fetch_page(self, query, order, window):
+            if self.limit is not None and self.fetched_page_n >= self.limit:
+                raise QuotaExceeded("test")
+            super().fetch_page(query, order, window)
+
+    scraper = QuotaAfter(video_n=40, limit=10)
+    searcher = TimeWindowSearch(scraper, logging.getLogger(__name__), worker_n=1, result_cap=6)
+    assert not searcher.search("VTuber自己紹介", "date", window)
+    finished_before = set(scraper.finished)
+    assert finished_before
+
+    # 同じ期間で再開すると, 保存済みの期間は取り直さない
+    scraper.limit = None
+    fetched_before = scraper.fetched_page_n
+    assert searcher.search("VTuber自己紹介", "date", window)
+    assert sorted(v for videos in scraper.finished.values() for v in videos) == scraper.videos
+    assert scraper.fetched_page_n - fetched_before < uninterrupted.fetched_page_n
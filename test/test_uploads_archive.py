@@ -0,0 +1,98 @@
+import pytest
+
+import os
+import shutil
+import datetime
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from dataset_for_annotator.data_types.common import *
+from dataset_for_annotator.data_types.merged import *
+from dataset_for_annotator.uploads_archive import *
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+@pytest.fixture
+def archive_dir() -> Path:
+    path = TEMP_DIR.joinpath("uploads_archive")
+    shutil.rmtree(path, ignore_errors=True)
+    return path
+
+def make_videos(channel_id: str, n: int) -> list[YouTubeVideoData]:
+    timestamp = datetime.datetime(2022, 10, 1, tzinfo=datetime.timezone.utc)
+    return [
+        YouTubeVideoData(f"{channel_id}_{i}", f"【自己紹介】動画{i}", "説明\n" * i, timestamp + datetime.timedelta(days=i))
+        for i in range(n)
+    ]
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_save_and_load(archive_dir, compress):
+    archive = UploadsArchive(archive_dir, compress=compress)
+    for i in range(5):
+        archive.save(f"UC{i}", make_videos(f"UC{i}", i))
+    # 読んだ後に書き足したものも読める
+    assert archive.load("UC3") == make_videos("UC3", 3)
+    archive.save("UC9", make_videos("UC9", 2))
+    assert archive.load("UC9") == make_videos("UC9", 2)
+    assert archive.load("UC_missing") is None
+    archive.close()
+
+    reopened = UploadsArchive(archive_dir)
+    assert reopened.channel_ids() == ["UC0", "UC1", "UC2", "UC3", "UC4", "UC9"]
+    assert reopened.video_count("UC4") == 4
+    assert [reopened.load(f"UC{i}") for i in range(5)] == [make_videos(f"UC{i}", i) for i in range(5)]
+    reopened.close()
+
+def test_replace_and_compact(archive_dir):
+    archive = UploadsArchive(archive_dir)
+    archive.save("UC0", make_videos("UC0", 3))
+    archive.save("UC1", make_videos("UC1", 3))
+    archive.save("UC0", make_videos("UC0", 5))
+    assert archive.load("UC0") == make_videos("UC0", 5)
+    assert archive.garbage_ratio() > 0
+
+    old_data_path = archive.data_path
+    archive.compact()
+    assert not os.path.exists(old_data_path)
+    assert archive.garbage_ratio() == 0
+    assert archive.load("UC0") == make_videos("UC0", 5)
+    archive.save("UC2", make_videos("UC2", 1))
+    archive.close()
+
+    reopened = UploadsArchive(archive_dir)
+    assert reopened.data_path != old_data_path
+    assert [reopened.video_count(id) for id in reopened.channel_ids()] == [5, 3, 1]
+    assert reopened.load("UC1") == make_videos("UC1", 3)
+    reopened.close()
+
+def test_truncated_index_entry_is_ignored(archive_dir):
+    archive = UploadsArchive(archive_dir)
+    archive.save("UC0", make_videos("UC0", 2))
+    archive.close()
+    with open(archive_dir.joinpath(INDEX_NAME), "a", encoding="utf-8") as f:
+        f.write('{"channel_id": "UC1", "offs')
+
+    assert UploadsArchive(archive_dir).channel_ids() == ["UC0"]
+
+def test_import_and_export_keep_per_file_layout(archive_dir):
+    source_dir = TEMP_DIR.joinpath("uploads_source")
+    export_dir = TEMP_DIR.joinpath("uploads_export")
+    shutil.rmtree(source_dir, ignore_errors=True)
+    shutil.rmtree(export_dir, ignore_errors=True)
+    source = UploadsDir(source_dir)
+    for i in range(3):
+        source.save(f"UC{i}", make_videos(f"UC{i}", i + 1))
+
+    archive = UploadsArchive(archive_dir, compress=True)
+    assert import_uploads_dir(source_dir, archive) == 3
+    assert export_uploads_dir(archive, export_dir) == 3
+    archive.close()
+    for i in range(3):
+        with open(source.path(f"UC{i}"), "rb") as a, open(export_dir.joinpath(f"UC{i}.json"), "rb") as b:
+            assert a.read() == b.read()
@@ -0,0 +1,108 @@
+import pytest
+
+import datetime
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from vpost.parser import *
+from vpost.vtuber_data import VTuberData, VTuberDetails, VideoData
+
+LIST_PAGE_HTML = """
+<html><body>
+<form name="search" action="./index.php" method="post">
+    <input type="hidden" name="page" value="0">
+    <select name="limit"><option value="20" selected>20</option><option value="100">100</option></select>
+    <select name="order"><option value="1">新着順</option><option value="2">古い順</option></select>
+    <input type="checkbox" name="non_movie" value="1">
+    <input type="submit" id="search_submit" value="検索">
+</form>
+<ul class="vtuber_list">
+    <li class="clearfix">
+        <div class="name">テスト 太郎</div>
+        <div class="channel"><a href="https://www.youtube.com/channel/UCabc-123_x">YouTube</a></div>
+        <div class="regist">1,234人</div>
+        <div class="play">56,789回</div>
+        <div class="upload">12本</div>
+        <div class="group">個人勢</div>
+    </li>
+    <li class="clearfix">
+        <div class="name">テスト 花子</div>
+        <div class="channel"><a href="https://www.youtube.com/channel/UCdef456">YouTube</a></div>
+        <div class="regist">5人</div>
+        <div class="play">0回</div>
+        <div class="upload">1本</div>
+        <div class="group"></div>
+    </li>
+</ul>
+<div class="pagenation">
+    <a href="javascript:void(0)" onclick="FormSubmit(1)">2</a>
+    <span class="now">3</span>
+    <a href="javascript:void(0)" onclick="FormSubmit(3)">4</a>
+    <a href="javascript:void(0)" onclick="FormSubmit(9)">10</a>
+</div>
+</body></html>
+"""
+
+DETAIL_PAGE_HTML = """
+<html><body>
+<p class="desc">はじめまして！<br>テストです。</p>
+<dl class="group"><dt>Twitter</dt><dd><a href="https://twitter.com/test_taro">@test_taro</a></dd></dl>
+<div class="movie_list">
+    <div class="clearfix">
+        <div class="title"><a videoid="video1">【自己紹介】テスト 太郎です</a></div>
+        <div class="time">2022/01/02 03:04</div>
+        <div class="play">1,000回</div>
+        <div class="eval">20</div>
+    </div>
+    <div class="clearfix">
+        <div class="title"><a videoid="broken">壊れた動画</a></div>
+        <div class="time">----/--/-- --:--</div>
+        <div class="play">1回</div>
+        <div class="eval">0</div>
+    </div>
+</div>
+</body></html>
+"""
+
+def test_parse_list_page():
+    page = parse_list_page(LIST_PAGE_HTML)
+    assert page.vtuber_datum == [
+        VTuberData("テスト 太郎", "UCabc-123_x", None, 1234, 56789, 12, "個人勢"),
+        VTuberData("テスト 花子", "UCdef456", None, 5, 0, 1, ""),
+    ]
+    assert page.page_num == 3
+    assert page.last_page_num == 10
+    assert page.has_next
+
+def test_parse_list_page_raises_lookup_error_on_unexpected_markup():
+    # http backend は LookupError で Selenium に切り替える
+    html = LIST_PAGE_HTML.replace('<span class="now">3</span>', '<span class="now">三</span>')
+    assert html != LIST_PAGE_HTML
+    with pytest.raises(LookupError):
+        parse_list_page(html)
+
+def test_parse_detail_page():
+    details = parse_detail_page(DETAIL_PAGE_HTML, "UCabc-123_x")
+    assert details == VTuberDetails(
+        "UCabc-123_x", "はじめまして！\nテストです。", "@test_taro",
+        [VideoData("video1", "【自己紹介】テスト 太郎です", datetime.datetime(2022, 1, 2, 3, 4), 1000, 20)]
+    )
+
+def test_parse_search_form():
+    action, fields = parse_search_form(LIST_PAGE_HTML)
+    assert action == "./index.php"
+    assert fields == {"page": "0", "limit": "20", "order": "1"}
+    assert find_checkbox_value(LIST_PAGE_HTML, "non_movie") == "1"
+
+def test_script_rows_match_parser():
+    # execute_script で受け取る dict と, HTML パーサーが作る dict は同じ変換を通る
+    from vpost.extract_script import rows_to_vtuber_datum
+    rows = [node_to_row(node) for node in parse_html(LIST_PAGE_HTML).find("vtuber_list").find_all("clearfix")]
+    assert rows_to_vtuber_datum(rows) == parse_list_page(LIST_PAGE_HTML).vtuber_datum
+    with pytest.raises(LookupError):
+        rows_to_vtuber_datum(None)
@@ -0,0 +1,103 @@
+import pytest
+
+import os
+import logging
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from youtube.batch import *
+from youtube.quota import ApiKeyPool, QuotaLedger
+from youtube.offline import OfflineHttp, SyntheticYouTube
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+class FakeBatch:
+    def __init__(self, callback, responses) -> None:
+        self.callback = callback
+        self.responses = responses
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        for request_id, ids in self.requests:
+            response, exception = self.responses(ids)
+            self.callback(request_id, response, exception)
+
+class FakeYouTube:
+    def __init__(self, responses) -> None:
+        self.responses = responses
+        self.batches: list[FakeBatch] = []
+
+    def new_batch_http_request(self, callback):
+        batch = FakeBatch(callback, self.responses)
+        self.batches.append(batch)
+        return batch
+
+class FakeKeyPool:
+    def __init__(self, youtube) -> None:
+        self.youtube = youtube
+        self.charged = 0
+
+    def acquire(self, units):
+        self.charged += units
+        return self.youtube
+
+    def exhaust(self, client):
+        pass
+
+def test_chunk_ids_keeps_last_partial_chunk():
+    ids = [f"UC{i}" for i in range(120)] + ["UC0"]
+    chunks = chunk_ids(ids)
+    assert [len(c) for c in chunks] == [50, 50, 20]
+    assert sum(chunks, []) == [f"UC{i}" for i in range(120)]
+
+def test_execute_maps_items_and_reports_missing():
+    def responses(ids):
+        if "UC_error" in ids:
+            return None, RuntimeError("500")
+        return {"items": [{"id": id} for id in ids if id != "UC_deleted"]}, None
+
+    youtube = FakeYouTube(responses)
+    key_pool = FakeKeyPool(youtube)
+    executor = BatchExecutor(key_pool, logging.getLogger(__name__), ids_per_request=2, requests_per_batch=2)
+    result = executor.execute(lambda youtube, ids: ids, ["UC1", "UC2", "UC_deleted", "UC3", "UC_error", "UC4"])
+
+    assert len(youtube.batches) == 2
+    assert key_pool.charged == 3
+    assert sorted(result.found.keys()) == ["UC1", "UC2", "UC3"]
+    assert result.missing == ["UC_deleted"]
+    assert sorted(result.failed.keys()) == ["UC4", "UC_error"]
+
+def test_execute_with_discovery_client():
+    from googleapiclient import discovery
+    from googleapiclient.errors import HttpError
+
+    ledger_path = TEMP_DIR.joinpath("test_youtube_batch_quota.json")
+    if ledger_path.exists():
+        os.remove(ledger_path)
+    backend = SyntheticYouTube.generate(channel_n=5, videos_per_channel=1, seed=2)
+    # 3件目の中のリクエストから 403 quotaExceeded
+    key_pool = ApiKeyPool(["K"], QuotaLedger(ledger_path), build=lambda key: discovery.build(
+        "youtube", "v3", developerKey=key, http=OfflineHttp(backend, quota_exceeded_after=2), static_discovery=True
+    ))
+    executor = BatchExecutor(key_pool, logging.getLogger(__name__), ids_per_request=2, requests_per_batch=2)
+    c = list(backend.channels.keys())
+    result = executor.execute(
+        lambda youtube, ids: youtube.channels().list(part="id,snippet", id=",".join(ids)),
+        [c[0], c[1], c[2], "UCdeleted", c[3], c[4]]
+    )
+
+    assert list(result.found.keys()) == c[:3]
+    assert result.found[c[0]]["snippet"]["title"] == backend.channels[c[0]]["snippet"]["title"]
+    assert result.missing == ["UCdeleted"]
+    assert sorted(result.failed.keys()) == [c[3], c[4]]
+    assert all(isinstance(e, HttpError) and e.status_code == 403 for e in result.failed.values())
+    assert key_pool.remaining() == 0
@@ -0,0 +1,68 @@
+import pytest
+
+import os
+import shutil
+import logging
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from dataset_for_annotator.collector.youtube import *
+from dataset_for_annotator.uploads_archive import UploadsDir
+from utils.metrics import MetricsRegistry
+from youtube.quota import ApiKeyPool, QuotaLedger
+from youtube.offline import OfflineHttp, SyntheticYouTube, error_content
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+class FailingSecondPage:
+    """2ページ目以降は 500 backendError を返す"""
+    def __init__(self, backend: SyntheticYouTube) -> None:
+        self.backend = backend
+
+    def respond(self, method: str, uri: str) -> tuple[int, dict]:
+        if "pageToken=" in uri:
+            return 500, error_content(500, "backendError")
+        return self.backend.respond(method, uri)
+
+@pytest.fixture
+def collector_setup():
+    from googleapiclient import discovery
+
+    save_dir = TEMP_DIR.joinpath("test_youtube_collector")
+    shutil.rmtree(save_dir, ignore_errors=True)
+    os.makedirs(save_dir)
+    backend = SyntheticYouTube.generate(channel_n=5, videos_per_channel=60, seed=4)
+    key_pool = ApiKeyPool(["K"], QuotaLedger(save_dir.joinpath("quota.json")), build=lambda key: discovery.build(
+        "youtube", "v3", developerKey=key, http=OfflineHttp(FailingSecondPage(backend)), static_discovery=True
+    ))
+    metrics = MetricsRegistry()
+    collector = YouTubeCollector(key_pool, save_dir.joinpath("uploads"), logging.getLogger(__name__), metrics=metrics)
+    return backend, collector, metrics
+
+def test_failed_page_keeps_stored_upload_list(collector_setup):
+    backend, collector, metrics = collector_setup
+    # 1ページ (50件) に収まらないチャンネル
+    channel_ids = [
+        id for id, channel in backend.channels.items()
+        if len(backend.uploads[channel["contentDetails"]["relatedPlaylists"]["uploads"]]) > 60
+    ][:2]
+    stored_id, new_id = channel_ids
+    stored_videos = response_to_video_list(backend.uploads[user_id_to_upload_list_id(stored_id)][-5:])
+    collector.uploads.save(stored_id, stored_videos)
+
+    results = {}
+    collector.harvest_upload_video_lists(
+        [UploadListTarget(stored_id), UploadListTarget(new_id)],
+        lambda id, n: results.__setitem__(id, n), worker_n=2
+    )
+
+    assert results == {}
+    assert collector.uploads.load(stored_id) == stored_videos
+    assert new_id not in collector.uploads
+    assert metrics.counter("youtube_upload_list_errors_total").value == 2
@@ -0,0 +1,83 @@
+import pytest
+
+import json
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from youtube.offline import *
+
+API = "https://youtube.googleapis.com/youtube/v3"
+
+@pytest.fixture(scope="module")
+def backend() -> SyntheticYouTube:
+    return SyntheticYouTube.generate(channel_n=5, videos_per_channel=30, seed=1)
+
+def get(http: OfflineHttp, uri: str, headers: dict | None = None):
+    response, content = http.request(uri, "GET", headers=headers or {})
+    return response, json.loads(content) if content else None
+
+def test_playlist_items_pagination_and_404(backend):
+    http = OfflineHttp(backend)
+    list_id, uploads = next((k, v) for k, v in backend.uploads.items() if len(v) > 50)
+
+    video_ids = []
+    page_token = None
+    while True:
+        uri = f"{API}/playlistItems?playlistId={list_id}&maxResults=50&key=K" + (f"&pageToken={page_token}" if page_token else "")
+        response, content = get(http, uri)
+        assert response.status == 200
+        video_ids += [item["snippet"]["resourceId"]["videoId"] for item in content["items"]]
+        page_token = content.get("nextPageToken")
+        if not page_token:
+            break
+    assert video_ids == [item["snippet"]["resourceId"]["videoId"] for item in uploads]
+
+    response, content = get(http, f"{API}/playlistItems?playlistId=UUunknown&key=K")
+    assert response.status == 404
+    assert content["error"]["errors"][0]["reason"] == "playlistNotFound"
+
+def test_search_window_and_etag(backend):
+    http = OfflineHttp(backend)
+    uri = f"{API}/search?q=VTuber自己紹介+-shorts&order=date&maxResults=50&publishedAfter=2019-01-01T00:00:00Z&key=K"
+    response, content = get(http, uri)
+    assert all("VTuber自己紹介" in item["snippet"]["title"] for item in content["items"])
+    assert all(item["snippet"]["publishedAt"] >= "2019-01-01T00:00:00Z" for item in content["items"])
+
+    response, _ = get(http, uri, {"If-None-Match": response["etag"]})
+    assert response.status == 304
+
+def test_errors_and_quota(backend):
+    http = OfflineHttp(backend, quota_exceeded_after=1)
+    assert get(http, f"{API}/channels?id=UC0000000000000000000000&key=K")[0].status == 200
+    response, content = get(http, f"{API}/channels?id=UC0000000000000000000000&key=K")
+    assert response.status == 403
+    assert content["error"]["errors"][0]["reason"] == "quotaExceeded"
+
+    http = OfflineHttp(backend, error_rate=1.0)
+    assert get(http, f"{API}/channels?id=x&key=K")[0].status == 500
+
+def test_batch_request(backend):
+    from googleapiclient import discovery
+    from googleapiclient.errors import HttpError
+
+    youtube = discovery.build("youtube", "v3", developerKey="K", http=OfflineHttp(backend), static_discovery=True)
+    channel_ids = list(backend.channels.keys())
+    results = {}
+    def callback(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    batch = youtube.new_batch_http_request(callback=callback)
+    batch.add(youtube.channels().list(part="id", id=",".join(channel_ids[:3])), request_id="a")
+    batch.add(youtube.channels().list(part="id", id=f"{channel_ids[3]},UCdeleted"), request_id="b")
+    batch.add(youtube.playlistItems().list(part="snippet", playlistId="UUdeleted"), request_id="c")
+    batch.execute()
+
+    assert [item["id"] for item in results["a"][0]["items"]] == channel_ids[:3]
+    assert [item["id"] for item in results["b"][0]["items"]] == [channel_ids[3]]
+    response, exception = results["c"]
+    assert response is None and isinstance(exception, HttpError) and exception.status_code == 404
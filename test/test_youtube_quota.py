@@ -0,0 +1,116 @@
+import pytest
+
+import os
+import datetime
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from youtube.quota import *
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+@pytest.fixture
+def ledger_path() -> Path:
+    path = TEMP_DIR.joinpath("test_youtube_quota.json")
+    if os.path.exists(path):
+        os.remove(path)
+    return path
+
+def test_pacific_day_boundary():
+    # UTC 07:59 は太平洋夏時間ではまだ前日
+    assert pacific_day(datetime.datetime(2022, 7, 2, 6, 59, tzinfo=datetime.timezone.utc)) == "2022-07-01"
+    assert pacific_day(datetime.datetime(2022, 7, 2, 7, 0, tzinfo=datetime.timezone.utc)) == "2022-07-02"
+
+def test_ledger_persists_and_resets_daily(ledger_path):
+    now = datetime.datetime(2022, 7, 2, 12, 0, tzinfo=datetime.timezone.utc)
+    ledger = QuotaLedger(ledger_path, daily_quota=250, now=lambda: now)
+    assert ledger.charge("key", SEARCH_COST)
+    assert ledger.charge("key", SEARCH_COST)
+    assert not ledger.charge("key", SEARCH_COST)
+
+    ledger.flush()
+    assert QuotaLedger(ledger_path, daily_quota=250, now=lambda: now).remaining("key") == 50
+    assert "key" not in ledger_path.read_text()
+
+    tomorrow = now + datetime.timedelta(days=1)
+    assert QuotaLedger(ledger_path, daily_quota=250, now=lambda: tomorrow).remaining("key") == 250
+
+def test_ledgers_in_separate_processes_keep_each_others_charges(ledger_path):
+    # 同じファイルを使う2つのプロセスの代わり
+    a = QuotaLedger(ledger_path, daily_quota=1000, flush_interval=None)
+    b = QuotaLedger(ledger_path, daily_quota=1000, flush_interval=None)
+    assert a.charge("key", 100) and b.charge("key", SEARCH_COST * 2)
+    assert not ledger_path.exists()
+
+    a.flush()
+    b.flush()
+    assert b.used("key") == 300
+    assert QuotaLedger(ledger_path, daily_quota=1000).used("key") == 300
+
+    b.exhaust("key")
+    assert not b.charge("key", 1)
+    a.charge("key", 1)
+    a.flush()
+    assert a.remaining("key") == 0
+
+def test_ledger_flushes_by_interval(ledger_path):
+    now = [0.0]
+    ledger = QuotaLedger(ledger_path, flush_interval=10.0, clock=lambda: now[0])
+    ledger.charge("key", LIST_COST)
+    assert not ledger_path.exists()
+    now[0] = 10.0
+    ledger.charge("key", LIST_COST)
+    assert QuotaLedger(ledger_path).used("key") == 2
+
+def test_key_pool_spreads_and_stops_at_budget(ledger_path):
+    ledger = QuotaLedger(ledger_path, daily_quota=200)
+    pool = ApiKeyPool(["a", "b"], ledger, build=lambda key: f"client-{key}")
+
+    clients = [pool.acquire(SEARCH_COST) for _ in range(4)]
+    assert sorted(clients) == ["client-a", "client-a", "client-b", "client-b"]
+    with pytest.raises(QuotaExceeded):
+        pool.acquire(SEARCH_COST)
+    assert pool.remaining() == 0
+
+def test_estimate_upload_list_cost():
+    # channels.list 1回 + 1ページ + 3ページ + 空でも1ページ
+    assert estimate_upload_list_cost([10, 120, 0]) == 1 + 1 + 3 + 1
+
+def test_key_pool_builds_client_per_thread(ledger_path):
+    import threading
+    pool = ApiKeyPool(["a"], QuotaLedger(ledger_path), build=lambda key: object())
+
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(pool.acquire(LIST_COST))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(set(map(id, clients))) == 3
+    assert pool.acquire(LIST_COST) is pool.acquire(LIST_COST)
+    pool.exhaust(clients[0])
+    assert pool.remaining() == 0
+
+def test_is_quota_error_checks_reason():
+    import json
+    from googleapiclient.errors import HttpError
+    from youtube.offline import OfflineResponse, error_content
+
+    def http_error(status: int, reason: str | None) -> HttpError:
+        content = error_content(status, reason) if reason else {"error": {"code": status, "message": "forbidden"}}
+        return HttpError(OfflineResponse(status), json.dumps(content).encode("utf-8"))
+
+    assert is_quota_error(http_error(403, "quotaExceeded"))
+    assert is_quota_error(http_error(403, "dailyLimitExceeded"))
+    assert is_quota_error(http_error(403, "rateLimitExceeded"))
+    assert not is_quota_error(http_error(403, "forbidden"))
+    assert not is_quota_error(http_error(403, None))
+    assert not is_quota_error(http_error(500, "quotaExceeded"))
+    assert not is_quota_error(RuntimeError("403"))
@@ -0,0 +1,52 @@
+import pytest
+
+import os
+import json
+import logging
+import shutil
+import datetime
+
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+from youtube.scraper import *
+from youtube.offline import OfflineHttp, SyntheticYouTube
+from youtube.search_store import SearchStore, save_search_store
+from youtube.youtube_data import SearchResult, SearchResultItem
+
+TEMP_DIR = Path("temp")
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+def test_channel_scraper_saves_channels_from_responses():
+    save_dir = TEMP_DIR.joinpath("test_youtube_scraper")
+    shutil.rmtree(save_dir, ignore_errors=True)
+    os.makedirs(save_dir)
+    backend = SyntheticYouTube.generate(channel_n=3, videos_per_channel=1, seed=3)
+    channel_ids = list(backend.channels.keys()) + ["UCdeleted"]
+
+    published = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+    items = [SearchResultItem("#video", f"v{i}", published, "", "", id, "") for i, id in enumerate(channel_ids)]
+    save_search_store(
+        SearchStore.from_search_results([SearchResult(published, "VTuber", "date", items)]),
+        save_dir.joinpath(SEARCH_STORE_JSON_NAME)
+    )
+    vpost_data_path = save_dir.joinpath("vpost_detail.json")
+    with open(vpost_data_path, "w", encoding="utf-8") as f:
+        json.dump([], f)
+
+    scraper = YouTubeChannelScraper(
+        str(save_dir), "K", str(vpost_data_path),
+        ledger=QuotaLedger(save_dir.joinpath("quota.json")),
+        http_factory=lambda: OfflineHttp(backend), logger=logging.getLogger(__name__)
+    )
+    scraper.scrape()
+
+    assert scraper.missing_channel_ids == ["UCdeleted"]
+    loaded = load_channel_datum(scraper.save_path)
+    assert [d.channel_id for d in loaded] == channel_ids[:3]
+    assert loaded[0].publish_time == datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+    assert loaded[0].upload_list_id == backend.channels[channel_ids[0]]["contentDetails"]["relatedPlaylists"]["uploads"]